@@ -2,12 +2,116 @@ import json
 import re
 import os
 from dotenv import load_dotenv
+from llm_client import complete, stream_complete
+from metrics import span, traced, annotate_file
 
 # Load environment variables
 load_dotenv()
 
-def generate_script_json(client, topic_name, output_file="video-output.json", provider='openai', model='gpt-4o'):
-    """Generates the JSON file with script and animations using the LLM"""
+
+def parse_json_response(response_text):
+    """Parses an LLM response as JSON, unwrapping markdown code fences if present"""
+    # Try to extract JSON if wrapped in markdown
+    if "```json" in response_text:
+        response_text = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL).group(1)
+    elif "```" in response_text:
+        response_text = re.search(r'```\s*(.*?)\s*```', response_text, re.DOTALL).group(1)
+    
+    return json.loads(response_text)
+
+
+class SceneStreamParser:
+    """
+    Incremental parser for a streamed JSON array of scene objects
+    
+    feed() returns the scenes completed by each new piece of text, so a
+    scene can be used as soon as its closing brace arrives. The array
+    starts at the first '[' followed by a '{'; text before it (a ```json
+    fence, or prose that happens to contain brackets) is skipped.
+    """
+    
+    def __init__(self):
+        self.opening = False  # saw a '[' that may start the array
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.buffer = []
+    
+    def feed(self, text):
+        scenes = []
+        for char in text:
+            if self.finished:
+                break
+            if not self.started:
+                if self.opening and char.isspace():
+                    continue
+                if not (self.opening and char == '{'):
+                    self.opening = char == '['
+                    continue
+                self.started = True
+            if self.depth == 0:
+                # Between elements: only commas, whitespace or the closing bracket
+                if char == '{':
+                    self.depth = 1
+                    self.buffer = [char]
+                elif char == ']':
+                    self.finished = True
+                continue
+            
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    scenes.append(json.loads(''.join(self.buffer)))
+        return scenes
+
+
+def validate_scene(scene, index=None):
+    """
+    Checks that a parsed scene has the fields the rest of the pipeline reads
+
+    Raises:
+        ValueError: If the scene is not an object with text and animation strings
+    """
+    label = f"Scene {index}" if index else "Scene"
+    if not isinstance(scene, dict):
+        raise ValueError(f"{label} is not a JSON object")
+    for field in ('text', 'animation'):
+        if not isinstance(scene.get(field), str) or not scene[field].strip():
+            raise ValueError(f"{label} has no '{field}' string")
+
+
+def parse_script_stream(response_text):
+    """
+    Parses a complete streamed script the same way SceneStreamParser reads it
+
+    Raises:
+        ValueError: If the scene array is missing, unterminated or has invalid scenes
+    """
+    parser = SceneStreamParser()
+    scenes = parser.feed(response_text)
+    if not parser.finished:
+        raise ValueError("Script response has no complete JSON array of scenes")
+    for index, scene in enumerate(scenes, 1):
+        validate_scene(scene, index)
+    return scenes
+
+
+def build_script_prompt(topic_name):
+    """Returns the (system, prompt) pair used to generate a video script"""
     prompt = f"""Develop an educational script for this topic: {topic_name}
 
 INSTRUCTIONS:
@@ -47,50 +151,32 @@ Example of a scene:
 
 IMPORTANT: Respond ONLY with the JSON array, without any additional text before or after."""
 
+    system = "You are an expert in creating educational video scripts. You always respond in valid JSON format without additional text. IMPORTANT: Match the language of the topic exactly - if the topic is in Spanish, write in Spanish; if in English, write in English."
+    
+    return system, prompt
+
+
+@traced('script')
+def generate_script_json(client, topic_name, output_file="video-output.json", provider='openai', model='gpt-4o'):
+    """Generates the JSON file with script and animations using the LLM"""
+    system, prompt = build_script_prompt(topic_name)
+
     try:
         print(f"Generating script for: {topic_name}...")
         
-        if provider == 'openai':
-            # OpenAI API call
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are an expert in creating educational video scripts. You always respond in valid JSON format without additional text. IMPORTANT: Match the language of the topic exactly - if the topic is in Spanish, write in Spanish; if in English, write in English."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8,
-                max_completion_tokens=4000
-            )
-            response_text = response.choices[0].message.content.strip()
-            
-        elif provider == 'claude':
-            # Claude API call
-            response = client.messages.create(
-                model=model,
-                max_tokens=4000,
-                temperature=0.8,
-                system="You are an expert in creating educational video scripts. You always respond in valid JSON format without additional text. IMPORTANT: Match the language of the topic exactly - if the topic is in Spanish, write in Spanish; if in English, write in English.",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            response_text = response.content[0].text.strip()
-        
-        else:
-            raise ValueError(f"Unknown provider: {provider}")
+        response_text = complete(
+            client, provider, model, system, prompt,
+            temperature=0.8, max_tokens=4000,
+            validate=parse_script_stream
+        )
         
-        # Try to extract JSON if wrapped in markdown
-        if "```json" in response_text:
-            response_text = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL).group(1)
-        elif "```" in response_text:
-            response_text = re.search(r'```\s*(.*?)\s*```', response_text, re.DOTALL).group(1)
-        
-        # Parse JSON
-        script_data = json.loads(response_text)
+        # Parsed like a streamed script, since both share cached responses
+        script_data = parse_script_stream(response_text)
         
         # Save to file
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(script_data, f, ensure_ascii=False, indent=2)
+        annotate_file(output_file)
         
         print(f"[OK] Script generated successfully: {output_file}")
         print(f"Total scenes: {len(script_data)}")
@@ -100,3 +186,38 @@ IMPORTANT: Respond ONLY with the JSON array, without any additional text before
     except Exception as e:
         print(f"[ERROR] Error generating script: {e}")
         return None
+
+
+def stream_script_scenes(client, topic_name, output_file="video-output.json", provider='openai', model='gpt-4o'):
+    """
+    Generates the script with a streaming request, yielding each scene as soon as it is complete
+    
+    Each scene is validated before it is yielded, so a malformed scene
+    stops the stream right away instead of after the scenes before it were
+    rendered. The full script is saved to output_file once the response has
+    finished. Errors are raised (not swallowed) since scenes may already be
+    in use.
+    """
+    system, prompt = build_script_prompt(topic_name)
+    parser = SceneStreamParser()
+    script_data = []
+    
+    print(f"Streaming script for: {topic_name}...")
+    with span('script', streamed=True):
+        for chunk in stream_complete(
+            client, provider, model, system, prompt,
+            temperature=0.8, max_tokens=4000,
+            validate=parse_script_stream
+        ):
+            for scene in parser.feed(chunk):
+                validate_scene(scene, len(script_data) + 1)
+                script_data.append(scene)
+                print(f"[OK] Scene {len(script_data)} received")
+                yield scene
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(script_data, f, ensure_ascii=False, indent=2)
+        annotate_file(output_file)
+    
+    print(f"[OK] Script generated successfully: {output_file}")
+    print(f"Total scenes: {len(script_data)}")
@@ -0,0 +1,500 @@
+import os
+
+# The benchmark measures the pipeline itself: every run must do the real work
+for _cache_setting in ('LLM_CACHE_ENABLED', 'TTS_CACHE_ENABLED', 'RENDER_CACHE_ENABLED'):
+    os.environ[_cache_setting] = 'false'
+
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from types import SimpleNamespace
+
+import llm_client
+from concat_video import RENDER_PROFILES
+from job_queue import JobQueue
+from job_store import FINISHED_STATUSES
+from resource_scheduler import process_tree_rss, MB
+
+
+BENCHMARK_TOPIC = 'Circles and squares'
+# Speaking rate used to size the synthetic narration (words per second)
+WORDS_PER_SECOND = 2.5
+# Stages reported first, in the order a job reaches them (the job span covers a whole pass)
+STAGES = ('job', 'script', 'tts', 'code', 'code_batch', 'render', 'finalize')
+# Characters per chunk of a streamed fake LLM answer
+STREAM_CHUNK_CHARS = 64
+# Run-level and per-stage metrics compared against the baseline
+COMPARED_METRICS = ('wall', 'cpu', 'peak_rss', 'bytes_written')
+# Differences below these floors are noise, never regressions
+METRIC_FLOORS = {'wall': 0.05, 'cpu': 0.05, 'peak_rss': 16 * MB, 'bytes_written': 64 * 1024}
+
+
+def load_fixtures(fixtures_dir):
+    """
+    Loads the recorded script and the scene sources the fake LLM replays
+
+    Returns:
+        Dict with 'script' (list of scenes) and 'code' (one
+        {'content', 'class_name'} per scene, in scene order)
+    """
+    with open(os.path.join(fixtures_dir, 'script.json'), 'r', encoding='utf-8') as f:
+        script = json.load(f)
+
+    code = []
+    for index in range(1, len(script) + 1):
+        path = os.path.join(fixtures_dir, 'scenes', f'scene_{index}.py')
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        match = re.search(r'^class (\w+)\(', source, re.MULTILINE)
+        if not match:
+            raise ValueError(f"No scene class found in {path}")
+        code.append({'content': source, 'class_name': match.group(1)})
+
+    return {'script': script, 'code': code}
+
+
+class FakeSpeech:
+    def __init__(self, text, latency):
+        self.text = text
+        self.latency = latency
+
+    def stream_to_file(self, path):
+        """Writes a sine tone as long as the narration would take to read"""
+        if self.latency:
+            time.sleep(self.latency)
+        duration = max(1.0, len(self.text.split()) / WORDS_PER_SECOND)
+        cmd = [
+            "ffmpeg", "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration:.2f}",
+            "-q:a", "9", path, "-y"
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not synthesize narration: {result.stderr.strip()[-500:]}")
+
+
+class FakeOpenAIClient:
+    """
+    OpenAI-shaped client that answers from the fixtures instead of the API
+
+    Script prompts get the recorded script; code prompts (single scene or
+    batch) are matched to their scenes by the narration text they quote.
+    Streaming requests get the same answer in STREAM_CHUNK_CHARS chunks
+    spread over the latency. Speech requests synthesize a deterministic
+    tone locally. Answers are the same on every call, so runs are comparable.
+    """
+
+    def __init__(self, fixtures, llm_latency=0.0, tts_latency=0.0):
+        self.fixtures = fixtures
+        self.llm_latency = llm_latency
+        self.tts_latency = tts_latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.audio = SimpleNamespace(speech=SimpleNamespace(create=self._create_speech))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        content = json.dumps(self._answer(messages[-1]['content']), ensure_ascii=False)
+        if stream:
+            return self._stream(content)
+        if self.llm_latency:
+            time.sleep(self.llm_latency)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    def _stream(self, content):
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        for piece in pieces:
+            if self.llm_latency:
+                time.sleep(self.llm_latency / len(pieces))
+            delta = SimpleNamespace(content=piece)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+    def _answer(self, prompt):
+        if prompt.startswith('Develop an educational script'):
+            return self.fixtures['script']
+        scenes = [
+            {'index': index, **code}
+            for index, (scene, code) in enumerate(zip(self.fixtures['script'], self.fixtures['code']), 1)
+            if f"- Narrative text: {scene['text']}\n" in prompt
+        ]
+        if not scenes:
+            raise ValueError("Code prompt does not match any fixture scene")
+        if 'consecutive scenes' in prompt:
+            return {'scenes': scenes}
+        return {'content': scenes[0]['content'], 'class_name': scenes[0]['class_name']}
+
+    def _create_speech(self, model, voice, input):
+        return FakeSpeech(input, self.tts_latency)
+
+
+class RssSampler:
+    """
+    Samples the resident memory of this process and all of its children
+
+    Renders and encodes run in child processes, so the whole process tree
+    is measured.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = process_tree_rss(os.getpid())
+        with self._lock:
+            self.peak = max(self.peak, rss)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.sample()
+
+
+def cpu_seconds():
+    """CPU time of this process and its finished children (user + system)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def load_pipeline(fixtures, args):
+    """
+    Imports the job pipeline with its state kept under the output directory
+
+    video_generator and the modules it uses read their configuration at
+    import time, so the job store, workspaces, ETA stats and render workers
+    are configured first. The fake client is then registered as the shared
+    OpenAI client, which the pipeline uses for the script, the scene code
+    and the narration.
+
+    Returns:
+        The video_generator module
+    """
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.environ.update({
+        'JOB_QUEUE_MODE': 'local',
+        'JOB_STORE_BACKEND': 'sqlite',
+        'JOB_STORE_PATH': os.path.join(args.output_dir, 'jobs.db'),
+        'WORKSPACE_ROOT': os.path.join(args.output_dir, 'jobs'),
+        'PROGRESS_STATS_FILE': os.path.join(args.output_dir, 'progress_stats.json'),
+        'KEEP_WORKSPACES': 'true' if args.keep else 'false',
+        'RENDER_WORKERS': str(args.render_workers),
+        # Requests only ever reach the fake client; an empty key keeps .env from picking Claude
+        'OPENAI_API_KEY': 'benchmark',
+        'CLAUDE_API_KEY': ''
+    })
+    import video_generator
+
+    with llm_client._clients_lock:
+        llm_client._clients['openai'] = FakeOpenAIClient(
+            fixtures, llm_latency=args.llm_latency, tts_latency=args.tts_latency
+        )
+    return video_generator
+
+
+def stage_metrics(spans):
+    """
+    Sums a job's spans per stage
+
+    Stages overlap (code generation runs while scenes render and the script
+    streams), so stage wall times add up to more than the job's. CPU and
+    peak RSS come from the child processes a stage ran (None when it ran
+    none); bytes are the files it wrote.
+    """
+    stages = {}
+    for record in spans:
+        metrics = stages.setdefault(record['stage'], {
+            'wall': 0.0, 'cpu': None, 'peak_rss': None, 'bytes_written': 0, 'calls': 0, 'errors': 0
+        })
+        metrics['wall'] += record.get('duration') or 0
+        metrics['bytes_written'] += record.get('bytes') or 0
+        metrics['calls'] += 1
+        metrics['errors'] += record.get('status') == 'error'
+        if record.get('cpu_seconds') is not None:
+            metrics['cpu'] = (metrics['cpu'] or 0) + record['cpu_seconds']
+        if record.get('peak_rss'):
+            metrics['peak_rss'] = max(metrics['peak_rss'] or 0, record['peak_rss'])
+    return stages
+
+
+def wait_for_jobs(pipeline, job_queue, job_ids, interval):
+    """
+    Blocks until every job is finished and its last pass has returned
+
+    Returns:
+        List of the final job records
+    """
+    while True:
+        jobs = [pipeline.job_store.get(job_id) for job_id in job_ids]
+        if all(
+            job.get('status') in FINISHED_STATUSES
+            and not job_queue.is_running(job['job_id'])
+            and job_queue.position(job['job_id']) is None
+            for job in jobs
+        ):
+            return jobs
+        time.sleep(interval)
+
+
+def remove_published(job):
+    """Deletes the videos a benchmark job published to the media directory"""
+    for field in ('video_url', 'preview_url'):
+        url = job.get(field)
+        if url and url.startswith('/media/'):
+            try:
+                os.remove(os.path.join('media', os.path.basename(url)))
+            except OSError:
+                pass
+
+
+def average(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+def run_benchmark(concurrency, pipeline, args):
+    """
+    Submits `concurrency` fixture jobs to a job queue with as many workers and summarizes them
+
+    Jobs go through the real entry points (start_video_generation and the
+    queue's run_job), so script streaming, concurrent TTS and code
+    generation, the shared render pool, the repair loop and the final pass
+    of two-tier profiles are all part of the numbers.
+
+    Returns:
+        Dict with run-level metrics (wall, cpu, peak_rss, bytes_written,
+        jobs_per_minute) and per-stage metrics averaged over the jobs
+    """
+    print(f"\n{'='*80}")
+    print(f"BENCHMARK: {concurrency} concurrent job(s), profile {args.profile}")
+    print(f"{'='*80}")
+
+    # A queue per run, sized like MAX_CONCURRENT_JOBS; final passes are queued on it too
+    job_queue = JobQueue(
+        worker_fn=pipeline.run_job,
+        num_workers=concurrency,
+        max_size=0,
+        on_change=pipeline.notify_queue_change
+    )
+    job_queue.start()
+    with pipeline._job_queue_lock:
+        pipeline._job_queue = job_queue
+
+    sampler = RssSampler(interval=args.sample_interval).start()
+    cpu_before = cpu_seconds()
+    started_at = time.perf_counter()
+
+    job_ids = [
+        pipeline.start_video_generation(
+            BENCHMARK_TOPIC, enable_tts=True, llm_provider='openai', render_profile=args.profile
+        )[0]
+        for _ in range(concurrency)
+    ]
+    jobs = wait_for_jobs(pipeline, job_queue, job_ids, args.sample_interval)
+
+    wall = time.perf_counter() - started_at
+    cpu = cpu_seconds() - cpu_before
+    sampler.stop()
+
+    errors = [
+        f"{job['job_id']}: {job.get('error') or job.get('status')}"
+        for job in jobs if job.get('status') != 'completed'
+    ]
+    for error in errors:
+        print(f"[ERROR] Benchmark job {error}")
+
+    job_stages = [stage_metrics(job.get('spans') or []) for job in jobs]
+    names = list(STAGES) + sorted({name for stages in job_stages for name in stages} - set(STAGES))
+    stages = {}
+    for stage in names:
+        measured = [stages_of_job[stage] for stages_of_job in job_stages if stage in stages_of_job]
+        if not measured:
+            continue
+        stages[stage] = {
+            'wall': average(m['wall'] for m in measured),
+            'wall_max': max(m['wall'] for m in measured),
+            'cpu': average(m['cpu'] for m in measured),
+            'peak_rss': max((m['peak_rss'] for m in measured if m['peak_rss']), default=None),
+            'bytes_written': average(m['bytes_written'] for m in measured),
+            'calls': average(m['calls'] for m in measured),
+            'errors': sum(m['errors'] for m in measured)
+        }
+
+    if not args.keep:
+        for job in jobs:
+            remove_published(job)
+
+    return {
+        'concurrency': concurrency,
+        'failed': len(errors),
+        'errors': errors,
+        'wall': wall,
+        'cpu': cpu,
+        'peak_rss': sampler.peak,
+        'bytes_written': sum(m['bytes_written'] for stages_of_job in job_stages
+                             for name, m in stages_of_job.items() if name != 'job'),
+        'jobs_per_minute': (concurrency - len(errors)) / wall * 60 if wall else 0,
+        'stages': stages
+    }
+
+
+def format_metric(metric, value):
+    if value is None:
+        return '-'
+    if metric in ('peak_rss', 'bytes_written'):
+        return f"{value / MB:.1f} MB"
+    return f"{value:.2f}s"
+
+
+def print_report(result):
+    print(f"\n{result['concurrency']} job(s): {result['wall']:.2f}s wall, {result['cpu']:.2f}s CPU, "
+          f"peak RSS {result['peak_rss'] / MB:.0f} MB, {result['bytes_written'] / MB:.1f} MB written, "
+          f"{result['jobs_per_minute']:.2f} jobs/min, {result['failed']} failed")
+    print(f"  {'stage':<14}{'calls':>8}{'wall (mean)':>14}{'wall (max)':>14}{'cpu':>12}{'peak rss':>14}{'written':>14}")
+    for stage, metrics in result['stages'].items():
+        print(f"  {stage:<14}{metrics['calls']:>8.1f}{format_metric('wall', metrics['wall']):>14}"
+              f"{format_metric('wall', metrics['wall_max']):>14}"
+              f"{format_metric('cpu', metrics['cpu']):>12}"
+              f"{format_metric('peak_rss', metrics['peak_rss']):>14}"
+              f"{format_metric('bytes_written', metrics['bytes_written']):>14}")
+
+
+def compare_metrics(label, current, baseline, threshold):
+    """Returns a regression message per metric more than threshold above the baseline"""
+    regressions = []
+    for metric in COMPARED_METRICS:
+        now, before = current.get(metric), baseline.get(metric)
+        if now is None or before is None or now - before < METRIC_FLOORS[metric]:
+            continue
+        if before and (now - before) / before > threshold:
+            regressions.append(
+                f"{label} {metric}: {format_metric(metric, before)} -> {format_metric(metric, now)} "
+                f"(+{(now - before) / before:.0%})"
+            )
+    return regressions
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    Compares runs with the runs of the same concurrency in the baseline
+
+    Returns:
+        List of regression messages (empty when nothing regressed)
+    """
+    regressions = []
+    for result in results:
+        base = baseline.get('runs', {}).get(str(result['concurrency']))
+        if not base:
+            print(f"[WARNING] No baseline for {result['concurrency']} job(s)")
+            continue
+        label = f"{result['concurrency']} job(s)"
+        regressions += compare_metrics(label, result, base, threshold)
+        for stage, metrics in result['stages'].items():
+            if stage in base.get('stages', {}):
+                regressions += compare_metrics(f"{label} {stage}", metrics, base['stages'][stage], threshold)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Runs fixture jobs through the job queue and pipeline with a fake OpenAI client'
+    )
+    parser.add_argument('--jobs', default='1,4,16',
+                        help='Comma-separated numbers of concurrent jobs to run (default: 1,4,16)')
+    parser.add_argument('--profile', default='preview', choices=sorted(RENDER_PROFILES),
+                        help='Render profile for the scenes (default: preview)')
+    parser.add_argument('--fixtures', default='benchmark_fixtures',
+                        help='Directory with script.json and scenes/scene_<n>.py')
+    parser.add_argument('--output-dir', default='media/benchmark',
+                        help='Where the job store and job workspaces are kept (default: media/benchmark)')
+    parser.add_argument('--baseline', default='media/benchmark/baseline.json',
+                        help='Baseline file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store this run as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown that counts as a regression (default: 0.10)')
+    parser.add_argument('--llm-latency', type=float, default=0.0,
+                        help='Simulated seconds per LLM request (default: 0)')
+    parser.add_argument('--tts-latency', type=float, default=0.0,
+                        help='Simulated seconds per TTS request (default: 0)')
+    parser.add_argument('--render-workers', type=int,
+                        default=int(os.getenv('RENDER_WORKERS', str(os.cpu_count() or 1))),
+                        help='Scenes rendered at once across all jobs (default: RENDER_WORKERS)')
+    parser.add_argument('--sample-interval', type=float, default=0.1,
+                        help='Seconds between RSS samples (default: 0.1)')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the job workspaces and published videos after each run')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    concurrency_levels = [int(value) for value in args.jobs.split(',') if value.strip()]
+    fixtures = load_fixtures(args.fixtures)
+    pipeline = load_pipeline(fixtures, args)
+
+    results = [run_benchmark(concurrency, pipeline, args) for concurrency in concurrency_levels]
+
+    print(f"\n{'='*80}")
+    print("BENCHMARK RESULTS")
+    print(f"{'='*80}")
+    for result in results:
+        print_report(result)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'profile': args.profile,
+        'scenes': len(fixtures['script']),
+        'runs': {str(result['concurrency']): result for result in results}
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if any(result['failed'] for result in results):
+        print("\n[ERROR] Some benchmark jobs failed")
+        return 1
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[OK] Baseline saved: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n[WARNING] No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('profile') != args.profile:
+        print(f"[WARNING] Baseline was recorded with profile {baseline.get('profile')}, not {args.profile}")
+
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n[ERROR] {len(regressions)} regression(s) above {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print(f"\n[OK] No regressions above {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
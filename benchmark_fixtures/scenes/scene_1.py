@@ -0,0 +1,15 @@
+from manim import *
+
+
+class CircleDefinition(Scene):
+    def construct(self):
+        center = Dot(ORIGIN, color=YELLOW)
+        circle = Circle(radius=2, color=BLUE)
+        radius = Line(ORIGIN, RIGHT * 2, color=WHITE)
+        label = Text('r', font_size=36).next_to(radius, UP, buff=0.1)
+
+        self.play(FadeIn(center), run_time=0.5)
+        self.play(Create(circle), run_time=1.5)
+        self.play(Create(radius), Write(label), run_time=1)
+        self.wait(1)
+        self.play(FadeOut(center, circle, radius, label), run_time=0.5)
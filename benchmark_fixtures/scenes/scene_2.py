@@ -0,0 +1,18 @@
+from manim import *
+
+
+class CirclePerimeter(Scene):
+    def construct(self):
+        circle = Circle(radius=1, color=BLUE).shift(LEFT * 3)
+        perimeter = Line(LEFT * 1.5, RIGHT * (2 * PI - 1.5), color=BLUE).shift(DOWN)
+        segments = VGroup(*[
+            Line(ORIGIN, RIGHT, color=YELLOW).shift(LEFT * 1.5 + RIGHT * i + DOWN * 1.5)
+            for i in range(6)
+        ])
+        label = Text('2 x pi x r', font_size=36).to_edge(UP)
+
+        self.play(Create(circle), run_time=1)
+        self.play(Transform(circle, perimeter), run_time=1.5)
+        self.play(Create(segments), Write(label), run_time=1.5)
+        self.wait(0.5)
+        self.play(FadeOut(circle, segments, label), run_time=0.5)
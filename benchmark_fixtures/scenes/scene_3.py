@@ -0,0 +1,17 @@
+from manim import *
+
+
+class SquareProperties(Scene):
+    def construct(self):
+        square = Square(side_length=3, color=GREEN)
+        corners = VGroup(*[
+            Square(side_length=0.3, color=WHITE).move_to(vertex - 0.15 * np.sign(vertex))
+            for vertex in square.get_vertices()
+        ])
+        label = Text('4 equal sides', font_size=32).next_to(square, DOWN)
+
+        self.play(Create(square), run_time=1.5)
+        self.play(Create(corners), run_time=1)
+        self.play(Write(label), run_time=1)
+        self.wait(0.5)
+        self.play(FadeOut(square, corners, label), run_time=0.5)
@@ -0,0 +1,13 @@
+from manim import *
+
+
+class BuildingBlocks(Scene):
+    def construct(self):
+        circles = VGroup(*[Circle(radius=0.5, color=BLUE) for _ in range(3)])
+        squares = VGroup(*[Square(side_length=1, color=GREEN) for _ in range(3)])
+        row = VGroup(*circles, *squares).arrange(RIGHT, buff=0.4)
+
+        self.play(LaggedStart(*[Create(shape) for shape in row], lag_ratio=0.2), run_time=2)
+        self.play(row.animate.scale(0.5), run_time=1)
+        self.wait(0.5)
+        self.play(FadeOut(row), run_time=0.5)
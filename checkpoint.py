@@ -0,0 +1,94 @@
+import os
+import json
+import threading
+
+
+class JobManifest:
+    """
+    Checkpoint manifest stored in a job's workspace
+
+    Records the artifacts each stage produced (script JSON, per-scene audio,
+    per-scene code, per-scene render, final video) so a resumed job can skip
+    every stage whose output is still on disk.
+    """
+
+    FILE_NAME = 'manifest.json'
+
+    def __init__(self, workspace):
+        self.path = os.path.join(workspace['root'], self.FILE_NAME)
+        self._lock = threading.Lock()
+        self.data = {'stages': {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Ignoring unreadable manifest {self.path}: {e}")
+        self.data.setdefault('stages', {})
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, stage, index=None):
+        """
+        Returns a stage checkpoint, or None if missing or its files are gone
+
+        Per-scene stages (audio, code, render) are looked up by scene index.
+        """
+        with self._lock:
+            entry = self.data['stages'].get(stage)
+            if index is not None:
+                entry = (entry or {}).get(str(index))
+        if entry is None:
+            return None
+        path = entry.get('path') if isinstance(entry, dict) else None
+        if path and not os.path.exists(path):
+            return None
+        return entry
+
+    def set(self, stage, entry, index=None):
+        """Records a completed stage (or scene of a stage) and saves the manifest"""
+        with self._lock:
+            if index is None:
+                self.data['stages'][stage] = entry
+            else:
+                self.data['stages'].setdefault(stage, {})[str(index)] = entry
+            self._save()
+
+    def clear(self, *stages):
+        """Forgets the checkpoints of the given stages"""
+        with self._lock:
+            for stage in stages:
+                self.data['stages'].pop(stage, None)
+            self._save()
+
+    def clear_families(self, *families):
+        """
+        Forgets the checkpoints of stage families
+
+        A family is a stage and its per-profile variants: 'render' covers
+        render, render_medium, render_high and so on.
+        """
+        with self._lock:
+            for stage in list(self.data['stages']):
+                if any(stage == family or stage.startswith(f"{family}_") for family in families):
+                    del self.data['stages'][stage]
+            self._save()
+
+    def scene_entries(self, stage):
+        """Returns {index: entry} for a per-scene stage, skipping entries whose file is gone"""
+        with self._lock:
+            indices = list(self.data['stages'].get(stage, {}))
+        entries = {}
+        for index in indices:
+            entry = self.get(stage, index)
+            if entry is not None:
+                entries[int(index)] = entry
+        return entries
+
+    def completed_stages(self):
+        with self._lock:
+            return sorted(self.data['stages'])
@@ -1,6 +1,33 @@
 import subprocess
 import os
 import re
+import glob
+import time
+from render_cache import lookup_render, store_render
+from metrics import traced, annotate, annotate_file
+from resource_scheduler import (
+    run_limited, scheduler, ResourceLimitExceeded, MB,
+    RENDER_MEMORY_LIMIT_MB, FFMPEG_MEMORY_LIMIT_MB, FFMPEG_CPUS, FFMPEG_TIMEOUT
+)
+
+# Rendering backend: "subprocess" runs the manim CLI per scene, "pool" hands
+# scenes to long-lived pre-warmed worker processes (see render_worker.py)
+RENDER_BACKEND = os.getenv('RENDER_BACKEND', 'subprocess').lower()
+RENDER_TIMEOUT = int(os.getenv('RENDER_TIMEOUT', '300'))
+
+# Render profiles selectable per job, mapped to Manim quality flags
+RENDER_PROFILES = {
+    'preview': ['-ql'],  # 480p15
+    'medium': ['-qm'],   # 720p30
+    'high': ['-qh'],     # 1080p60
+    '4k': ['-qk']        # 2160p60
+}
+DEFAULT_RENDER_PROFILE = os.getenv('DEFAULT_RENDER_PROFILE', 'preview').lower()
+
+# Per-scene audio/video alignment at finalisation: "pad", "audio" or "off"
+ALIGN_MODE = os.getenv('ALIGN_MODE', 'pad').lower()
+# Scenes whose video and audio differ by less than this (seconds) are left as-is
+ALIGN_TOLERANCE = float(os.getenv('ALIGN_TOLERANCE', '0.1'))
 
 def sanitize_filename(filename):
     """Remove or replace problematic characters from filenames"""
@@ -13,55 +40,138 @@ def sanitize_filename(filename):
     sanitized = sanitized.strip("_")
     return sanitized
 
-def compile_video(file_path, class_name, topic_slug, index):
-    """Compiles the video using Manim"""
+def parse_render_profile(profile):
+    """Validates a render profile name (None = DEFAULT_RENDER_PROFILE)"""
+    profile = (profile or DEFAULT_RENDER_PROFILE).lower()
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {profile} (expected one of {', '.join(RENDER_PROFILES)})")
+    return profile
+
+def find_rendered_video(media_dir, file_path, class_name, newer_than=0):
+    """
+    Locates the movie Manim wrote for a scene
+    
+    Manim names the quality directory after the resolution and frame rate
+    (480p15, 1080p60, ...), which depends on its config, so the output is
+    looked up under {media_dir}/videos/{module}/*/ instead of being assumed.
+    
+    Returns:
+        Path of the newest matching movie written after newer_than, or None
+    """
+    module_name = os.path.splitext(os.path.basename(file_path))[0]
+    pattern = os.path.join(glob.escape(media_dir), "videos", glob.escape(module_name), "*", f"{glob.escape(class_name)}.mp4")
+    candidates = [path for path in glob.glob(pattern) if os.path.getmtime(path) >= newer_than]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+def _error_tail(text, limit=4000):
+    """Keeps the end of a (possibly huge) Manim log, where the traceback is"""
+    text = (text or '').strip()
+    return text if len(text) <= limit else text[-limit:]
+
+@traced('render', succeeded=lambda result: result[0] is not None)
+def render_scene(file_path, class_name, topic_slug, index, media_dir="media", profile='preview'):
+    """
+    Compiles the video using Manim at the given render profile, writing renders under media_dir
+    
+    Returns:
+        Tuple of (video_path, error); video_path is None on failure and
+        error holds Manim's traceback so the scene can be repaired
+    """
+    annotate(scene=index, profile=profile)
     try:
-        cmd = ["manim", "-ql", file_path, class_name]
+        quality_flags = RENDER_PROFILES[parse_render_profile(profile)]
+        
+        # Byte-identical sources at the same quality are never rendered twice
+        with open(file_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        filename_without_ext = os.path.splitext(os.path.basename(file_path))[0]
+        cached_path = os.path.join(media_dir, "cached", filename_without_ext, profile, f"{class_name}.mp4")
+        if lookup_render(source, class_name, quality_flags, cached_path):
+            print(f"[OK] Reusing cached render for {class_name}")
+            annotate(cache_hit=True)
+            return cached_path, None
+        
+        if RENDER_BACKEND == 'pool':
+            from render_worker import get_render_worker_pool
+            
+            print(f"\nCompiling in worker pool: {file_path} {class_name}")
+            with scheduler.reserve(cpus=1, memory_bytes=int(RENDER_MEMORY_LIMIT_MB * MB)):
+                rendered_path, error = get_render_worker_pool().render(
+                    file_path, class_name, media_dir, quality_flags, timeout=RENDER_TIMEOUT,
+                    memory_limit=int(RENDER_MEMORY_LIMIT_MB * MB)
+                )
+            if rendered_path and os.path.exists(rendered_path):
+                print(f"[OK] Video compiled successfully")
+                annotate_file(rendered_path)
+                store_render(source, class_name, quality_flags, rendered_path)
+                return rendered_path, None
+            print(f"[ERROR] Error compiling video:")
+            print(error)
+            return None, _error_tail(error)
+        
+        cmd = ["manim", *quality_flags, "--media_dir", media_dir, file_path, class_name]
         print(f"\nCompiling: {' '.join(cmd)}")
         
-        result = subprocess.run(
+        # Waits for a CPU slot and memory, then runs under the RSS/time watchdog
+        started_at = time.time()
+        result = run_limited(
             cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minutes timeout
+            timeout=RENDER_TIMEOUT,
+            memory_limit_mb=RENDER_MEMORY_LIMIT_MB
         )
         
-        if result.returncode == 0:
+        video_path = find_rendered_video(media_dir, file_path, class_name, newer_than=started_at - 1)
+        if result.returncode == 0 and video_path:
             print(f"[OK] Video compiled successfully")
-            # Manim creates directory based on the Python filename (without extension)
-            # Extract filename without extension from file_path
-            filename_without_ext = os.path.splitext(os.path.basename(file_path))[0]
-            # Video will be in media/videos/{filename_without_extension}/480p15/{class_name}.mp4
-            video_path = f"media/videos/{filename_without_ext}/480p15/{class_name}.mp4"
-            return video_path
+            annotate_file(video_path)
+            store_render(source, class_name, quality_flags, video_path)
+            return video_path, None
+        elif result.returncode == 0:
+            print(f"[ERROR] Manim finished but no video was written for {class_name}")
+            return None, f"Manim exited successfully but wrote no movie for {class_name}"
         else:
             print(f"[ERROR] Error compiling video:")
             print(result.stderr)
-            return None
+            # Manim logs some errors to stdout (rich console) instead of stderr
+            return None, _error_tail(result.stderr or result.stdout)
             
     except subprocess.TimeoutExpired:
         print(f"[ERROR] Timeout compiling video")
-        return None
+        return None, f"Render exceeded the {RENDER_TIMEOUT}s time limit; simplify the animation or shorten run times"
+    except ResourceLimitExceeded as e:
+        print(f"[ERROR] {e}")
+        return None, f"{e}; simplify the scene (fewer objects, less LaTeX)"
     except Exception as e:
         print(f"[ERROR] Error: {e}")
-        return None
+        return None, str(e)
 
+def compile_video(file_path, class_name, topic_slug, index, media_dir="media", profile='preview'):
+    """Compiles the video using Manim and returns its path (None on failure)"""
+    video_path, _ = render_scene(file_path, class_name, topic_slug, index, media_dir=media_dir, profile=profile)
+    return video_path
 
-def concatenate_videos(video_paths, output_path):
-    """Joins all videos into one using ffmpeg"""
+
+@traced('concat_video')
+def concatenate_videos(video_paths, output_path, list_file=None):
+    """Joins all videos into one using ffmpeg (list_file defaults to next to output_path)"""
     if not video_paths:
         print("[ERROR] No videos to concatenate")
         return False
     
-    # Create media folder if it doesn't exist
-    os.makedirs("media", exist_ok=True)
+    # Create output folder if it doesn't exist
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
     
     # Create list file for ffmpeg
-    list_file = "media/video_list.txt"
+    if list_file is None:
+        list_file = os.path.join(output_dir, "video_list.txt")
     with open(list_file, 'w') as f:
         for video_path in video_paths:
             if os.path.exists(video_path):
-                f.write(f"file '../{video_path}'\n")
+                # Use absolute path so the list works from any directory
+                f.write(f"file '{os.path.abspath(video_path)}'\n")
     
     try:
         cmd = [
@@ -73,10 +183,11 @@ def concatenate_videos(video_paths, output_path):
         ]
         
         print(f"\n  Concatenating videos...")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = run_limited(cmd, timeout=FFMPEG_TIMEOUT, memory_limit_mb=FFMPEG_MEMORY_LIMIT_MB)
         
         if result.returncode == 0:
             print(f"[OK] Final video created: {output_path}")
+            annotate_file(output_path)
             # Clean up temporary file
             os.remove(list_file)
             return True
@@ -90,6 +201,7 @@ def concatenate_videos(video_paths, output_path):
         return False
 
 
+@traced('merge')
 def merge_video_and_audio(video_path, audio_path, output_path):
     """
     Merges video and audio files into a single MP4 file using ffmpeg
@@ -130,10 +242,11 @@ def merge_video_and_audio(video_path, audio_path, output_path):
         print(f"Audio: {audio_path}")
         print(f"Output: {output_path}\n")
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = run_limited(cmd, timeout=FFMPEG_TIMEOUT, memory_limit_mb=FFMPEG_MEMORY_LIMIT_MB)
         
         if result.returncode == 0:
             print(f"[OK] Final video with audio created: {output_path}\n")
+            annotate_file(output_path)
             return True
         else:
             print(f"[ERROR] Error merging video and audio:")
@@ -143,3 +256,255 @@ def merge_video_and_audio(video_path, audio_path, output_path):
     except Exception as e:
         print(f"[ERROR] Error: {e}")
         return False
+
+
+def write_concat_list(paths, list_file):
+    """Writes an ffmpeg concat demuxer list with absolute paths"""
+    with open(list_file, 'w') as f:
+        for path in paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    return list_file
+
+
+def get_media_duration(path):
+    """Returns a media file's duration in seconds using ffprobe, or None"""
+    try:
+        cmd = [
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            return float(result.stdout.strip())
+        print(f"  [WARNING] Could not get duration for {path}")
+        return None
+    except Exception as e:
+        print(f"  [WARNING] Error getting duration of {path}: {e}")
+        return None
+
+
+def plan_scene_alignment(video_durations, audio_durations, mode=None):
+    """
+    Decides how long each scene lasts in the final video
+    
+    Args:
+        video_durations: Rendered duration of each scene
+        audio_durations: Narration duration of each scene (None for no audio)
+        mode: "pad" extends the shorter stream of each scene (freeze the last
+              frame or add silence); "audio" conforms each scene to its
+              narration (freeze or trim the video)
+    
+    Returns:
+        List of target durations, one per scene
+    """
+    mode = mode or ALIGN_MODE
+    targets = []
+    for video_duration, audio_duration in zip(video_durations, audio_durations):
+        if audio_duration is None:
+            targets.append(video_duration)
+        elif mode == 'audio':
+            targets.append(audio_duration)
+        else:
+            targets.append(max(video_duration, audio_duration))
+    return targets
+
+
+def build_alignment_filter(video_durations, targets, has_audio):
+    """
+    Builds the filter_complex graph that aligns every scene to its target
+    
+    Input i is scene i's video; input N+i is scene i's audio (a real
+    fragment or generated silence). Each video is frozen on its last frame
+    (tpad) or trimmed to the target, each audio is padded with silence and
+    cut to the same target, and the pairs are joined with the concat filter,
+    so scene N's narration always starts with scene N's video.
+    """
+    count = len(video_durations)
+    parts = []
+    for i, (video_duration, target) in enumerate(zip(video_durations, targets)):
+        video_filters = []
+        if target > video_duration:
+            video_filters.append(f"tpad=stop_mode=clone:stop_duration={target - video_duration:.3f}")
+        video_filters.append(f"trim=duration={target:.3f}")
+        video_filters.append("setpts=PTS-STARTPTS")
+        parts.append(f"[{i}:v]{','.join(video_filters)}[v{i}]")
+        
+        if has_audio:
+            parts.append(
+                f"[{count + i}:a]aformat=sample_rates=44100:channel_layouts=stereo,"
+                f"apad,atrim=duration={target:.3f},asetpts=PTS-STARTPTS[a{i}]"
+            )
+    
+    if has_audio:
+        streams = ''.join(f"[v{i}][a{i}]" for i in range(count))
+        parts.append(f"{streams}concat=n={count}:v=1:a=1[v][a]")
+    else:
+        streams = ''.join(f"[v{i}]" for i in range(count))
+        parts.append(f"{streams}concat=n={count}:v=1:a=0[v]")
+    return ';'.join(parts)
+
+
+def streams_aligned(video_durations, audio_durations, tolerance=None):
+    """
+    Checks whether plain concatenation keeps every narration on its scene
+    
+    Small per-scene mismatches of the same sign add up, so the running
+    video and audio offsets are compared at every scene boundary rather
+    than each scene's own delta.
+    
+    Args:
+        video_durations: Rendered duration of each scene
+        audio_durations: Narration duration of each scene (None for no audio)
+        tolerance: Largest allowed drift in seconds (defaults to ALIGN_TOLERANCE)
+    
+    Returns:
+        True if no boundary drifts more than the tolerance
+    """
+    tolerance = ALIGN_TOLERANCE if tolerance is None else tolerance
+    video_offset = audio_offset = 0.0
+    for video_duration, audio_duration in zip(video_durations, audio_durations):
+        if audio_duration is None:
+            # A silent scene needs generated silence, which only the filter graph adds
+            return False
+        video_offset += video_duration
+        audio_offset += audio_duration
+        if abs(video_offset - audio_offset) > tolerance:
+            return False
+    return True
+
+
+@traced('finalize')
+def finalize_video(video_paths, audio_paths, output_path, list_dir=None, audio_durations=None):
+    """
+    Produces the final MP4 from scene videos and audio fragments in one ffmpeg pass
+    
+    Every scene's real duration is measured and compared with its
+    narration. When the running video and audio offsets stay within
+    ALIGN_TOLERANCE at every scene boundary, both inputs are read through
+    the concat demuxer and the video stream is copied. Otherwise each scene is padded or trimmed inside a single
+    filter graph so the narration cannot drift across scenes.
+    
+    Args:
+        video_paths: Scene MP4s in playback order
+        audio_paths: Audio fragment for each scene, in the same order as
+            video_paths (None for scenes without narration); empty for a
+            silent video
+        output_path: Path for the final video
+        list_dir: Directory for the concat lists (defaults to next to output_path)
+        audio_durations: Known narration durations in the same order (measured if missing)
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    audio_paths = list(audio_paths or [])
+    audio_durations = list(audio_durations or [])
+    scenes = []
+    for i, video_path in enumerate(video_paths):
+        if not os.path.exists(video_path):
+            continue
+        audio_path = audio_paths[i] if i < len(audio_paths) else None
+        if audio_path and not os.path.exists(audio_path):
+            audio_path = None
+        audio_duration = audio_durations[i] if i < len(audio_durations) else None
+        scenes.append((video_path, audio_path, audio_duration))
+    
+    if not scenes:
+        print("[ERROR] No videos to finalize")
+        return False
+    
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    list_dir = list_dir or output_dir
+    
+    video_paths = [video_path for video_path, _, _ in scenes]
+    has_audio = any(audio_path for _, audio_path, _ in scenes)
+    
+    # Measure what was actually rendered and recorded
+    video_durations = None
+    targets = None
+    if has_audio and ALIGN_MODE != 'off':
+        video_durations = [get_media_duration(video_path) for video_path, _, _ in scenes]
+        scene_audio_durations = [
+            (audio_duration or get_media_duration(audio_path)) if audio_path else None
+            for _, audio_path, audio_duration in scenes
+        ]
+        if None in video_durations or any(
+            audio_path and duration is None
+            for (_, audio_path, _), duration in zip(scenes, scene_audio_durations)
+        ):
+            print("  [WARNING] Could not measure every scene, skipping alignment")
+            video_durations = None
+        else:
+            targets = plan_scene_alignment(video_durations, scene_audio_durations)
+            if streams_aligned(video_durations, scene_audio_durations):
+                video_durations = None
+    
+    list_files = []
+    if video_durations is not None:
+        # Per-scene alignment: one input per scene video and per scene audio
+        cmd = ["ffmpeg"]
+        for video_path in video_paths:
+            cmd += ["-i", video_path]
+        for (_, audio_path, _), target in zip(scenes, targets):
+            if audio_path:
+                cmd += ["-i", audio_path]
+            else:
+                cmd += ["-f", "lavfi", "-t", f"{target:.3f}", "-i", "anullsrc=r=44100:cl=stereo"]
+        cmd += [
+            "-filter_complex", build_alignment_filter(video_durations, targets, has_audio=True),
+            "-map", "[v]", "-map", "[a]",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac"
+        ]
+        print(f"\n  Aligning {len(scenes)} scenes to their narration...")
+    else:
+        video_list = write_concat_list(video_paths, os.path.join(list_dir, "video_list.txt"))
+        list_files.append(video_list)
+        cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", video_list]
+        
+        audio_paths = [audio_path for _, audio_path, _ in scenes if audio_path]
+        if audio_paths:
+            audio_list = write_concat_list(audio_paths, os.path.join(list_dir, "audio_list.txt"))
+            list_files.append(audio_list)
+            cmd += [
+                "-f", "concat", "-safe", "0", "-i", audio_list,
+                "-map", "0:v:0",   # Video from the scene list
+                "-map", "1:a:0",   # Audio from the fragment list
+                "-c:v", "copy",    # Copy video codec (no re-encoding)
+                "-c:a", "aac"      # Encode audio to AAC
+            ]
+        else:
+            cmd += ["-c", "copy"]
+    
+    # moov atom at the front so playback starts before the download completes
+    cmd += ["-movflags", "+faststart", output_path, "-y"]
+    
+    try:
+        print(f"\n  Finalizing {len(scenes)} scenes...")
+        # Only the re-encoding (alignment) path needs more than one core
+        result = run_limited(
+            cmd,
+            timeout=FFMPEG_TIMEOUT,
+            memory_limit_mb=FFMPEG_MEMORY_LIMIT_MB,
+            cpus=FFMPEG_CPUS if video_durations is not None else 1
+        )
+        
+        if result.returncode == 0:
+            print(f"[OK] Final video created: {output_path}")
+            annotate_file(output_path)
+            return True
+        else:
+            print(f"[ERROR] Error finalizing video:")
+            print(result.stderr)
+            return False
+            
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        return False
+    finally:
+        # Clean up temporary files
+        for list_file in list_files:
+            if os.path.exists(list_file):
+                os.remove(list_file)
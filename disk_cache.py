@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+def make_cache_key(*parts):
+    """Builds a content-addressed key (sha256 hex) from JSON-serialisable parts"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(source_path, destination_path):
+    """
+    Hard-links a file when possible (no extra disk I/O), otherwise copies it
+
+    Only link files that are never rewritten in place, such as cache
+    entries: a write through either name changes both.
+    """
+    destination_dir = os.path.dirname(destination_path)
+    if destination_dir:
+        os.makedirs(destination_dir, exist_ok=True)
+    if os.path.exists(destination_path):
+        os.remove(destination_path)
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        shutil.copyfile(source_path, destination_path)
+    return destination_path
+
+
+class DiskCache:
+    """
+    Size-capped, content-addressed file cache with LRU eviction
+
+    Each entry is a directory <root>/<key[:2]>/<key>/ holding one or more
+    files plus a meta.json. Reading an entry touches meta.json, and the
+    least recently used entries are evicted once the cache grows past
+    max_bytes. Stored files are copies: the files they come from (Manim
+    output, job workspace files) may be overwritten in place later, and
+    an entry must never change under its key.
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, directory, max_bytes=1024 ** 3, ttl_seconds=None):
+        """
+        Args:
+            directory: Root directory of the cache
+            max_bytes: Size limit for all entries (0 = unlimited)
+            ttl_seconds: Entries older than this are treated as missing (None = no expiry)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._total_bytes = None  # computed lazily by scanning the directory
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """
+        Looks up an entry
+
+        Returns:
+            The entry's metadata dict, with 'files' mapping each stored name
+            to its absolute path, or None on a miss
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, self.META_FILE)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl_seconds is not None and time.time() - meta.get('created_at', 0) > self.ttl_seconds:
+            self.delete(key)
+            return None
+
+        files = {name: os.path.join(entry_dir, name) for name in meta.get('files', [])}
+        if not all(os.path.exists(path) for path in files.values()):
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(meta_path, None)
+        except OSError:
+            pass
+
+        meta['files'] = files
+        return meta
+
+    def put(self, key, files=None, meta=None, contents=None):
+        """
+        Stores an entry, replacing any existing one
+
+        Args:
+            key: Cache key (see make_cache_key)
+            files: Dict mapping stored name to the source file to copy in
+                (copied, never linked)
+            meta: Extra JSON-serialisable metadata
+            contents: Dict mapping stored name to str/bytes written directly
+
+        Returns:
+            The stored metadata (as returned by get)
+        """
+        files = files or {}
+        contents = contents or {}
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+
+        # Build the entry in a private directory, then rename it into place
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        size = 0
+        for name, source_path in files.items():
+            target = os.path.join(tmp_dir, name)
+            shutil.copyfile(source_path, target)
+            size += os.path.getsize(target)
+        for name, data in contents.items():
+            target = os.path.join(tmp_dir, name)
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            with open(target, 'wb') as f:
+                f.write(data)
+            size += os.path.getsize(target)
+
+        stored_meta = dict(meta or {})
+        stored_meta['files'] = list(files) + list(contents)
+        stored_meta['size'] = size
+        stored_meta['created_at'] = time.time()
+        with open(os.path.join(tmp_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(stored_meta, f, ensure_ascii=False)
+
+        with self._lock:
+            old_size = self._entry_size(entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # Another process stored the same key first; keep theirs
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                size = 0
+            if self._total_bytes is not None:
+                self._total_bytes += size - old_size
+
+        self._evict_if_needed()
+        return self.get(key)
+
+    def delete(self, key):
+        entry_dir = self._entry_dir(key)
+        with self._lock:
+            size = self._entry_size(entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def purge(self):
+        """Removes every entry and returns how many were deleted"""
+        entries = self._scan()
+        for _, _, entry_dir in entries:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        with self._lock:
+            self._total_bytes = 0
+        return len(entries)
+
+    def stats(self):
+        entries = self._scan()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes
+        }
+
+    def _entry_size(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, self.META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f).get('size', 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _scan(self):
+        """Returns (last_used, size, entry_dir) for every complete entry"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, name)
+                meta_path = os.path.join(entry_dir, self.META_FILE)
+                if '.tmp-' in name or not os.path.exists(meta_path):
+                    continue
+                try:
+                    last_used = os.path.getmtime(meta_path)
+                except OSError:
+                    continue
+                entries.append((last_used, self._entry_size(entry_dir), entry_dir))
+        return entries
+
+    def _evict_if_needed(self):
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+                return
+
+            # Full scan only when the running total says we may be over the limit
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+            self._total_bytes = total
@@ -5,6 +5,7 @@ const API_BASE_URL = window.location.origin;
 const videoForm = document.getElementById('video-form');
 const topicInput = document.getElementById('topic-input');
 const llmSelect = document.getElementById('llm-select');
+const qualitySelect = document.getElementById('quality-select');
 const ttsToggle = document.getElementById('tts-toggle');
 const generateBtn = document.getElementById('generate-btn');
 const progressSection = document.getElementById('progress-section');
@@ -22,9 +23,15 @@ const steps = {
     video: document.getElementById('step-video')
 };
 
+// Consecutive stream errors before falling back to polling
+const STREAM_MAX_FAILURES = 3;
+
 // State
 let currentJobId = null;
 let progressInterval = null;
+let progressStream = null;
+let previewShown = false;
+let lastQueuePosition = null;
 
 // Form submission
 videoForm.addEventListener('submit', async (e) => {
@@ -37,6 +44,8 @@ videoForm.addEventListener('submit', async (e) => {
     progressSection.classList.remove('hidden');
     resultSection.classList.add('hidden');
     resetProgress();
+    previewShown = false;
+    lastQueuePosition = null;
 
     // Disable form
     generateBtn.disabled = true;
@@ -58,22 +67,28 @@ videoForm.addEventListener('submit', async (e) => {
             body: JSON.stringify({
                 topic: topic,
                 llm_provider: llmSelect.value,
-                enable_tts: ttsToggle.checked
+                enable_tts: ttsToggle.checked,
+                render_profile: qualitySelect.value
             })
         });
 
+        const data = await response.json();
+
         if (!response.ok) {
-            throw new Error('Failed to start video generation');
+            throw new Error(data.error || 'Failed to start video generation');
         }
 
-        const data = await response.json();
         currentJobId = data.job_id;
 
-        addLog(`✓ Job started: ${currentJobId}`);
+        addLog(`✓ Job queued: ${currentJobId}`);
         addLog(`→ Topic: ${topic}`);
+        if (data.queue_position) {
+            lastQueuePosition = data.queue_position;
+            addLog(`→ Queue position: ${data.queue_position}`);
+        }
 
-        // Start polling for progress
-        startProgressPolling();
+        // Start receiving progress updates
+        startProgressUpdates();
 
     } catch (error) {
         console.error('Error:', error);
@@ -82,8 +97,72 @@ videoForm.addEventListener('submit', async (e) => {
     }
 });
 
-// Progress polling
+// Progress updates: Server-Sent Events, falling back to polling
+function startProgressUpdates() {
+    if (!window.EventSource) {
+        startProgressPolling();
+        return;
+    }
+
+    let opened = false;
+    let failures = 0;
+    progressStream = new EventSource(`${API_BASE_URL}/api/progress/${currentJobId}/stream`);
+
+    progressStream.onopen = () => {
+        opened = true;
+        failures = 0;
+    };
+
+    progressStream.onmessage = (event) => {
+        handleProgressData(JSON.parse(event.data));
+    };
+
+    progressStream.addEventListener('end', () => {
+        stopProgressUpdates();
+    });
+
+    progressStream.onerror = () => {
+        // A dropped connection is retried by EventSource itself (readyState
+        // CONNECTING). Poll instead only if the stream was refused (e.g. 503
+        // when the server is at SSE_MAX_STREAMS) or keeps failing.
+        failures += 1;
+        const refused = progressStream.readyState === EventSource.CLOSED;
+        if (!refused && failures < STREAM_MAX_FAILURES) {
+            return;
+        }
+        stopProgressStream();
+        if (currentJobId) {
+            console.warn(opened ? 'Progress stream keeps failing, polling instead' : 'SSE unavailable, polling instead');
+            startProgressPolling();
+        }
+    };
+}
+
+function handleProgressData(data) {
+    updateProgress(data);
+
+    // Check if completed
+    if (data.status === 'completed') {
+        stopProgressUpdates();
+        showResult(data.video_url);
+    } else if (data.status === 'failed') {
+        stopProgressUpdates();
+        addLog(`✗ Generation failed: ${data.error}`, 'error');
+        resetForm();
+    } else if (data.status === 'cancelled') {
+        stopProgressUpdates();
+        addLog('✗ Generation cancelled', 'error');
+        resetForm();
+    } else if (data.preview_url && !previewShown) {
+        // Two-tier render: show the preview while the final quality renders
+        previewShown = true;
+        showPreview(data.preview_url);
+    }
+}
+
 function startProgressPolling() {
+    if (progressInterval) return;
+
     progressInterval = setInterval(async () => {
         try {
             const response = await fetch(`${API_BASE_URL}/api/progress/${currentJobId}`);
@@ -93,17 +172,7 @@ function startProgressPolling() {
             }
 
             const data = await response.json();
-            updateProgress(data);
-
-            // Check if completed
-            if (data.status === 'completed') {
-                stopProgressPolling();
-                showResult(data.video_url);
-            } else if (data.status === 'failed') {
-                stopProgressPolling();
-                addLog(`✗ Generation failed: ${data.error}`, 'error');
-                resetForm();
-            }
+            handleProgressData(data);
 
         } catch (error) {
             console.error('Polling error:', error);
@@ -111,6 +180,13 @@ function startProgressPolling() {
     }, 2000); // Poll every 2 seconds
 }
 
+function stopProgressStream() {
+    if (progressStream) {
+        progressStream.close();
+        progressStream = null;
+    }
+}
+
 function stopProgressPolling() {
     if (progressInterval) {
         clearInterval(progressInterval);
@@ -118,12 +194,26 @@ function stopProgressPolling() {
     }
 }
 
+function stopProgressUpdates() {
+    stopProgressStream();
+    stopProgressPolling();
+}
+
 // Update progress UI
 function updateProgress(data) {
-    const { progress, current_step, message } = data;
+    const { progress, current_step, message, status, queue_position, eta_seconds } = data;
+
+    if (status === 'queued' && queue_position) {
+        // Polls repeat the same position; only log when it moves
+        if (queue_position !== lastQueuePosition) {
+            lastQueuePosition = queue_position;
+            addLog(`Waiting in queue (position ${queue_position})`);
+        }
+        return;
+    }
 
     // Update progress bar
-    updateProgressBar(progress);
+    updateProgressBar(progress, status === 'running' ? eta_seconds : null);
 
     // Update steps
     updateSteps(current_step);
@@ -134,9 +224,15 @@ function updateProgress(data) {
     }
 }
 
-function updateProgressBar(progress) {
+function updateProgressBar(progress, etaSeconds = null) {
     progressFill.style.width = `${progress}%`;
-    document.querySelector('.progress-percentage').textContent = `${Math.round(progress)}%`;
+    const eta = etaSeconds != null ? ` · ${formatEta(etaSeconds)} left` : '';
+    document.querySelector('.progress-percentage').textContent = `${Math.round(progress)}%${eta}`;
+}
+
+function formatEta(seconds) {
+    if (seconds < 60) return `~${Math.max(1, Math.round(seconds))}s`;
+    return `~${Math.round(seconds / 60)} min`;
 }
 
 function updateSteps(currentStep) {
@@ -190,6 +286,14 @@ function resetForm() {
     `;
 }
 
+// Show the preview video while the final render is still running
+function showPreview(videoUrl) {
+    addLog('✓ Preview ready, rendering final quality...', 'success');
+    resultSection.classList.remove('hidden');
+    resultVideo.src = videoUrl;
+    downloadBtn.href = videoUrl;
+}
+
 // Show result
 function showResult(videoUrl) {
     addLog('✓ Video generation completed!', 'success');
@@ -240,5 +344,5 @@ document.head.appendChild(style);
 
 // Cleanup on page unload
 window.addEventListener('beforeunload', () => {
-    stopProgressPolling();
+    stopProgressUpdates();
 });
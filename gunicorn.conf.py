@@ -0,0 +1,13 @@
+import os
+
+
+# gunicorn settings for wsgi:app, overridable through the environment
+bind = os.getenv('API_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('API_WORKERS', '2'))
+# Progress streams keep a request open and hold a thread while idle; each process
+# serves at most API_THREADS requests and streams at once, and main.py caps the
+# streams at SSE_MAX_STREAMS so plain API requests still get threads
+worker_class = 'gthread'
+threads = int(os.getenv('API_THREADS', '64'))
+timeout = int(os.getenv('API_TIMEOUT', '60'))
+accesslog = '-'
@@ -0,0 +1,140 @@
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+
+# Finished jobs whose last version is kept so late waiters still see the change
+MAX_FINISHED_VERSIONS = 1000
+
+_UNSEEN = object()
+
+
+class JobEvents:
+    """
+    Change notifications for job records
+
+    Every call to notify() gives the job a new version number and wakes the
+    threads blocked in wait(), so progress streams push updates as soon as
+    update_job_status runs instead of polling the job store. Versions come
+    from one process-wide counter, so a job never gets a version it had
+    before, even after it finished and its entry was dropped.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._finished = OrderedDict()  # finished job ids, oldest first
+        self._counter = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def version(self, job_id):
+        with self._cond:
+            return self._versions.get(job_id, 0)
+
+    def notify(self, job_id, finished=False):
+        """
+        Signals that a job changed
+
+        Finished jobs keep their last version as a tombstone until
+        MAX_FINISHED_VERSIONS newer jobs have finished.
+        """
+        with self._cond:
+            self._versions[job_id] = next(self._counter)
+            if finished:
+                self._finished[job_id] = True
+                self._finished.move_to_end(job_id)
+                while len(self._finished) > MAX_FINISHED_VERSIONS:
+                    old_id, _ = self._finished.popitem(last=False)
+                    self._versions.pop(old_id, None)
+            else:
+                # A resumed job is tracked again
+                self._finished.pop(job_id, None)
+            self._cond.notify_all()
+
+    def wait(self, job_id, since_version, timeout=None):
+        """
+        Blocks until the job's version differs from since_version
+
+        Returns:
+            The current version (equal to since_version on timeout)
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._versions.get(job_id, 0) != since_version,
+                timeout=timeout
+            )
+            return self._versions.get(job_id, 0)
+
+
+class StoreWatcher:
+    """
+    Turns job changes made by other processes into JobEvents notifications
+
+    Jobs run by external workers update the job store, never this
+    process's JobEvents. While any job is watched, one thread reads the
+    versions of every watched job in a single batched query per interval
+    and notifies the jobs whose version changed, so the cost per process
+    does not grow with the number of open progress streams.
+    """
+
+    def __init__(self, store, events, interval=1.0):
+        """
+        Args:
+            store: JobStore providing job_versions()
+            events: JobEvents to notify
+            interval: Seconds between polls of the store
+        """
+        self.store = store
+        self.events = events
+        self.interval = interval
+        self._watched = {}  # job_id -> number of watchers
+        self._versions = {}  # job_id -> version seen in the last poll
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @contextmanager
+    def watching(self, job_id):
+        """Keeps a job's changes flowing into events for the with-block"""
+        with self._cond:
+            self._watched[job_id] = self._watched.get(job_id, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll_loop, name='job-store-watcher', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._watched[job_id] -= 1
+                if not self._watched[job_id]:
+                    del self._watched[job_id]
+                    self._versions.pop(job_id, None)
+
+    def _poll_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._watched)
+                job_ids = list(self._watched)
+            try:
+                versions = self.store.job_versions(job_ids)
+            except Exception as e:
+                print(f"[WARNING] Could not poll the job store for changes: {e}")
+            else:
+                changed = []
+                with self._cond:
+                    for job_id in job_ids:
+                        if job_id not in self._watched:
+                            continue
+                        # A newly watched job is notified once too, in case it
+                        # changed between its stream's first read and this poll
+                        if self._versions.get(job_id, _UNSEEN) != versions.get(job_id):
+                            changed.append(job_id)
+                        self._versions[job_id] = versions.get(job_id)
+                for job_id in changed:
+                    self.events.notify(job_id)
+            time.sleep(self.interval)
+
+
+# Process-wide notifier used by update_job_status and the progress stream
+job_events = JobEvents()
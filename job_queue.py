@@ -0,0 +1,456 @@
+import os
+import json
+import time
+import heapq
+import socket
+import itertools
+import threading
+
+
+# Priority names accepted by the API, lower value runs first
+PRIORITIES = {
+    'high': 0,
+    'normal': 1,
+    'low': 2
+}
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobCancelledError(Exception):
+    """Raised inside a running job once cancellation has been requested"""
+
+
+class JobInterruptedError(JobCancelledError):
+    """Raised inside a running job when its worker shuts down; the job goes back to the queue"""
+
+
+def parse_priority(priority):
+    """Converts a priority name or number into its numeric value"""
+    if priority is None:
+        return PRIORITIES['normal']
+    if isinstance(priority, str):
+        if priority.lower() not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        return PRIORITIES[priority.lower()]
+    return int(priority)
+
+
+class JobQueue:
+    """
+    Bounded priority queue served by a fixed number of worker threads
+
+    Pending entries are written to a JSON state file on every change so
+    queued jobs are picked up again after a process restart.
+    """
+
+    def __init__(self, worker_fn, num_workers=2, max_size=20, state_file=None, on_change=None):
+        """
+        Args:
+            worker_fn: Callable invoked as worker_fn(job_id, **job_kwargs)
+            num_workers: Number of jobs allowed to run at the same time
+            max_size: Maximum number of jobs waiting in the queue (0 = unlimited)
+            state_file: JSON file used to persist pending jobs
+            on_change: Called with the waiting job ids whenever their positions may have changed
+        """
+        self.worker_fn = worker_fn
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self.state_file = state_file
+        self.on_change = on_change
+
+        self._heap = []
+        self._entries = {}  # job_id -> entry for jobs still waiting
+        self._running = {}  # job_id -> entry for jobs being processed
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def start(self):
+        """Restores persisted jobs and starts the worker threads"""
+        with self._cond:
+            if self._workers:
+                return []
+            restored = self._load_state()
+            waiting = list(self._entries)
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'job-worker-{i}',
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        self._changed(waiting)
+        return restored
+
+    def submit(self, job_id, job_kwargs, priority='normal'):
+        """
+        Adds a job to the queue
+
+        Returns:
+            The job's position in the queue (1 = next to run)
+
+        Raises:
+            QueueFullError: If max_size jobs are already waiting
+        """
+        priority_value = parse_priority(priority)
+        with self._cond:
+            if self.max_size and len(self._entries) >= self.max_size:
+                raise QueueFullError(
+                    f"Job queue is full ({self.max_size} jobs waiting), try again later"
+                )
+            entry = {
+                'job_id': job_id,
+                'priority': priority_value,
+                'seq': next(self._counter),
+                'kwargs': job_kwargs
+            }
+            self._push(entry)
+            self._save_state()
+            self._cond.notify()
+            position = self._position_locked(job_id)
+            waiting = list(self._entries)
+        self._changed(waiting)
+        return position
+
+    def cancel(self, job_id):
+        """
+        Removes a waiting job from the queue
+
+        Returns:
+            True if the job was waiting and has been removed, False otherwise
+        """
+        with self._cond:
+            entry = self._entries.pop(job_id, None)
+            if entry is None:
+                return False
+            # Lazy deletion: the heap item is skipped when popped
+            entry['cancelled'] = True
+            self._save_state()
+            waiting = list(self._entries)
+        self._changed(waiting)
+        return True
+
+    def position(self, job_id):
+        """Returns the 1-based queue position of a waiting job, or None"""
+        with self._cond:
+            return self._position_locked(job_id)
+
+    def is_running(self, job_id):
+        with self._cond:
+            return job_id in self._running
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': len(self._entries),
+                'running': len(self._running),
+                'workers': self.num_workers,
+                'max_size': self.max_size
+            }
+
+    def _changed(self, job_ids):
+        """Reports a queue change to on_change (called without the lock held)"""
+        if self.on_change and job_ids:
+            try:
+                self.on_change(job_ids)
+            except Exception as e:
+                print(f"[WARNING] Queue change callback failed: {e}")
+
+    def _push(self, entry):
+        self._entries[entry['job_id']] = entry
+        heapq.heappush(self._heap, (entry['priority'], entry['seq'], entry['job_id'], entry))
+
+    def _position_locked(self, job_id):
+        entry = self._entries.get(job_id)
+        if entry is None:
+            return None
+        key = (entry['priority'], entry['seq'])
+        ahead = sum(
+            1 for other in self._entries.values()
+            if (other['priority'], other['seq']) < key
+        )
+        return ahead + 1
+
+    def _next_entry(self):
+        """
+        Blocks until a job is available and marks it as running
+
+        Returns:
+            Tuple of (entry, ids of the jobs still waiting)
+        """
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, _, job_id, entry = heapq.heappop(self._heap)
+                    if entry.get('cancelled'):
+                        continue
+                    self._entries.pop(job_id, None)
+                    self._running[job_id] = entry
+                    self._save_state()
+                    return entry, list(self._entries)
+                self._cond.wait()
+
+    def _worker_loop(self):
+        while True:
+            entry, waiting = self._next_entry()
+            # Every job behind this one moved up a position
+            self._changed(waiting)
+            job_id = entry['job_id']
+            try:
+                self.worker_fn(job_id, **entry['kwargs'])
+            except Exception as e:
+                print(f"[ERROR] Job {job_id} crashed in worker: {e}")
+            finally:
+                with self._cond:
+                    # A follow-up pass of the same job may already be running
+                    if self._running.get(job_id) is entry:
+                        del self._running[job_id]
+                    self._save_state()
+
+    def _save_state(self):
+        """Writes waiting and running jobs to the state file (caller holds the lock)"""
+        if not self.state_file:
+            return
+        # Running jobs are stored too: if the process dies mid-job they are
+        # re-queued on the next start instead of being lost
+        pending = [
+            {k: v for k, v in entry.items() if k != 'cancelled'}
+            for entry in self._entries.values()
+        ]
+        running = list(self._running.values())
+        state = {'pending': pending + running}
+
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _load_state(self):
+        """Re-queues jobs found in the state file (caller holds the lock)"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return []
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Could not read job queue state: {e}")
+            return []
+
+        restored = []
+        for entry in sorted(state.get('pending', []), key=lambda e: (e['priority'], e['seq'])):
+            entry['seq'] = next(self._counter)
+            self._push(entry)
+            restored.append(entry)
+        if restored:
+            print(f"[OK] Restored {len(restored)} queued job(s) from {self.state_file}")
+        return restored
+
+
+class SharedJobQueue:
+    """
+    Priority queue kept in the job store and shared between processes
+
+    The API process only submits and cancels jobs (num_workers=0) while
+    worker processes claim entries atomically, so any number of them can
+    serve the same queue. Workers refresh a heartbeat while they run jobs;
+    entries held by a worker that stopped refreshing it (crash, kill) are
+    put back in the queue after claim_timeout seconds.
+    """
+
+    def __init__(self, store, worker_fn=None, num_workers=0, max_size=20,
+                 poll_interval=1.0, claim_timeout=120, on_restore=None, on_stop=None,
+                 on_change=None):
+        """
+        Args:
+            store: JobStore holding the queue
+            worker_fn: Callable invoked as worker_fn(job_id, **job_kwargs)
+            num_workers: Jobs this process runs at the same time (0 = submit only)
+            max_size: Maximum number of jobs waiting in the queue (0 = unlimited)
+            poll_interval: Seconds between checks for new jobs while idle
+            claim_timeout: Seconds without a heartbeat before a worker's jobs are requeued
+            on_restore: Called with the entries requeued from dead workers
+            on_stop: Called when stop() begins, to interrupt the running jobs
+            on_change: Called with the queued job ids when this process changes the queue
+        """
+        self.store = store
+        self.worker_fn = worker_fn
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.on_restore = on_restore
+        self.on_stop = on_stop
+        self.on_change = on_change
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._workers = []
+        self._job_threads = []
+
+    def start(self):
+        """Requeues jobs of dead workers and starts the worker threads"""
+        with self._cond:
+            if self._workers:
+                return []
+            restored = self.store.requeue_claims(cutoff=time.time() - self.claim_timeout)
+            if restored:
+                print(f"[OK] Requeued {len(restored)} job(s) from stopped workers")
+            if not self.num_workers:
+                return restored
+
+            self.store.touch_worker(self.worker_id, self.num_workers)
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'job-worker-{i}',
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+                self._job_threads.append(worker)
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+            heartbeat.start()
+            self._workers.append(heartbeat)
+            return restored
+
+    def stop(self, timeout=20):
+        """
+        Stops claiming jobs and hands this worker's running jobs back to the queue
+
+        on_stop interrupts the running jobs, then their threads get up to
+        timeout seconds to exit. Jobs are only requeued once no thread of
+        this process runs them; if some are still running at the deadline,
+        nothing is requeued here and the jobs go back to the queue through
+        the claim timeout after this process exits.
+
+        Returns:
+            The requeued entries (also passed to on_restore)
+        """
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.on_stop:
+            self.on_stop()
+
+        deadline = time.monotonic() + timeout
+        for thread in self._job_threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        if any(thread.is_alive() for thread in self._job_threads):
+            print(f"[WARNING] Jobs still running after {timeout}s; they are requeued "
+                  f"{self.claim_timeout:.0f}s after this worker exits")
+            return []
+
+        restored = self.store.requeue_claims(worker_id=self.worker_id)
+        self.store.remove_worker(self.worker_id)
+        if restored and self.on_restore:
+            self.on_restore(restored)
+        return restored
+
+    def submit(self, job_id, job_kwargs, priority='normal'):
+        """
+        Adds a job to the queue
+
+        Returns:
+            The job's position in the queue (1 = next to run)
+
+        Raises:
+            QueueFullError: If max_size jobs are already waiting
+        """
+        priority_value = parse_priority(priority)
+        if self.max_size and self.stats()['queued'] >= self.max_size:
+            raise QueueFullError(
+                f"Job queue is full ({self.max_size} jobs waiting), try again later"
+            )
+        self.store.enqueue({'job_id': job_id, 'priority': priority_value, 'kwargs': job_kwargs})
+        # Jobs queued from this process (final passes) don't wait for the next poll
+        with self._cond:
+            self._cond.notify()
+        self._changed()
+        return self.position(job_id)
+
+    def cancel(self, job_id):
+        """
+        Removes a waiting job from the queue
+
+        Returns:
+            True if the job was waiting and has been removed, False otherwise
+        """
+        removed = self.store.dequeue(job_id)
+        if removed:
+            self._changed()
+        return removed
+
+    def position(self, job_id):
+        """Returns the 1-based queue position of a waiting job, or None"""
+        return self.store.queue_position(job_id)
+
+    def job_ids(self):
+        """Returns the ids of waiting and running jobs, across all workers"""
+        return self.store.queue_job_ids()
+
+    def stats(self):
+        """Queue counts across all processes; workers is the job slots of live workers"""
+        stats = self.store.queue_stats(cutoff=time.time() - self.claim_timeout)
+        stats['max_size'] = self.max_size
+        return stats
+
+    def _changed(self):
+        """
+        Reports a queue change made by this process to on_change
+
+        Claims by other processes can't be seen here; readers in other
+        processes pick those up by re-reading the job store.
+        """
+        if not self.on_change:
+            return
+        try:
+            self.on_change(self.job_ids())
+        except Exception as e:
+            print(f"[WARNING] Queue change callback failed: {e}")
+
+    def _worker_loop(self):
+        while not self._stopped.is_set():
+            try:
+                entry = self.store.claim_next(self.worker_id)
+            except Exception as e:
+                print(f"[WARNING] Could not claim a job: {e}")
+                entry = None
+            if entry is None:
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+                continue
+
+            job_id = entry['job_id']
+            interrupted = False
+            try:
+                self.worker_fn(job_id, **entry['kwargs'])
+            except JobInterruptedError:
+                # Keep the claim: stop() requeues it once this thread is gone
+                interrupted = True
+            except Exception as e:
+                print(f"[ERROR] Job {job_id} crashed in worker: {e}")
+            finally:
+                if not interrupted:
+                    self.store.release(job_id, entry['claim'])
+
+    def _heartbeat_loop(self):
+        interval = max(self.claim_timeout / 4, self.poll_interval)
+        while not self._stopped.wait(interval):
+            try:
+                self.store.touch_worker(self.worker_id, self.num_workers)
+                restored = self.store.requeue_claims(cutoff=time.time() - self.claim_timeout)
+            except Exception as e:
+                print(f"[WARNING] Job queue heartbeat failed: {e}")
+                continue
+            if restored:
+                print(f"[OK] Requeued {len(restored)} job(s) from stopped workers")
+                if self.on_restore:
+                    self.on_restore(restored)
@@ -0,0 +1,714 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+
+# Jobs in these states are never updated again and can be evicted
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class JobStore:
+    """
+    Base class for job storage backends
+
+    Jobs are plain dicts; every backend indexes them by status and
+    created_at so listings stay cheap with thousands of records.
+    """
+
+    def __init__(self, ttl_seconds=86400):
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, job):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def update(self, job_id, fields):
+        """
+        Merges fields into an existing job record and returns it
+
+        Returns None without writing anything if the job does not exist
+        (deleted or expired): a record without created_at and status would
+        never be evicted.
+        """
+        raise NotImplementedError
+
+    def delete(self, job_id):
+        raise NotImplementedError
+
+    def list_jobs(self, status=None, limit=100, offset=0):
+        """Returns jobs ordered by created_at, newest first"""
+        raise NotImplementedError
+
+    def count_jobs(self, status=None):
+        raise NotImplementedError
+
+    def evict_expired(self):
+        """Deletes finished jobs older than the TTL and returns how many were removed"""
+        raise NotImplementedError
+
+    def job_versions(self, job_ids):
+        """
+        Returns {job_id: version} for the given jobs in one read
+
+        The version changes whenever the job record or its queue position
+        does; missing jobs map to None.
+        """
+        raise NotImplementedError
+
+    def _expiry_cutoff(self):
+        return (datetime.now() - timedelta(seconds=self.ttl_seconds)).isoformat()
+
+    # Shared job queue (see job_queue.SharedJobQueue). Entries are dicts with
+    # job_id, priority and kwargs; a claimed entry also carries its claim id,
+    # worker_id and the worker's last heartbeat (epoch seconds).
+
+    def enqueue(self, entry):
+        """Adds a queue entry behind the waiting entries of the same priority"""
+        raise NotImplementedError
+
+    def dequeue(self, job_id):
+        """Removes a waiting entry, returning True if the job was waiting"""
+        raise NotImplementedError
+
+    def claim_next(self, worker_id):
+        """Atomically takes the first waiting entry for a worker, or returns None"""
+        raise NotImplementedError
+
+    def release(self, job_id, claim):
+        """Deletes a finished entry, unless the job was queued again since it was claimed"""
+        raise NotImplementedError
+
+    def touch_worker(self, worker_id, slots):
+        """Refreshes the heartbeat of a worker and of the entries it holds"""
+        raise NotImplementedError
+
+    def remove_worker(self, worker_id):
+        raise NotImplementedError
+
+    def requeue_claims(self, cutoff=None, worker_id=None):
+        """
+        Puts claimed entries back in the queue
+
+        Args:
+            cutoff: Requeue entries whose heartbeat is older than this (epoch seconds)
+            worker_id: Requeue every entry held by this worker
+
+        Returns:
+            The requeued entries
+        """
+        raise NotImplementedError
+
+    def queue_position(self, job_id):
+        """Returns the 1-based position of a waiting entry, or None"""
+        raise NotImplementedError
+
+    def queue_stats(self, cutoff):
+        """Returns waiting and claimed entries, and job slots of workers seen since cutoff"""
+        raise NotImplementedError
+
+    def queue_job_ids(self):
+        """Returns the ids of waiting and claimed entries"""
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    """Job store backed by a SQLite database in WAL mode"""
+
+    # Opportunistic eviction runs at most this often (seconds)
+    EVICTION_INTERVAL = 60
+
+    def __init__(self, path='media/jobs.db', ttl_seconds=86400):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        self._last_eviction = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                finished_at TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+            CREATE TABLE IF NOT EXISTS job_queue (
+                job_id TEXT PRIMARY KEY,
+                priority INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                kwargs TEXT NOT NULL,
+                claim TEXT,
+                worker_id TEXT,
+                heartbeat REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_queue_order ON job_queue (claim, priority, seq);
+            CREATE TABLE IF NOT EXISTS job_workers (
+                worker_id TEXT PRIMARY KEY,
+                slots INTEGER NOT NULL,
+                heartbeat REAL NOT NULL
+            );
+        """)
+        conn.commit()
+
+    def _connection(self):
+        """Returns a connection owned by the calling thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, conn, job):
+        finished_at = job.get('updated_at') if job.get('status') in FINISHED_STATUSES else None
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO jobs (job_id, status, created_at, updated_at, finished_at, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (job['job_id'], job.get('status'), job.get('created_at'),
+             job.get('updated_at'), finished_at, json.dumps(job))
+        )
+
+    def create(self, job):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write(conn, job)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_evict()
+        return job
+
+    def get(self, job_id):
+        row = self._connection().execute(
+            "SELECT data FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, fields):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so read-modify-write is atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            job = None
+            if row:
+                job = json.loads(row[0])
+                job.update(fields)
+                self._write(conn, job)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job
+
+    def delete(self, job_id):
+        self._connection().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def list_jobs(self, status=None, limit=100, offset=0):
+        if status:
+            rows = self._connection().execute(
+                "SELECT data FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (status, limit, offset)
+            ).fetchall()
+        else:
+            rows = self._connection().execute(
+                "SELECT data FROM jobs ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count_jobs(self, status=None):
+        if status:
+            row = self._connection().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)
+            ).fetchone()
+        else:
+            row = self._connection().execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return row[0]
+
+    def job_versions(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        placeholders = ', '.join('?' * len(job_ids))
+        rows = self._connection().execute(
+            f"""
+            SELECT jobs.job_id, jobs.updated_at, waiting.position FROM jobs
+            LEFT JOIN (
+                SELECT job_id, ROW_NUMBER() OVER (ORDER BY priority, seq) AS position
+                FROM job_queue WHERE claim IS NULL
+            ) AS waiting ON waiting.job_id = jobs.job_id
+            WHERE jobs.job_id IN ({placeholders})
+            """,
+            job_ids
+        ).fetchall()
+        versions = dict.fromkeys(job_ids)
+        versions.update((job_id, (updated_at, position)) for job_id, updated_at, position in rows)
+        return versions
+
+    def evict_expired(self):
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (self._expiry_cutoff(),)
+        )
+        return cursor.rowcount
+
+    def _maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_eviction < self.EVICTION_INTERVAL:
+            return
+        self._last_eviction = now
+        try:
+            removed = self.evict_expired()
+            if removed:
+                print(f"[OK] Evicted {removed} expired job(s)")
+        except sqlite3.Error as e:
+            print(f"[WARNING] Job eviction failed: {e}")
+
+    @staticmethod
+    def _queue_entry(row):
+        job_id, priority, seq, kwargs, claim, worker_id, heartbeat = row
+        entry = {'job_id': job_id, 'priority': priority, 'seq': seq, 'kwargs': json.loads(kwargs)}
+        if claim:
+            entry.update(claim=claim, worker_id=worker_id, heartbeat=heartbeat)
+        return entry
+
+    def _transaction(self, fn):
+        """Runs fn(conn) holding the write lock and returns its result"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def enqueue(self, entry):
+        def insert(conn):
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM job_queue").fetchone()[0]
+            # A follow-up pass replaces the entry of the pass that is still running
+            conn.execute(
+                "INSERT OR REPLACE INTO job_queue (job_id, priority, seq, kwargs) VALUES (?, ?, ?, ?)",
+                (entry['job_id'], entry['priority'], seq, json.dumps(entry['kwargs']))
+            )
+        self._transaction(insert)
+
+    def dequeue(self, job_id):
+        cursor = self._connection().execute(
+            "DELETE FROM job_queue WHERE job_id = ? AND claim IS NULL", (job_id,)
+        )
+        return cursor.rowcount > 0
+
+    def claim_next(self, worker_id):
+        def claim(conn):
+            row = conn.execute(
+                "SELECT * FROM job_queue WHERE claim IS NULL ORDER BY priority, seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            entry = self._queue_entry(row)
+            entry.update(claim=uuid.uuid4().hex, worker_id=worker_id, heartbeat=time.time())
+            conn.execute(
+                "UPDATE job_queue SET claim = ?, worker_id = ?, heartbeat = ? WHERE job_id = ?",
+                (entry['claim'], worker_id, entry['heartbeat'], entry['job_id'])
+            )
+            return entry
+        return self._transaction(claim)
+
+    def release(self, job_id, claim):
+        self._connection().execute(
+            "DELETE FROM job_queue WHERE job_id = ? AND claim = ?", (job_id, claim)
+        )
+
+    def touch_worker(self, worker_id, slots):
+        def touch(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO job_workers (worker_id, slots, heartbeat) VALUES (?, ?, ?)",
+                (worker_id, slots, now)
+            )
+            conn.execute("UPDATE job_queue SET heartbeat = ? WHERE worker_id = ?", (now, worker_id))
+        self._transaction(touch)
+
+    def remove_worker(self, worker_id):
+        self._connection().execute("DELETE FROM job_workers WHERE worker_id = ?", (worker_id,))
+
+    def requeue_claims(self, cutoff=None, worker_id=None):
+        def requeue(conn):
+            rows = conn.execute(
+                "SELECT * FROM job_queue WHERE claim IS NOT NULL AND (heartbeat < ? OR worker_id = ?)",
+                (cutoff if cutoff is not None else float('-inf'), worker_id)
+            ).fetchall()
+            entries = []
+            for row in rows:
+                entry = self._queue_entry(row)
+                # Requeued entries keep their sequence number: they were first in line
+                conn.execute(
+                    "UPDATE job_queue SET claim = NULL, worker_id = NULL, heartbeat = NULL WHERE job_id = ?",
+                    (entry['job_id'],)
+                )
+                entries.append({key: entry[key] for key in ('job_id', 'priority', 'seq', 'kwargs')})
+            if cutoff is not None:
+                conn.execute("DELETE FROM job_workers WHERE heartbeat < ?", (cutoff,))
+            return entries
+        return self._transaction(requeue)
+
+    def queue_position(self, job_id):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT priority, seq FROM job_queue WHERE job_id = ? AND claim IS NULL", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = conn.execute(
+            """
+            SELECT COUNT(*) FROM job_queue
+            WHERE claim IS NULL AND (priority < ? OR (priority = ? AND seq < ?))
+            """,
+            (row[0], row[0], row[1])
+        ).fetchone()[0]
+        return ahead + 1
+
+    def queue_stats(self, cutoff):
+        conn = self._connection()
+        queued, running = conn.execute(
+            "SELECT COUNT(*) - COUNT(claim), COUNT(claim) FROM job_queue"
+        ).fetchone()
+        workers = conn.execute(
+            "SELECT COALESCE(SUM(slots), 0) FROM job_workers WHERE heartbeat >= ?", (cutoff,)
+        ).fetchone()[0]
+        return {'queued': queued, 'running': running, 'workers': workers}
+
+    def queue_job_ids(self):
+        return {row[0] for row in self._connection().execute("SELECT job_id FROM job_queue")}
+
+
+# Queue scripts run atomically on the server; entries are JSON strings
+_REDIS_CLAIM_SCRIPT = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then return false end
+local entry = redis.call('HGET', KEYS[2], popped[1])
+redis.call('HDEL', KEYS[2], popped[1])
+if not entry then return false end
+local claimed = cjson.decode(entry)
+claimed['claim'] = ARGV[1]
+claimed['worker_id'] = ARGV[2]
+claimed['heartbeat'] = tonumber(ARGV[3])
+entry = cjson.encode(claimed)
+redis.call('HSET', KEYS[3], popped[1], entry)
+return entry
+"""
+
+_REDIS_RELEASE_SCRIPT = """
+local entry = redis.call('HGET', KEYS[1], ARGV[1])
+if entry and cjson.decode(entry)['claim'] == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+_REDIS_TOUCH_SCRIPT = """
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+local claims = redis.call('HGETALL', KEYS[1])
+for i = 1, #claims, 2 do
+    local entry = cjson.decode(claims[i + 1])
+    if entry['worker_id'] == ARGV[1] then
+        entry['heartbeat'] = tonumber(ARGV[2])
+        redis.call('HSET', KEYS[1], claims[i], cjson.encode(entry))
+    end
+end
+return 0
+"""
+
+_REDIS_REQUEUE_SCRIPT = """
+local requeued = {}
+local claims = redis.call('HGETALL', KEYS[1])
+for i = 1, #claims, 2 do
+    local job_id = claims[i]
+    local entry = cjson.decode(claims[i + 1])
+    if entry['heartbeat'] < tonumber(ARGV[1]) or entry['worker_id'] == ARGV[2] then
+        redis.call('HDEL', KEYS[1], job_id)
+        -- A follow-up pass of the job may already be waiting
+        if redis.call('HEXISTS', KEYS[2], job_id) == 0 then
+            entry['claim'] = nil
+            entry['worker_id'] = nil
+            entry['heartbeat'] = nil
+            local encoded = cjson.encode(entry)
+            redis.call('HSET', KEYS[2], job_id, encoded)
+            redis.call('ZADD', KEYS[3], ARGV[3] * entry['priority'] + entry['seq'], job_id)
+            table.insert(requeued, encoded)
+        end
+    end
+end
+return requeued
+"""
+
+
+class RedisJobStore(JobStore):
+    """
+    Job store backed by Redis (or any Redis-compatible server)
+
+    Each job is a JSON string under job:<id>; sorted sets scored by
+    creation time provide the created_at and per-status indexes. Finished
+    jobs get a Redis TTL, so eviction of the records is handled server-side.
+    The shared queue is a sorted set scored by priority then sequence, with
+    entries and claims in hashes updated by server-side scripts.
+    """
+
+    # Queue score = priority * PRIORITY_SCALE + sequence number
+    PRIORITY_SCALE = 10 ** 12
+    # Opportunistic index cleanup runs at most this often (seconds)
+    EVICTION_INTERVAL = 60
+    # Job ids checked per round trip during cleanup
+    EVICTION_BATCH = 500
+
+    def __init__(self, url='redis://localhost:6379/0', ttl_seconds=86400, prefix='topic2manim'):
+        super().__init__(ttl_seconds)
+        try:
+            import redis
+        except ImportError:
+            raise ImportError(
+                "The redis package is required for JOB_STORE_BACKEND=redis (pip install redis)"
+            )
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._redis_error = redis.RedisError
+        self._last_eviction = 0
+        self._claim_script = self.redis.register_script(_REDIS_CLAIM_SCRIPT)
+        self._release_script = self.redis.register_script(_REDIS_RELEASE_SCRIPT)
+        self._touch_script = self.redis.register_script(_REDIS_TOUCH_SCRIPT)
+        self._requeue_script = self.redis.register_script(_REDIS_REQUEUE_SCRIPT)
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    def _index_key(self, status=None):
+        if status:
+            return f"{self.prefix}:jobs:status:{status}"
+        return f"{self.prefix}:jobs:created"
+
+    def _queue_key(self, name=None):
+        return f"{self.prefix}:queue:{name}" if name else f"{self.prefix}:queue"
+
+    @staticmethod
+    def _score(job):
+        try:
+            return datetime.fromisoformat(job.get('created_at')).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+
+    def _write(self, pipe, job, previous_status=None):
+        key = self._job_key(job['job_id'])
+        score = self._score(job)
+        pipe.set(key, json.dumps(job))
+        pipe.zadd(self._index_key(), {job['job_id']: score})
+        if previous_status and previous_status != job.get('status'):
+            pipe.zrem(self._index_key(previous_status), job['job_id'])
+        if job.get('status'):
+            pipe.zadd(self._index_key(job['status']), {job['job_id']: score})
+        if job.get('status') in FINISHED_STATUSES:
+            pipe.expire(key, self.ttl_seconds)
+
+    def create(self, job):
+        pipe = self.redis.pipeline()
+        self._write(pipe, job)
+        pipe.execute()
+        self._maybe_evict()
+        return job
+
+    def get(self, job_id):
+        data = self.redis.get(self._job_key(job_id))
+        return json.loads(data) if data else None
+
+    def update(self, job_id, fields):
+        key = self._job_key(job_id)
+        result = {}
+
+        def transaction(pipe):
+            data = pipe.get(key)
+            result['job'] = None
+            if not data:
+                return
+            job = json.loads(data)
+            previous_status = job.get('status')
+            job.update(fields)
+            pipe.multi()
+            self._write(pipe, job, previous_status)
+            result['job'] = job
+
+        # WATCH/MULTI retries automatically if another writer touched the key
+        self.redis.transaction(transaction, key)
+        return result['job']
+
+    def delete(self, job_id):
+        job = self.get(job_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(self._job_key(job_id))
+        pipe.zrem(self._index_key(), job_id)
+        if job and job.get('status'):
+            pipe.zrem(self._index_key(job['status']), job_id)
+        pipe.execute()
+
+    def list_jobs(self, status=None, limit=100, offset=0):
+        # Expired ids would otherwise leave holes in the page
+        self._maybe_evict()
+        job_ids = self.redis.zrevrange(self._index_key(status), offset, offset + limit - 1)
+        if not job_ids:
+            return []
+        values = self.redis.mget([self._job_key(job_id) for job_id in job_ids])
+        return [json.loads(value) for value in values if value]
+
+    def count_jobs(self, status=None):
+        self._maybe_evict()
+        return self.redis.zcard(self._index_key(status))
+
+    def job_versions(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.get(self._job_key(job_id))
+            pipe.zrank(self._queue_key(), job_id)
+        results = pipe.execute()
+        versions = {}
+        for job_id, data, rank in zip(job_ids, results[::2], results[1::2]):
+            versions[job_id] = (json.loads(data).get('updated_at'), rank) if data else None
+        return versions
+
+    def evict_expired(self):
+        """
+        Removes index entries whose job record has already expired
+
+        Records expire ttl_seconds after the job finished, so only jobs
+        created before that are checked, EVICTION_BATCH ids per round trip.
+        """
+        removed = 0
+        cutoff = time.time() - self.ttl_seconds
+        for status in FINISHED_STATUSES:
+            index_key = self._index_key(status)
+            job_ids = self.redis.zrangebyscore(index_key, '-inf', cutoff)
+            for start in range(0, len(job_ids), self.EVICTION_BATCH):
+                batch = job_ids[start:start + self.EVICTION_BATCH]
+                pipe = self.redis.pipeline(transaction=False)
+                for job_id in batch:
+                    pipe.exists(self._job_key(job_id))
+                expired = [job_id for job_id, exists in zip(batch, pipe.execute()) if not exists]
+                if expired:
+                    pipe = self.redis.pipeline()
+                    pipe.zrem(index_key, *expired)
+                    pipe.zrem(self._index_key(), *expired)
+                    pipe.execute()
+                    removed += len(expired)
+        return removed
+
+    def _maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_eviction < self.EVICTION_INTERVAL:
+            return
+        self._last_eviction = now
+        try:
+            removed = self.evict_expired()
+            if removed:
+                print(f"[OK] Evicted {removed} expired job(s)")
+        except self._redis_error as e:
+            print(f"[WARNING] Job eviction failed: {e}")
+
+    def enqueue(self, entry):
+        seq = self.redis.incr(self._queue_key('seq'))
+        stored = {'job_id': entry['job_id'], 'priority': entry['priority'], 'seq': seq, 'kwargs': entry['kwargs']}
+        pipe = self.redis.pipeline()
+        pipe.hset(self._queue_key('entries'), entry['job_id'], json.dumps(stored))
+        pipe.zadd(self._queue_key(), {entry['job_id']: entry['priority'] * self.PRIORITY_SCALE + seq})
+        pipe.execute()
+
+    def dequeue(self, job_id):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._queue_key(), job_id)
+        pipe.hdel(self._queue_key('entries'), job_id)
+        return pipe.execute()[0] > 0
+
+    def claim_next(self, worker_id):
+        entry = self._claim_script(
+            keys=[self._queue_key(), self._queue_key('entries'), self._queue_key('claims')],
+            args=[uuid.uuid4().hex, worker_id, time.time()]
+        )
+        return json.loads(entry) if entry else None
+
+    def release(self, job_id, claim):
+        self._release_script(keys=[self._queue_key('claims')], args=[job_id, claim])
+
+    def touch_worker(self, worker_id, slots):
+        now = time.time()
+        self._touch_script(
+            keys=[self._queue_key('claims'), self._queue_key('workers')],
+            args=[worker_id, now, json.dumps({'slots': slots, 'heartbeat': now})]
+        )
+
+    def remove_worker(self, worker_id):
+        self.redis.hdel(self._queue_key('workers'), worker_id)
+
+    def requeue_claims(self, cutoff=None, worker_id=None):
+        entries = self._requeue_script(
+            keys=[self._queue_key('claims'), self._queue_key('entries'), self._queue_key()],
+            args=[cutoff if cutoff is not None else 0, worker_id or '', self.PRIORITY_SCALE]
+        )
+        if cutoff is not None:
+            for stale_id, worker in self.redis.hgetall(self._queue_key('workers')).items():
+                if json.loads(worker)['heartbeat'] < cutoff:
+                    self.redis.hdel(self._queue_key('workers'), stale_id)
+        return [json.loads(entry) for entry in entries]
+
+    def queue_position(self, job_id):
+        rank = self.redis.zrank(self._queue_key(), job_id)
+        return rank + 1 if rank is not None else None
+
+    def queue_stats(self, cutoff):
+        workers = [json.loads(worker) for worker in self.redis.hvals(self._queue_key('workers'))]
+        return {
+            'queued': self.redis.zcard(self._queue_key()),
+            'running': self.redis.hlen(self._queue_key('claims')),
+            'workers': sum(worker['slots'] for worker in workers if worker['heartbeat'] >= cutoff)
+        }
+
+    def queue_job_ids(self):
+        return set(self.redis.hkeys(self._queue_key('entries'))) | set(self.redis.hkeys(self._queue_key('claims')))
+
+
+def create_job_store():
+    """Creates the job store selected by the JOB_STORE_BACKEND environment variable"""
+    backend = os.getenv('JOB_STORE_BACKEND', 'sqlite').lower()
+    ttl_seconds = int(float(os.getenv('JOB_TTL_HOURS', '24')) * 3600)
+
+    if backend == 'sqlite':
+        return SQLiteJobStore(
+            path=os.getenv('JOB_STORE_PATH', 'media/jobs.db'),
+            ttl_seconds=ttl_seconds
+        )
+    if backend == 'redis':
+        return RedisJobStore(
+            url=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            ttl_seconds=ttl_seconds
+        )
+    raise ValueError(f"Unknown job store backend: {backend}")
@@ -0,0 +1,438 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from dotenv import load_dotenv
+import openai
+import anthropic
+from disk_cache import DiskCache, make_cache_key
+from metrics import annotate, record_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Response cache for LLM completions
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+# Deterministic mode forces temperature 0 (and a fixed seed on OpenAI) so
+# identical prompts produce identical, cacheable answers
+LLM_DETERMINISTIC = os.getenv('LLM_DETERMINISTIC', 'false').lower() == 'true'
+LLM_SEED = int(os.getenv('LLM_SEED', '42'))
+
+llm_cache = DiskCache(
+    os.getenv('LLM_CACHE_DIR', 'media/cache/llm'),
+    max_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB', '64')) * 1024 * 1024),
+    ttl_seconds=int(float(os.getenv('LLM_CACHE_TTL_HOURS', '24')) * 3600)
+)
+
+# Requests currently being sent upstream, keyed by cache key
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Retry policy for rate limits/server errors (the SDKs' own retries are disabled)
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1.0'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+# Per-limiter defaults; override with <NAME>_MAX_CONCURRENCY and <NAME>_RPM
+# (e.g. CLAUDE_MAX_CONCURRENCY=4, OPENAI_TTS_RPM=50). RPM 0 = unlimited
+DEFAULT_MAX_CONCURRENCY = {'openai': 8, 'claude': 4, 'openai_tts': 8}
+
+_clients = {}
+_clients_lock = threading.Lock()
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def is_retryable_error(error):
+    """Returns True for rate-limit, timeout and 5xx errors worth retrying"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts carry no status code
+    return type(error).__name__ in ('APIConnectionError', 'APITimeoutError', 'RateLimitError')
+
+
+def get_retry_delay(error, attempt, base=None):
+    """
+    Computes how long to wait before the next attempt
+
+    Honors a Retry-After header when the server sends one, otherwise uses
+    exponential backoff with full jitter.
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    retry_after = headers.get('retry-after') if hasattr(headers, 'get') else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    if base is None:
+        base = LLM_BACKOFF_BASE
+    return random.uniform(0, base * (2 ** attempt))
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing rate_per_minute acquisitions on average"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, rate_per_minute // 6)  # 10s worth of burst
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderLimiter:
+    """Caps concurrent requests (semaphore) and request rate (token bucket) for one API"""
+
+    def __init__(self, max_concurrency, rate_per_minute=0):
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_minute) if rate_per_minute else None
+
+    @contextmanager
+    def slot(self):
+        if self._bucket:
+            self._bucket.acquire()
+        with self._semaphore:
+            yield
+
+
+def get_limiter(name):
+    """Returns the process-wide limiter for an API ('openai', 'claude', 'openai_tts')"""
+    with _limiters_lock:
+        if name not in _limiters:
+            prefix = name.upper()
+            _limiters[name] = ProviderLimiter(
+                max_concurrency=int(os.getenv(f'{prefix}_MAX_CONCURRENCY', str(DEFAULT_MAX_CONCURRENCY.get(name, 4)))),
+                rate_per_minute=int(os.getenv(f'{prefix}_RPM', '0'))
+            )
+        return _limiters[name]
+
+
+def get_client(provider):
+    """
+    Returns the process-wide client for a provider, creating it on first use
+
+    One client per provider keeps a single HTTP connection pool, so jobs
+    reuse keep-alive connections and TLS sessions. OPENAI_BASE_URL and
+    CLAUDE_BASE_URL point the clients at another endpoint (e.g. a local
+    mock server).
+
+    Raises:
+        ValueError: If the provider's API key is not configured
+    """
+    with _clients_lock:
+        if provider not in _clients:
+            if provider == 'openai':
+                api_key = os.getenv('OPENAI_API_KEY')
+                if not api_key:
+                    raise ValueError("OPENAI_API_KEY is not configured")
+                _clients[provider] = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=os.getenv('OPENAI_BASE_URL') or None,
+                    timeout=LLM_TIMEOUT,
+                    max_retries=0  # retried by call_with_retry
+                )
+            elif provider == 'claude':
+                api_key = os.getenv('CLAUDE_API_KEY')
+                if not api_key:
+                    raise ValueError("CLAUDE_API_KEY is not configured")
+                _clients[provider] = anthropic.Anthropic(
+                    api_key=api_key,
+                    base_url=os.getenv('CLAUDE_BASE_URL') or None,
+                    timeout=LLM_TIMEOUT,
+                    max_retries=0  # retried by call_with_retry
+                )
+            else:
+                raise ValueError(f"Unknown provider: {provider}")
+        return _clients[provider]
+
+
+def call_with_retry(limiter_name, fn, *args, max_retries=None, backoff_base=None, **kwargs):
+    """
+    Calls fn under an API's limiter, retrying rate-limit and server errors
+
+    The limiter slot is released while backing off so other requests can
+    use it.
+    """
+    if max_retries is None:
+        max_retries = LLM_MAX_RETRIES
+    limiter = get_limiter(limiter_name)
+    for attempt in range(max_retries + 1):
+        try:
+            with limiter.slot():
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = get_retry_delay(e, attempt, base=backoff_base)
+            print(f"[WARNING] {limiter_name} request failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+def _request_completion(client, provider, model, system, prompt, temperature, max_tokens, cache_system=False):
+    """Sends a chat completion request under the provider's limits and returns the response text"""
+    return call_with_retry(
+        provider, _send_completion,
+        client, provider, model, system, prompt, temperature, max_tokens, cache_system
+    )
+
+
+def _record_usage(provider, usage):
+    """Records the token usage reported by either provider (missing fields are skipped)"""
+    if usage is None:
+        return
+    if provider == 'openai':
+        details = getattr(usage, 'prompt_tokens_details', None)
+        record_tokens(provider, getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+                      getattr(details, 'cached_tokens', None))
+    else:
+        record_tokens(provider, getattr(usage, 'input_tokens', None), getattr(usage, 'output_tokens', None),
+                      getattr(usage, 'cache_read_input_tokens', None))
+
+
+def _send_completion(client, provider, model, system, prompt, temperature, max_tokens, cache_system=False):
+    """Sends a single chat completion request and returns the response text"""
+    if provider == 'openai':
+        # OpenAI API call
+        kwargs = {}
+        if max_tokens:
+            kwargs['max_completion_tokens'] = max_tokens
+        if LLM_DETERMINISTIC:
+            kwargs['seed'] = LLM_SEED
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            **kwargs
+        )
+        _record_usage(provider, getattr(response, 'usage', None))
+        return response.choices[0].message.content.strip()
+
+    elif provider == 'claude':
+        # Claude API call; a static system prompt is marked for prompt caching
+        # (OpenAI caches long shared prefixes automatically)
+        if cache_system:
+            system = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        response = client.messages.create(
+            model=model,
+            max_tokens=max_tokens or 4000,
+            temperature=temperature,
+            system=system,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        _record_usage(provider, getattr(response, 'usage', None))
+        return response.content[0].text.strip()
+
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+def completion_cache_key(provider, model, system, prompt, temperature=0.7, max_tokens=None):
+    """Returns the key complete() and stream_complete() cache a request's answer under"""
+    if LLM_DETERMINISTIC:
+        temperature = 0
+    return make_cache_key('llm', provider, model, system, prompt, temperature, max_tokens)
+
+
+def forget_completion(key):
+    """
+    Drops a cached answer that turned out to be unusable downstream
+
+    Validation only checks the shape of a response; callers that find out
+    later that it is wrong (generated code that fails to import or render)
+    evict it so the next identical request asks the provider again.
+    """
+    if key:
+        llm_cache.delete(key)
+
+
+def complete(client, provider, model, system, prompt, temperature=0.7, max_tokens=None, use_cache=True, validate=None, cache_system=False):
+    """
+    Returns the LLM's answer to a prompt, served from cache when possible
+
+    The cache key covers the system prompt, user prompt, provider, model,
+    temperature and max_tokens. Concurrent calls with the same key share a
+    single upstream request.
+
+    Args:
+        client: OpenAI or Anthropic client instance
+        provider: 'openai' or 'claude'
+        model: Model name
+        system: System prompt
+        prompt: User prompt
+        temperature: Sampling temperature (0 in deterministic mode)
+        max_tokens: Maximum tokens to generate (None = provider default)
+        use_cache: Set to False to always call the provider
+        validate: Optional callable that raises if the response is unusable;
+            invalid responses are never cached
+        cache_system: Ask the provider to cache the system prompt (use for
+            large static system prompts shared across requests)
+
+    Returns:
+        The response text
+    """
+    if LLM_DETERMINISTIC:
+        temperature = 0
+
+    if not (use_cache and LLM_CACHE_ENABLED):
+        return _request_completion(client, provider, model, system, prompt, temperature, max_tokens, cache_system)
+
+    key = completion_cache_key(provider, model, system, prompt, temperature, max_tokens)
+
+    cached = llm_cache.get(key)
+    if cached:
+        print(f"[OK] LLM response served from cache ({provider}/{model})")
+        annotate(llm_cache_hit=True)
+        with open(cached['files']['response.txt'], 'r', encoding='utf-8') as f:
+            return f.read()
+
+    # Join an identical request that is already in flight, or lead a new one
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        print(f"[OK] Waiting on identical in-flight LLM request ({provider}/{model})")
+        return future.result()
+
+    try:
+        text = _request_completion(client, provider, model, system, prompt, temperature, max_tokens, cache_system)
+        if validate:
+            validate(text)
+    except Exception as e:
+        future.set_exception(e)
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        raise
+
+    # Cache before releasing the in-flight slot so no caller slips between the two
+    try:
+        llm_cache.put(key, contents={'response.txt': text}, meta={'provider': provider, 'model': model})
+    except OSError as e:
+        print(f"[WARNING] Could not cache LLM response: {e}")
+    finally:
+        future.set_result(text)
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return text
+
+
+def _stream_completion(client, provider, model, system, prompt, temperature, max_tokens):
+    """Sends a streaming chat completion request and yields the text as it arrives"""
+    if provider == 'openai':
+        kwargs = {}
+        if max_tokens:
+            kwargs['max_completion_tokens'] = max_tokens
+        if LLM_DETERMINISTIC:
+            kwargs['seed'] = LLM_SEED
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            stream=True,
+            stream_options={'include_usage': True},  # usage arrives in the last chunk
+            **kwargs
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, 'usage', None):
+                _record_usage(provider, chunk.usage)
+
+    elif provider == 'claude':
+        with client.messages.stream(
+            model=model,
+            max_tokens=max_tokens or 4000,
+            temperature=temperature,
+            system=system,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+            _record_usage(provider, stream.get_final_message().usage)
+
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+def stream_complete(client, provider, model, system, prompt, temperature=0.7, max_tokens=None, use_cache=True, validate=None):
+    """
+    Like complete(), but yields the response text in chunks as the model writes it
+
+    Cached responses are yielded as a single chunk, and finished responses
+    are validated and cached under the same key complete() uses. Requests
+    are only retried if they fail before the first chunk; identical
+    in-flight streams are not shared.
+    """
+    if LLM_DETERMINISTIC:
+        temperature = 0
+
+    caching = use_cache and LLM_CACHE_ENABLED
+    if caching:
+        key = completion_cache_key(provider, model, system, prompt, temperature, max_tokens)
+        cached = llm_cache.get(key)
+        if cached:
+            print(f"[OK] LLM response served from cache ({provider}/{model})")
+            annotate(llm_cache_hit=True)
+            with open(cached['files']['response.txt'], 'r', encoding='utf-8') as f:
+                yield f.read()
+            return
+
+    chunks = []
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            with get_limiter(provider).slot():
+                for chunk in _stream_completion(client, provider, model, system, prompt, temperature, max_tokens):
+                    chunks.append(chunk)
+                    yield chunk
+            break
+        except Exception as e:
+            # Text already handed to the caller can't be taken back
+            if chunks or attempt >= LLM_MAX_RETRIES or not is_retryable_error(e):
+                raise
+            delay = get_retry_delay(e, attempt)
+            print(f"[WARNING] {provider} stream failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    text = ''.join(chunks).strip()
+    if validate:
+        validate(text)
+    if caching:
+        try:
+            llm_cache.put(key, contents={'response.txt': text}, meta={'provider': provider, 'model': model})
+        except OSError as e:
+            print(f"[WARNING] Could not cache LLM response: {e}")
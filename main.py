@@ -1,7 +1,21 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context, abort
 from flask_cors import CORS
+from werkzeug.security import safe_join
+from urllib.parse import quote
 import os
-from video_generator import start_video_generation, get_job_status
+import re
+import json
+import time
+import mimetypes
+import threading
+from video_generator import (
+    start_video_generation, get_job_status, cancel_job, resume_job, get_job_queue, list_jobs,
+    watch_job
+)
+from job_queue import QueueFullError
+from job_store import FINISHED_STATUSES
+from job_events import job_events
+from metrics import register_gauge, render_metrics
 
 app = Flask(__name__, 
             static_folder='frontend',
@@ -10,6 +24,31 @@ CORS(app)
 
 # Ensure media directory exists
 os.makedirs('media', exist_ok=True)
+MEDIA_DIR = os.path.abspath('media')
+
+# Published job videos carry their content hash, so new bytes always get a new URL
+IMMUTABLE_MEDIA_PATTERN = re.compile(r'^output_[0-9a-f-]{36}(_preview)?\.[0-9a-f]{16}\.mp4$')
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+# Hand media transfers to a fronting server: off, x-accel (nginx) or x-sendfile (Apache, lighttpd)
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', 'off').lower()
+# Internal nginx location that serves the media directory (MEDIA_OFFLOAD=x-accel)
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/internal-media/')
+app.config['USE_X_SENDFILE'] = MEDIA_OFFLOAD == 'x-sendfile'
+
+# Seconds between keep-alive comments on idle progress streams
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+# Progress streams open at once in this process; each holds a server thread, so
+# keep this below the thread count (API_THREADS) to leave room for other requests.
+# Viewers above the limit get a 503 and fall back to polling
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '48'))
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+# Load gauges, read on every /metrics scrape
+register_gauge('topic2manim_jobs', 'Jobs waiting in the queue or running, by state',
+               lambda: {state: count for state, count in get_job_queue().stats().items()
+                        if state in ('queued', 'running')}, label='state')
+register_gauge('topic2manim_job_workers', 'Job queue worker threads (across all worker processes)',
+               lambda: get_job_queue().stats()['workers'])
 
 
 @app.route('/')
@@ -30,16 +69,25 @@ def generate_video():
         
         llm_provider = data.get('llm_provider', 'auto')
         enable_tts = data.get('enable_tts', True)
+        priority = data.get('priority', 'normal')
+        render_profile = data.get('render_profile')
         
-        # Start video generation
-        job_id = start_video_generation(topic, enable_tts, llm_provider)
+        # Queue video generation
+        job_id, queue_position = start_video_generation(topic, enable_tts, llm_provider, priority, render_profile)
         
         return jsonify({
             'job_id': job_id,
             'status': 'queued',
-            'message': 'Video generation started'
+            'queue_position': queue_position,
+            'message': 'Video generation queued'
         }), 202
         
+    except QueueFullError as e:
+        return jsonify({'error': str(e), 'queue': get_job_queue().stats()}), 429
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -55,10 +103,134 @@ def get_progress(job_id):
     return jsonify(job)
 
 
+@app.route('/api/progress/<job_id>/stream', methods=['GET'])
+def stream_progress(job_id):
+    """Stream job progress as Server-Sent Events"""
+    if not get_job_status(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if not _stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many progress streams, poll /api/progress instead'})
+        response.headers['Retry-After'] = str(SSE_HEARTBEAT_SECONDS)
+        return response, 503
+    
+    def event_stream():
+        last_sent = None
+        with watch_job(job_id):
+            while True:
+                # Read the version before the job so no change can slip in between
+                version = job_events.version(job_id)
+                job = get_job_status(job_id)
+                if not job:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                
+                # Queue position changes without touching the job record
+                current = (job.get('updated_at'), job.get('queue_position'))
+                if current != last_sent:
+                    last_sent = current
+                    yield f"data: {json.dumps(job)}\n\n"
+                
+                if job.get('status') in FINISHED_STATUSES:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                
+                # Block until the job changes: update_job_status signals changes made
+                # in this process, watch_job those made by worker processes
+                while job_events.wait(job_id, version, timeout=SSE_HEARTBEAT_SECONDS) == version:
+                    yield ": keep-alive\n\n"
+    
+    response = Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+        }
+    )
+    # Runs when the server is done with the response, even if the stream never started
+    response.call_on_close(_stream_slots.release)
+    return response
+
+
+@app.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    """List jobs for operations, optionally filtered by status"""
+    status = request.args.get('status')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    offset = request.args.get('offset', 0, type=int)
+    
+    return jsonify(list_jobs(status=status, limit=limit, offset=offset))
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_generation(job_id):
+    """Cancel a queued or running job"""
+    if not cancel_job(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    
+    return jsonify(get_job_status(job_id))
+
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_generation(job_id):
+    """Resume a failed or cancelled job from its last completed stage"""
+    try:
+        queue_position = resume_job(job_id)
+    except QueueFullError as e:
+        return jsonify({'error': str(e), 'queue': get_job_queue().stats()}), 429
+    
+    if queue_position is None:
+        return jsonify({'error': 'Job not found or not resumable'}), 404
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'queue_position': queue_position,
+        'message': 'Video generation resumed'
+    }), 202
+
+
 @app.route('/media/<path:filename>')
 def serve_media(filename):
-    """Serve generated media files"""
-    return send_from_directory('media', filename)
+    """
+    Serve generated media files
+    
+    Range and conditional requests (If-None-Match, If-Modified-Since) are
+    answered with 206/304 against a strong ETag, so seeking doesn't
+    re-download the video. Published job videos carry their content hash in
+    the name and are cached as immutable; everything else must be
+    revalidated. With MEDIA_OFFLOAD the transfer
+    itself is handed to the fronting server.
+    """
+    path = safe_join(MEDIA_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    
+    if MEDIA_OFFLOAD == 'x-accel':
+        # nginx serves the body, ranges and validators from the internal location
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+    else:
+        # Size and mtime change whenever the bytes do (files are replaced, not edited)
+        stat = os.stat(path)
+        response = send_from_directory(
+            MEDIA_DIR, filename,
+            conditional=True,
+            etag=f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+        )
+    
+    if IMMUTABLE_MEDIA_PATTERN.match(filename):
+        response.headers['Cache-Control'] = f'public, max-age={MEDIA_CACHE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: per-stage histograms, LLM tokens, queue and scheduler load"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/api/health', methods=['GET'])
@@ -78,7 +250,13 @@ if __name__ == '__main__':
     print("Access the web interface at: http://localhost:5000")
     print("=" * 80)
     print("\nNOTE: Auto-reload is disabled to prevent job state loss during video generation")
-    print("      Restart the server manually if you make code changes.\n")
+    print("      Restart the server manually if you make code changes.")
+    print("      This is the development server; in production run the API with")
+    print("      gunicorn -c gunicorn.conf.py wsgi:app and the jobs with worker.py\n")
+    
+    # Start job workers and re-queue jobs left over from a previous run. Not at
+    # import time: render processes and other importers must not start a queue
+    get_job_queue()
     
     app.run(
         host='0.0.0.0',
@@ -2,67 +2,20 @@ import json
 import re
 import os
 from dotenv import load_dotenv
+from llm_client import complete, completion_cache_key
+from animations import parse_json_response
+from metrics import traced, annotate
 
 # Load environment variables
 load_dotenv()
 
-def generate_manim_code(client, text, animation, index, previous_context=None, provider='openai', model='gpt-4o', audio_duration=None):
-    """Generates Manim code using the LLM with previous scene context and audio duration"""
-    
-    # Build context section if it exists
-    context_section = ""
-    if previous_context:
-        context_section = f"""
-PREVIOUS SCENE CONTEXT (to maintain continuity):
-- Previous text: {previous_context.get('text', 'N/A')}
-- Previous animation: {previous_context.get('animation', 'N/A')}
-- Previous generated code:
-```python
-{previous_context.get('code', 'N/A')}
-```
+# Output token cap for one batched code generation request
+CODEGEN_BATCH_MAX_TOKENS = int(os.getenv('CODEGEN_BATCH_MAX_TOKENS', '16000'))
 
-IMPORTANT: Maintain visual and narrative coherence with the previous scene.
-If the previous scene ended with certain elements or style, consider that when designing this scene.
-"""
-    else:
-        context_section = """
-CONTEXT: This is the FIRST scene of the video.
-"""
-    
-    # Add audio duration information if available
-    duration_section = ""
-    if audio_duration:
-        duration_section = f"""
-CRITICAL AUDIO SYNCHRONIZATION:
-- This scene has an audio narration that lasts EXACTLY {audio_duration:.2f} seconds
-- Your animation MUST last EXACTLY {audio_duration:.2f} seconds (not more, not less)
-- Calculate your animation timings to match this duration:
-  * Use self.wait() strategically to fill the time
-  * Adjust run_time parameters in animations to fit within {audio_duration:.2f}s
-  * The total of all animation run_times + wait times MUST equal {audio_duration:.2f}s
-- Example timing breakdown for {audio_duration:.2f}s:
-  * If you have 3 animations, each could be ~{audio_duration/3:.2f}s
-  * Include small waits between animations for better pacing
-"""
-    else:
-        duration_section = """
-TIMING GUIDANCE:
-- This scene should last approximately 6-8 seconds
-- Use short run_time in animations (0.5-1.5 seconds)
-- Minimize use of self.wait() (maximum 0.5-1 second)
-"""
-    
-    prompt = f"""{context_section}
-
-Generate Python code for Manim that implements this educational animation.
-
-CURRENT CONTENT:
-- Narrative text: {text}
-- Animation description: {animation}
-
-{duration_section}
-
-IMPORTANT TECHNICAL RESTRICTIONS:
+# Static rules shared by every code generation request. They live in the
+# system prompt so providers can cache them (Claude cache_control, OpenAI
+# automatic prefix caching) instead of re-reading them for every scene.
+MANIM_RULES = """IMPORTANT TECHNICAL RESTRICTIONS:
 1. The class MUST inherit from Scene (not MovingCameraScene, not ThreeDScene)
 2. DO NOT use self.camera.frame (doesn't exist in Scene)
 3. For zoom, use: object.animate.scale(factor) instead of camera.frame
@@ -178,8 +131,107 @@ class ClassName(Scene):
         self.wait(1)
         # Clean before next element
         self.play(FadeOut(text))
+```"""
+
+SYSTEM_PROMPT = (
+    "You are an expert in Manim Community Edition (v0.19.1). You generate simple, functional Python code without errors. "
+    "NEVER use self.camera.frame in Scene. Always respond in valid JSON format.\n\n"
+    "Follow these rules in all code you write:\n\n" + MANIM_RULES
+)
+
+@traced('code')
+def generate_manim_code(client, text, animation, index, previous_context=None, provider='openai', model='gpt-4o', audio_duration=None, repair_context=None):
+    """
+    Generates Manim code using the LLM with previous scene context and audio duration
+    
+    When repair_context ({'code', 'error'}) is given, the LLM is asked to fix
+    a previous attempt that failed to compile instead of starting over.
+    
+    Returns:
+        {'content', 'class_name', 'cache_key'} or None; cache_key identifies the
+        cached answer (None for repairs) so code that fails later can be evicted
+    """
+    annotate(scene=index, repair=repair_context is not None)
+    
+    # Build context section if it exists
+    context_section = ""
+    if previous_context:
+        # Code is optional: scenes generated in parallel only know the
+        # previous scene's script, not its compiled source
+        previous_code_section = ""
+        if previous_context.get('code'):
+            previous_code_section = f"""- Previous generated code:
+```python
+{previous_context.get('code')}
+```
+"""
+        context_section = f"""
+PREVIOUS SCENE CONTEXT (to maintain continuity):
+- Previous text: {previous_context.get('text', 'N/A')}
+- Previous animation: {previous_context.get('animation', 'N/A')}
+{previous_code_section}
+IMPORTANT: Maintain visual and narrative coherence with the previous scene.
+If the previous scene ended with certain elements or style, consider that when designing this scene.
+"""
+    else:
+        context_section = """
+CONTEXT: This is the FIRST scene of the video.
+"""
+    
+    # Add audio duration information if available
+    duration_section = ""
+    if audio_duration:
+        duration_section = f"""
+CRITICAL AUDIO SYNCHRONIZATION:
+- This scene has an audio narration that lasts EXACTLY {audio_duration:.2f} seconds
+- Your animation MUST last EXACTLY {audio_duration:.2f} seconds (not more, not less)
+- Calculate your animation timings to match this duration:
+  * Use self.wait() strategically to fill the time
+  * Adjust run_time parameters in animations to fit within {audio_duration:.2f}s
+  * The total of all animation run_times + wait times MUST equal {audio_duration:.2f}s
+- Example timing breakdown for {audio_duration:.2f}s:
+  * If you have 3 animations, each could be ~{audio_duration/3:.2f}s
+  * Include small waits between animations for better pacing
+"""
+    else:
+        duration_section = """
+TIMING GUIDANCE:
+- This scene should last approximately 6-8 seconds
+- Use short run_time in animations (0.5-1.5 seconds)
+- Minimize use of self.wait() (maximum 0.5-1 second)
+"""
+    
+    # Fix-up section for a previous attempt that failed to compile
+    repair_section = ""
+    if repair_context:
+        repair_section = f"""
+PREVIOUS ATTEMPT FAILED:
+Your previous code for this scene raised an error. Fix the error and return the
+complete corrected code. Keep the same animation, change only what is needed.
+
+Failing code:
+```python
+{repair_context.get('code', '')}
 ```
 
+Error:
+```
+{repair_context.get('error', '')}
+```
+"""
+    
+    prompt = f"""{context_section}
+
+Generate Python code for Manim that implements this educational animation.
+
+CURRENT CONTENT:
+- Narrative text: {text}
+- Animation description: {animation}
+
+{duration_section}
+{repair_section}
+Follow every rule from the system prompt (technical restrictions, colors, text overlap and width).
+
 RESPONSE FORMAT (JSON):
 {{
   "content": "complete Python code here (use single quotes inside the code)",
@@ -193,44 +245,134 @@ IMPORTANT:
 - ALWAYS clean old elements before showing new ones
 """
     
+    max_tokens = 4000 if provider == 'claude' else None
     try:
-        if provider == 'openai':
-            # OpenAI API call
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are an expert in Manim Community Edition (v0.19.1). You generate simple, functional Python code without errors. NEVER use self.camera.frame in Scene. Always respond in valid JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5  # Reduced for more consistency
-            )
-            response_text = response.choices[0].message.content.strip()
-            
-        elif provider == 'claude':
-            # Claude API call
-            response = client.messages.create(
-                model=model,
-                max_tokens=4000,
-                temperature=0.5,
-                system="You are an expert in Manim Community Edition (v0.19.1). You generate simple, functional Python code without errors. NEVER use self.camera.frame in Scene. Always respond in valid JSON format.",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            response_text = response.content[0].text.strip()
-        
-        else:
-            raise ValueError(f"Unknown provider: {provider}")
+        response_text = complete(
+            client, provider, model, SYSTEM_PROMPT, prompt,
+            temperature=0.5,  # Reduced for more consistency
+            max_tokens=max_tokens,
+            # A cached answer to a repair prompt would repeat the same mistake
+            use_cache=repair_context is None,
+            validate=parse_json_response,
+            cache_system=True
+        )
         
-        # Try to extract JSON if wrapped in markdown
-        if "```json" in response_text:
-            response_text = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL).group(1)
-        elif "```" in response_text:
-            response_text = re.search(r'```\s*(.*?)\s*```', response_text, re.DOTALL).group(1)
-        
-        result = json.loads(response_text)
+        result = parse_json_response(response_text)
+        result['cache_key'] = None if repair_context else \
+            completion_cache_key(provider, model, SYSTEM_PROMPT, prompt, 0.5, max_tokens)
         return result
         
     except Exception as e:
         print(f"Error generating code for scene {index}: {e}")
         return None
+
+
+def parse_batch_response(response_text):
+    """Parses a batched code response into a list of {'index', 'content', 'class_name'} dicts"""
+    result = parse_json_response(response_text)
+    scenes = result.get('scenes') if isinstance(result, dict) else result
+    if not isinstance(scenes, list):
+        raise ValueError("Batched response has no 'scenes' list")
+    return scenes
+
+
+@traced('code_batch')
+def generate_manim_code_batch(client, scenes, previous_context=None, provider='openai', model='gpt-4o'):
+    """
+    Generates Manim code for several scenes in a single LLM request
+    
+    Args:
+        scenes: List of dicts with 'index', 'text', 'animation' and optional 'audio_duration'
+        previous_context: Optional {'text', 'animation'} of the scene before the batch
+    
+    Returns:
+        Dict mapping scene index to {'content', 'class_name', 'cache_key'};
+        scenes missing from the response are left out (empty dict on failure).
+        Every scene shares the batch's cache_key
+    """
+    annotate(scenes=len(scenes))
+    context_section = ""
+    if previous_context:
+        context_section = f"""
+PREVIOUS SCENE CONTEXT (to maintain continuity):
+- Previous text: {previous_context.get('text', 'N/A')}
+- Previous animation: {previous_context.get('animation', 'N/A')}
+"""
+    
+    scene_sections = []
+    for scene in scenes:
+        audio_duration = scene.get('audio_duration')
+        if audio_duration:
+            timing = (f"The audio narration lasts EXACTLY {audio_duration:.2f} seconds; the total of all "
+                      f"run_times and waits MUST equal {audio_duration:.2f}s")
+        else:
+            timing = "About 6-8 seconds; short run_times (0.5-1.5s), waits of at most 0.5-1s"
+        scene_sections.append(f"""SCENE {scene['index']}:
+- Narrative text: {scene.get('text', '')}
+- Animation description: {scene.get('animation', '')}
+- Timing: {timing}""")
+    scene_list = "\n\n".join(scene_sections)
+    
+    prompt = f"""{context_section}
+Generate Python code for Manim for each of the following {len(scenes)} consecutive scenes of one
+educational video. Each scene is a separate, self-contained file with its own class. Keep the visual
+style consistent from one scene to the next.
+
+{scene_list}
+
+Follow every rule from the system prompt (technical restrictions, colors, text overlap and width).
+
+RESPONSE FORMAT (JSON):
+{{
+  "scenes": [
+    {{
+      "index": scene number as given above,
+      "content": "complete Python code here (use single quotes inside the code)",
+      "class_name": "ClassName"
+    }}
+  ]
+}}
+
+IMPORTANT: 
+- Return one entry per scene, in order, with UNIQUE class names
+- Every "content" must start with: from manim import *
+- The code must be executable without errors
+- Escape quotes correctly in the JSON
+"""
+    
+    indices = ', '.join(str(scene['index']) for scene in scenes)
+    max_tokens = min(4000 * len(scenes), CODEGEN_BATCH_MAX_TOKENS)
+    cache_key = completion_cache_key(provider, model, SYSTEM_PROMPT, prompt, 0.5, max_tokens)
+    try:
+        response_text = complete(
+            client, provider, model, SYSTEM_PROMPT, prompt,
+            temperature=0.5,
+            max_tokens=max_tokens,
+            validate=parse_batch_response,
+            cache_system=True
+        )
+        
+        requested = [scene['index'] for scene in scenes]
+        entries = [entry for entry in parse_batch_response(response_text)
+                   if isinstance(entry, dict) and entry.get('content')]
+        results = {}
+        for position, entry in enumerate(entries):
+            try:
+                index = int(entry.get('index'))
+            except (TypeError, ValueError):
+                index = None
+            if index not in requested:
+                # Renumbered or missing index: match the entry by its position
+                if position >= len(requested):
+                    continue
+                index = requested[position]
+            results[index] = {
+                'content': entry['content'],
+                'class_name': entry.get('class_name') or f'Scene{index}',
+                'cache_key': cache_key
+            }
+        return results
+        
+    except Exception as e:
+        print(f"Error generating code for scenes {indices}: {e}")
+        return {}
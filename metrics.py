@@ -0,0 +1,328 @@
+import os
+import time
+import bisect
+import itertools
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+
+# Spans kept per job on its record (oldest are dropped first)
+METRICS_MAX_JOB_SPANS = int(os.getenv('METRICS_MAX_JOB_SPANS', '500'))
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+RSS_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+# Span attributes that accumulate over a span, and the one that keeps its maximum
+_SUMMED_ATTRIBUTES = {'bytes', 'cpu_seconds', 'tokens_in', 'tokens_out', 'tokens_cached'}
+_MAX_ATTRIBUTES = {'peak_rss'}
+
+_current_job = contextvars.ContextVar('metrics_current_job', default=None)
+_pass_ids = itertools.count(1)
+_current_span = contextvars.ContextVar('metrics_current_span', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return f'{value:.10g}' if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in the Prometheus text format"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i in range(position, len(self.buckets)):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        samples = []
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets + (float('inf'),), values[:len(self.buckets)] + [values[-1]]):
+                labels = _format_labels(self.labels, key, [('le', _format_value(float(bound)))])
+                samples.append((f'{self.name}_bucket', labels, count))
+            labels = _format_labels(self.labels, key)
+            samples.append((f'{self.name}_sum', labels, values[-2]))
+            samples.append((f'{self.name}_count', labels, values[-1]))
+        return samples
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time (returns a number or {label value: number})"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, description, read, label=None):
+        self.name = name
+        self.description = description
+        self.read = read
+        self.label = label
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"[WARNING] Could not read metric {self.name}: {e}")
+            return []
+        if isinstance(value, dict):
+            return [(self.name, _format_labels((self.label,), (key,)), item) for key, item in sorted(value.items())]
+        return [(self.name, '', value)]
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them for /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry scraped by the /metrics endpoint
+registry = MetricsRegistry()
+
+stage_duration = registry.register(Histogram(
+    'topic2manim_stage_duration_seconds', 'Wall time of each pipeline stage', ('stage', 'status')
+))
+stage_cpu = registry.register(Histogram(
+    'topic2manim_stage_cpu_seconds', 'CPU time of the child processes a stage ran (sampled)', ('stage',)
+))
+stage_peak_rss = registry.register(Histogram(
+    'topic2manim_stage_peak_rss_bytes', 'Peak resident memory of the child processes a stage ran',
+    ('stage',), buckets=RSS_BUCKETS
+))
+stage_bytes = registry.register(Counter(
+    'topic2manim_stage_bytes_total', 'Bytes written by each pipeline stage', ('stage',)
+))
+llm_tokens = registry.register(Counter(
+    'topic2manim_llm_tokens_total', 'LLM tokens used, by provider and token type', ('provider', 'type')
+))
+
+
+class JobSpans:
+    """
+    Finished spans grouped by job pass until they are attached to the job record
+
+    Keys come from job_context, so two passes of one job (a preview still
+    wrapping up while its final render starts) never take each other's spans.
+    """
+
+    def __init__(self, max_spans=METRICS_MAX_JOB_SPANS):
+        self.max_spans = max_spans
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, span):
+        with self._lock:
+            spans = self._spans.setdefault(key, [])
+            spans.append(span)
+            del spans[:-self.max_spans]
+
+    def pop(self, key):
+        with self._lock:
+            return self._spans.pop(key, [])
+
+
+job_spans = JobSpans()
+
+
+@contextmanager
+def job_context(job_id):
+    """
+    Attributes every span opened in this context (and contexts copied from it) to a job
+
+    Yields:
+        The key of this pass's spans in job_spans
+    """
+    key = (job_id, next(_pass_ids))
+    token = _current_job.set(key)
+    try:
+        yield key
+    finally:
+        _current_job.reset(token)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Times a pipeline stage and records it
+
+    The duration goes into the stage histograms and, inside a job_context,
+    the span is kept for the job record. Code running inside the span adds
+    tokens, bytes and child-process CPU/RSS to it with annotate().
+
+    Yields:
+        The span dict (stage, started_at, duration, status and attributes)
+    """
+    record = {'stage': stage, 'started_at': round(time.time(), 3), **attributes}
+    token = _current_span.set(record)
+    started_at = time.perf_counter()
+    status = 'error'
+    try:
+        yield record
+        status = record.get('status', 'ok')
+    finally:
+        _current_span.reset(token)
+        record['duration'] = round(time.perf_counter() - started_at, 4)
+        record['status'] = status
+        _record_span(record)
+
+
+def traced(stage, succeeded=bool):
+    """
+    Decorator form of span(): every call is one span of the given stage
+
+    Functions that report failure through their return value instead of
+    raising are marked as errors when succeeded(result) is false.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage) as record:
+                result = fn(*args, **kwargs)
+                if not succeeded(result):
+                    record['status'] = 'error'
+                return result
+        return wrapper
+    return decorator
+
+
+def _record_span(record):
+    stage = record['stage']
+    stage_duration.observe(record['duration'], stage=stage, status=record['status'])
+    if record.get('cpu_seconds') is not None:
+        stage_cpu.observe(record['cpu_seconds'], stage=stage)
+    if record.get('peak_rss'):
+        stage_peak_rss.observe(record['peak_rss'], stage=stage)
+    if record.get('bytes'):
+        stage_bytes.inc(record['bytes'], stage=stage)
+
+    key = _current_job.get()
+    if key:
+        job_spans.add(key, record)
+
+
+def annotate(**values):
+    """
+    Adds measurements to the innermost open span (no-op outside a span)
+
+    Tokens, bytes and cpu_seconds are summed and peak_rss keeps the
+    maximum; other values (scene, cache_hit, ...) replace the previous one.
+    """
+    record = _current_span.get()
+    if record is None:
+        return
+    for name, value in values.items():
+        if value is None:
+            continue
+        if name in _MAX_ATTRIBUTES:
+            record[name] = max(record.get(name) or 0, value)
+        elif name in _SUMMED_ATTRIBUTES:
+            record[name] = round((record.get(name) or 0) + value, 4)
+        else:
+            record[name] = value
+
+
+def annotate_file(path):
+    """Adds the size of a written file to the current span's bytes"""
+    try:
+        annotate(bytes=os.path.getsize(path))
+    except OSError:
+        pass
+
+
+def record_tokens(provider, input_tokens=None, output_tokens=None, cached_tokens=None):
+    """Counts an LLM call's token usage and adds it to the current span"""
+    for token_type, count in (('input', input_tokens), ('output', output_tokens), ('cached', cached_tokens)):
+        if count:
+            llm_tokens.inc(count, provider=provider, type=token_type)
+    annotate(tokens_in=input_tokens, tokens_out=output_tokens, tokens_cached=cached_tokens)
+
+
+def propagate_context(fn):
+    """
+    Wraps fn to run in a copy of the caller's context
+
+    Thread pools don't carry context variables over, so work submitted
+    with pool.submit(propagate_context(fn), ...) still belongs to the
+    caller's job and span.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def register_gauge(name, description, read, label=None):
+    """Registers a gauge read at scrape time (see Gauge)"""
+    return registry.register(Gauge(name, description, read, label=label))
+
+
+def render_metrics():
+    return registry.render()
@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import threading
+
+
+# Historical stage timings used to weight progress and estimate completion
+PROGRESS_STATS_FILE = os.getenv('PROGRESS_STATS_FILE', 'media/progress_stats.json')
+# Weight of the newest job in the moving averages (0-1)
+PROGRESS_STATS_ALPHA = float(os.getenv('PROGRESS_STATS_ALPHA', '0.2'))
+
+# Progress never reaches 100% before the job is actually published
+MAX_RUNNING_PROGRESS = 99.0
+
+# Priors used until jobs of a kind have finished (seconds; *_per_scene are per scene)
+DEFAULT_TIMINGS = {
+    'script': 25.0,
+    'tts_per_scene': 2.0,
+    'scenes_per_scene': 8.0,
+    'finalize': 8.0,
+    'code_share': 0.4,
+    'scene_count': 7
+}
+# Renders above preview quality take longer; scales the scene prior of final passes
+PROFILE_RENDER_FACTORS = {'preview': 1.0, 'medium': 2.0, 'high': 4.0, '4k': 10.0}
+
+
+def pass_phases(render_pass='preview', tts=True, streaming=False):
+    """
+    Phases of a job pass, in order
+
+    Args:
+        render_pass: 'preview' or 'final'
+        tts: Whether narration is generated
+        streaming: Whether the script is streamed (TTS then overlaps the script)
+    """
+    if render_pass == 'final':
+        return ['scenes', 'finalize']
+    return ['script'] + (['tts'] if tts and not streaming else []) + ['scenes', 'finalize']
+
+
+def expected_phase_seconds(timings, scene_count):
+    """Expected duration of every phase for a pass with scene_count scenes"""
+    return {
+        'script': timings['script'],
+        'tts': timings['tts_per_scene'] * scene_count,
+        'scenes': timings['scenes_per_scene'] * scene_count,
+        'finalize': timings['finalize']
+    }
+
+
+def _stats_keys(render_pass, provider, profile, scenes=None):
+    """Stats levels from most to least specific"""
+    keys = [f"{render_pass}/{provider}/{profile}", f"{render_pass}/{profile}", render_pass]
+    if scenes:
+        keys.insert(0, f"{render_pass}/{provider}/{profile}/{scenes}")
+    return keys
+
+
+class ProgressStats:
+    """
+    Moving averages of stage timings, persisted to a JSON file
+
+    Timings are kept at several levels (pass, provider, render profile and
+    scene count) and each estimate takes every field from the most specific
+    level that has seen a job, falling back to DEFAULT_TIMINGS. The file
+    is re-read when another process (a job worker) has rewritten it.
+    """
+
+    def __init__(self, path=PROGRESS_STATS_FILE, alpha=PROGRESS_STATS_ALPHA):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._levels = {}
+        self._mtime = None
+        self._reload()
+
+    def _reload(self):
+        """Loads the stats file if it changed since it was last read or written (caller holds the lock)"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return
+        if mtime is None or mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._levels = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Ignoring unreadable progress stats {self.path}: {e}")
+        self._mtime = mtime
+
+    def estimate(self, render_pass, provider, profile, scenes=None):
+        """
+        Returns the expected timings for a job pass
+
+        Returns:
+            Dict with the DEFAULT_TIMINGS fields
+        """
+        timings = dict(DEFAULT_TIMINGS)
+        if render_pass == 'final':
+            # The final pass re-renders checkpointed code: no script, audio or codegen
+            timings.update(script=0.0, tts_per_scene=0.0, code_share=0.0)
+            timings['scenes_per_scene'] *= PROFILE_RENDER_FACTORS.get(profile, 1.0)
+        with self._lock:
+            self._reload()
+            for key in reversed(_stats_keys(render_pass, provider, profile, scenes)):
+                timings.update(self._levels.get(key, {}).get('timings', {}))
+        return timings
+
+    def record(self, render_pass, provider, profile, scenes, observed):
+        """Folds the timings observed in a finished pass into every matching level"""
+        with self._lock:
+            self._reload()
+            for key in _stats_keys(render_pass, provider, profile, scenes):
+                level = self._levels.setdefault(key, {'jobs': 0, 'timings': {}})
+                for name, value in observed.items():
+                    previous = level['timings'].get(name)
+                    level['timings'][name] = value if previous is None else \
+                        round(previous + self.alpha * (value - previous), 3)
+                level['jobs'] += 1
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._levels, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            print(f"[WARNING] Could not save progress stats: {e}")
+
+
+class ProgressTracker:
+    """
+    Time-weighted progress and ETA for one pass of a job
+
+    The pass is a sequence of phases (script, tts, scenes, finalize) whose
+    expected durations come from ProgressStats, read once per phase and
+    scene count. Progress is elapsed time
+    over elapsed plus estimated remaining time. Inside the scenes phase,
+    scenes report when their code is generated and when they are rendered,
+    and the remaining time blends the prior with the observed rate.
+    """
+
+    def __init__(self, stats, provider, profile, render_pass='preview', tts=True, streaming=False, learn=True):
+        """
+        Args:
+            stats: ProgressStats to read priors from and record into
+            provider: LLM provider of the job
+            profile: Render profile of this pass
+            render_pass: 'preview' or 'final'
+            tts: Whether narration is generated in its own phase
+            streaming: Whether the script is streamed (TTS overlaps the script)
+            learn: Record this pass's timings when it finishes (off for resumed jobs)
+        """
+        self.stats = stats
+        self.provider = provider
+        self.profile = profile
+        self.render_pass = render_pass
+        self.learn = learn
+        self.phases = pass_phases(render_pass, tts, streaming)
+        self.scene_count = None
+        self.scenes = {}  # scene index -> {'started', 'coded', 'done'} timestamps
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._phase_started = {}
+        self._phase_durations = {}
+        self._current = None
+        self._progress = 0.0
+        self._timings = None  # stats estimate for the current phase and scene count
+        self.start_phase(self.phases[0])
+
+    def start_phase(self, phase):
+        """Ends the current phase (and any skipped ones before phase) and starts phase"""
+        if phase not in self.phases:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._current == phase:
+                return
+            if self._current is not None:
+                self._phase_durations[self._current] = now - self._phase_started[self._current]
+            for skipped in self.phases[:self.phases.index(phase)]:
+                self._phase_durations.setdefault(skipped, 0.0)
+            self._current = phase
+            self._phase_started[phase] = now
+            # Pick up timings other jobs recorded meanwhile
+            self._timings = None
+
+    def set_scene_count(self, count):
+        with self._lock:
+            if count != self.scene_count:
+                self.scene_count = count
+                self._timings = None
+
+    def scene_started(self, index):
+        with self._lock:
+            self.scenes.setdefault(index, {'started': time.monotonic()})
+
+    def scene_coded(self, index):
+        with self._lock:
+            self.scenes.setdefault(index, {'started': time.monotonic()}).setdefault('coded', time.monotonic())
+
+    def scene_done(self, index):
+        """Marks a scene rendered (or dropped): its share of the scenes phase is complete"""
+        with self._lock:
+            self.scenes.setdefault(index, {'started': time.monotonic()}).setdefault('done', time.monotonic())
+
+    def _scene_fraction(self, code_share, scene_count):
+        done = 0.0
+        for scene in self.scenes.values():
+            if 'done' in scene:
+                done += 1.0
+            elif 'coded' in scene:
+                done += code_share
+        return min(done / scene_count, 1.0)
+
+    def status(self):
+        """
+        Returns the fields to store on the job record
+
+        Returns:
+            Dict with progress (0-99), eta_seconds and eta_at (epoch seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            scene_count = self.scene_count or max(len(self.scenes), 1)
+            if self._timings is None:
+                self._timings = self.stats.estimate(self.render_pass, self.provider, self.profile,
+                                                    self.scene_count)
+            timings = self._timings
+            if not self.scene_count:
+                scene_count = max(scene_count, int(timings['scene_count']))
+            expected = expected_phase_seconds(timings, scene_count)
+            fraction = self._scene_fraction(timings['code_share'], scene_count)
+
+            remaining = 0.0
+            for phase in self.phases:
+                if phase in self._phase_durations and phase != self._current:
+                    continue
+                if phase == 'scenes':
+                    prior = expected['scenes'] * (1 - fraction)
+                    elapsed = now - self._phase_started['scenes'] if phase == self._current else 0.0
+                    if elapsed > 0 and fraction > 0:
+                        # Trust the observed rate more as more scenes finish
+                        observed = elapsed * (1 - fraction) / fraction
+                        prior = (1 - fraction) * prior + fraction * observed
+                    remaining += prior
+                elif phase == self._current:
+                    elapsed = now - self._phase_started[phase]
+                    # An overrunning phase is expected to end soon, not never
+                    remaining += max(expected[phase] - elapsed, expected[phase] * 0.1)
+                else:
+                    remaining += expected[phase]
+
+            total_elapsed = now - self._started_at
+            progress = 100.0 * total_elapsed / (total_elapsed + remaining) if total_elapsed + remaining else 0.0
+            # Estimates move both ways; the bar only moves forward
+            self._progress = min(max(self._progress, progress), MAX_RUNNING_PROGRESS)
+            return {
+                'progress': round(self._progress, 1),
+                'eta_seconds': round(remaining),
+                'eta_at': round(time.time() + remaining, 1)
+            }
+
+    def finish(self):
+        """Closes the last phase and records the pass's timings in the stats"""
+        with self._lock:
+            if self._current is not None:
+                self._phase_durations[self._current] = time.monotonic() - self._phase_started[self._current]
+                self._current = None
+            scene_count = self.scene_count or len(self.scenes)
+            if not self.learn or not scene_count:
+                return
+            durations = self._phase_durations
+            observed = {'scene_count': scene_count, 'finalize': durations.get('finalize', 0.0)}
+            if 'script' in self.phases:
+                observed['script'] = durations.get('script', 0.0)
+            if 'tts' in self.phases:
+                observed['tts_per_scene'] = durations.get('tts', 0.0) / scene_count
+            observed['scenes_per_scene'] = durations.get('scenes', 0.0) / scene_count
+
+            # Share of a scene's time spent before its code was ready
+            shares = [
+                (scene['coded'] - scene['started']) / (scene['done'] - scene['started'])
+                for scene in self.scenes.values()
+                if 'coded' in scene and 'done' in scene and scene['done'] > scene['started']
+            ]
+            if shares and self.render_pass != 'final':
+                observed['code_share'] = sum(shares) / len(shares)
+
+        self.stats.record(self.render_pass, self.provider, self.profile, scene_count,
+                          {name: round(value, 3) for name, value in observed.items()})
+
+
+# Process-wide stats and the trackers of the jobs running in this process
+progress_stats = ProgressStats()
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def start_tracking(job_id, tracker):
+    with _trackers_lock:
+        _trackers[job_id] = tracker
+    return tracker
+
+
+def get_tracker(job_id):
+    """Returns the job's ProgressTracker, or None if the job is not running here"""
+    with _trackers_lock:
+        return _trackers.get(job_id)
+
+
+def stop_tracking(job_id, tracker):
+    """Unregisters a pass's tracker, unless a later pass of the job has replaced it"""
+    with _trackers_lock:
+        if _trackers.get(job_id) is tracker:
+            del _trackers[job_id]
+
+
+def estimate_job_seconds(provider, profile, render_pass='preview', tts=True, streaming=False):
+    """
+    Expected duration of a job pass that has not started yet (for queued jobs)
+
+    Takes the same arguments as the pass's ProgressTracker, so the estimate
+    reads the stats that tracker will record into.
+    """
+    timings = progress_stats.estimate(render_pass, provider, profile)
+    expected = expected_phase_seconds(timings, timings['scene_count'])
+    return round(sum(expected[phase] for phase in pass_phases(render_pass, tts, streaming)))
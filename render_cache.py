@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import functools
+from disk_cache import DiskCache, make_cache_key, link_or_copy
+
+
+# Compiled scenes are cached outside the per-job workspaces so they survive job cleanup
+RENDER_CACHE_ENABLED = os.getenv('RENDER_CACHE_ENABLED', 'true').lower() == 'true'
+render_cache = DiskCache(
+    os.getenv('RENDER_CACHE_DIR', 'media/cache/renders'),
+    max_bytes=int(float(os.getenv('RENDER_CACHE_MAX_MB', '2048')) * 1024 * 1024)
+)
+
+
+@functools.lru_cache(maxsize=1)
+def get_manim_version():
+    """Returns the installed Manim version (part of the cache key)"""
+    try:
+        from importlib.metadata import version
+        return version('manim')
+    except Exception:
+        return 'unknown'
+
+
+def render_cache_key(source, class_name, quality_flags):
+    """Key for a render: scene source, class name, quality flags and Manim version"""
+    return make_cache_key('render', source, class_name, list(quality_flags), get_manim_version())
+
+
+def lookup_render(source, class_name, quality_flags, output_path):
+    """
+    Places a previously rendered MP4 at output_path if one exists
+
+    Returns:
+        output_path on a cache hit, None otherwise
+    """
+    if not RENDER_CACHE_ENABLED:
+        return None
+    cached = render_cache.get(render_cache_key(source, class_name, quality_flags))
+    if not cached:
+        return None
+    # output_path is outside Manim's output tree, so nothing rewrites it in place
+    return link_or_copy(cached['files']['scene.mp4'], output_path)
+
+
+def store_render(source, class_name, quality_flags, video_path):
+    """Adds a freshly rendered MP4 to the cache"""
+    if not RENDER_CACHE_ENABLED or not os.path.exists(video_path):
+        return
+    try:
+        render_cache.put(
+            render_cache_key(source, class_name, quality_flags),
+            files={'scene.mp4': video_path},
+            meta={'class_name': class_name, 'quality_flags': list(quality_flags)}
+        )
+    except OSError as e:
+        print(f"[WARNING] Could not cache render of {class_name}: {e}")
+
+
+def warm_render_cache(scenes, profile='preview'):
+    """
+    Renders scenes ahead of time so later jobs get cache hits
+
+    Args:
+        scenes: Iterable of (file_path, class_name) tuples
+        profile: Render profile to warm (see concat_video.RENDER_PROFILES)
+
+    Returns:
+        Number of scenes that rendered successfully (or were already cached)
+    """
+    from concat_video import compile_video
+
+    warmed = 0
+    # Renders land in a throwaway media dir; only the cache keeps them
+    with tempfile.TemporaryDirectory(prefix='render-warm-') as media_dir:
+        for index, (file_path, class_name) in enumerate(scenes, 1):
+            topic_slug = os.path.splitext(os.path.basename(file_path))[0]
+            if compile_video(file_path, class_name, topic_slug, index, media_dir=media_dir, profile=profile):
+                warmed += 1
+    return warmed
+
+
+def purge_render_cache():
+    """Deletes every cached render and returns how many entries were removed"""
+    return render_cache.purge()
+
+
+if __name__ == '__main__':
+    # Usage:
+    #   python render_cache.py stats
+    #   python render_cache.py purge
+    #   python render_cache.py warm scene.py ClassName [scene2.py ClassName2 ...]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+
+    if command == 'stats':
+        print(render_cache.stats())
+    elif command == 'purge':
+        print(f"[OK] Removed {purge_render_cache()} cached render(s)")
+    elif command == 'warm':
+        args = sys.argv[2:]
+        if not args or len(args) % 2:
+            print("Usage: python render_cache.py warm scene.py ClassName [scene.py ClassName ...]")
+            sys.exit(1)
+        pairs = list(zip(args[::2], args[1::2]))
+        print(f"[OK] Warmed {warm_render_cache(pairs)}/{len(pairs)} scene(s)")
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import queue
+import signal
+import threading
+import traceback
+import subprocess
+import importlib.util
+import multiprocessing
+from multiprocessing.connection import Connection
+from resource_scheduler import (
+    session_usage, apply_child_limits, RESOURCE_WATCHDOG_INTERVAL, RESOURCE_ADDRESS_SPACE_MB,
+    HOST_CPU_SHARE, MB
+)
+
+
+# Manim quality flags and the matching config.quality names
+QUALITY_NAMES = {
+    '-ql': 'low_quality',
+    '-qm': 'medium_quality',
+    '-qh': 'high_quality',
+    '-qp': 'production_quality',
+    '-qk': 'fourk_quality'
+}
+
+
+def _render_scene(file_path, class_name, media_dir, quality_flags):
+    """Renders one scene inside a worker process (Manim is already imported)"""
+    from manim import tempconfig
+
+    quality = 'low_quality'
+    for flag in quality_flags:
+        quality = QUALITY_NAMES.get(flag, quality)
+
+    module_name = os.path.splitext(os.path.basename(file_path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    scene_class = getattr(module, class_name)
+
+    with tempconfig({'quality': quality, 'media_dir': media_dir, 'input_file': file_path}):
+        scene = scene_class()
+        scene.render()
+        return str(scene.renderer.file_writer.movie_file_path)
+
+
+def _worker_main(conn):
+    """Worker process loop: import Manim once, then render scenes on request"""
+    try:
+        import manim  # noqa: F401  (pays the import/font/cairo start-up cost once)
+        conn.send(('ready', None))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        return
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        try:
+            video_path = _render_scene(*task)
+            conn.send(('ok', video_path))
+        except BaseException:
+            conn.send(('error', traceback.format_exc()))
+        finally:
+            # Scene modules are single use; don't let them pile up
+            for name in [n for n, m in sys.modules.items()
+                         if getattr(m, '__file__', None) == task[0]]:
+                del sys.modules[name]
+
+
+class RenderWorker:
+    """
+    A long-lived process with Manim pre-imported
+
+    The process runs this file as its entry point and talks over an
+    inherited socket pair. Unlike multiprocessing's spawn and forkserver
+    start methods, this never re-imports the parent's __main__ (the Flask
+    app or worker.py, with their job queues) in the render process.
+    
+    The worker leads its own session, so the LaTeX and ffmpeg processes
+    Manim spawns count towards its memory limit and die with it.
+    """
+
+    def __init__(self):
+        self.parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child_conn.fileno())],
+            pass_fds=(child_conn.fileno(),),
+            start_new_session=True
+        )
+        child_conn.close()
+        apply_child_limits(self.process.pid, int(RESOURCE_ADDRESS_SPACE_MB * MB))
+        self.renders = 0
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if self.ready:
+            return True
+        if not self.parent_conn.poll(timeout):
+            return False
+        status, payload = self.parent_conn.recv()
+        if status != 'ready':
+            raise RuntimeError(f"Render worker failed to start:\n{payload}")
+        self.ready = True
+        return True
+
+    def render(self, task, timeout, memory_limit=None):
+        """
+        Sends a render task and waits for the result, checking the RSS of
+        the worker and its children against memory_limit (bytes) while it
+        renders
+
+        Returns:
+            Tuple of (status, payload); status is 'ok', 'error', 'timeout',
+            'memory' or 'crashed'
+        """
+        try:
+            self.parent_conn.send(task)
+            deadline = time.monotonic() + timeout
+            while not self.parent_conn.poll(RESOURCE_WATCHDOG_INTERVAL):
+                if time.monotonic() > deadline:
+                    return 'timeout', f"Render exceeded {timeout}s"
+                rss, _ = session_usage(self.process.pid)
+                if memory_limit and rss > memory_limit:
+                    return 'memory', (f"Render was killed after using {rss / 1024 ** 2:.0f} MB "
+                                      f"(limit {memory_limit / 1024 ** 2:.0f} MB)")
+            status, payload = self.parent_conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            self._wait(timeout=1)
+            return 'crashed', f"Render worker exited with code {self.process.returncode}"
+        self.renders += 1
+        return status, payload
+
+    def _wait(self, timeout):
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def kill(self):
+        """Kills the worker together with the processes its render spawned"""
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except ProcessLookupError:
+            pass
+
+    def stop(self, kill=False):
+        if kill or self.process.poll() is not None:
+            self.kill()
+        else:
+            try:
+                self.parent_conn.send(None)
+            except OSError:
+                self.kill()
+        self._wait(timeout=5)
+        if self.process.poll() is None:
+            self.kill()
+            self._wait(timeout=5)
+        self.parent_conn.close()
+
+
+class RenderWorkerPool:
+    """
+    Pool of pre-warmed Manim render processes
+
+    Each worker imports Manim once and renders many scenes, avoiding the
+    interpreter and library start-up cost of a fresh `manim` CLI per scene.
+    A worker that times out or crashes is killed and replaced, and every
+    worker is recycled after max_renders scenes to bound leaked memory.
+    """
+
+    def __init__(self, size=2, max_renders=20, start_timeout=120):
+        self.size = size
+        self.max_renders = max_renders
+        self.start_timeout = start_timeout
+        self._idle = queue.Queue()
+        self._workers = set()  # idle and busy
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        worker = RenderWorker()
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker, kill=False):
+        """Stops a worker and returns a fresh one in its place"""
+        worker.stop(kill=kill)
+        with self._lock:
+            self._workers.discard(worker)
+        return self._start_worker()
+
+    def render(self, file_path, class_name, media_dir, quality_flags, timeout=300, memory_limit=None):
+        """
+        Renders a scene on the next free worker (memory_limit: RSS limit in bytes)
+
+        Returns:
+            Tuple of (video_path, error); video_path is None on failure
+        """
+        worker = self._idle.get()
+        try:
+            if not worker.wait_ready(self.start_timeout):
+                worker = self._replace(worker, kill=True)
+                return None, "Render worker did not start in time"
+
+            status, payload = worker.render(
+                (os.path.abspath(file_path), class_name, media_dir, list(quality_flags)),
+                timeout,
+                memory_limit=memory_limit
+            )
+
+            if status in ('timeout', 'memory', 'crashed'):
+                # Crash isolation: only this worker is lost, replace it
+                worker = self._replace(worker, kill=True)
+                return None, payload
+
+            if worker.renders >= self.max_renders:
+                worker = self._replace(worker)
+
+            if status == 'ok':
+                return payload, None
+            return None, payload
+        except Exception as e:
+            worker = self._replace(worker, kill=True)
+            return None, str(e)
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+
+    def terminate(self):
+        """Kills every worker, including those mid-render (their renders fail), for shutdown"""
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_worker_pool():
+    """Returns the process-wide render worker pool, starting it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderWorkerPool(
+                size=int(os.getenv('RENDER_WORKERS', str(HOST_CPU_SHARE))),
+                max_renders=int(os.getenv('RENDER_WORKER_MAX_RENDERS', '20'))
+            )
+        return _pool
+
+
+def terminate_render_worker_pool():
+    """Kills the pool's workers if the pool was started"""
+    with _pool_lock:
+        pool = _pool
+    if pool:
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    # Render process entry point (see RenderWorker): argv[1] is the socket fd
+    _worker_main(Connection(int(sys.argv[1])))
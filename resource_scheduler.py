@@ -0,0 +1,396 @@
+import os
+import time
+import signal
+import threading
+import subprocess
+from contextlib import contextmanager
+from metrics import annotate, register_gauge
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+
+# Job processes sharing this machine (worker.py replicas); the default CPU slots,
+# memory budget and render workers are this process's share of the machine
+RESOURCE_HOST_WORKERS = max(1, int(os.getenv('RESOURCE_HOST_WORKERS', '1')))
+HOST_CPU_SHARE = max(1, (os.cpu_count() or 1) // RESOURCE_HOST_WORKERS)
+
+# CPU slots shared by renders and encodes (defaults to this process's share of the CPUs)
+RESOURCE_CPU_SLOTS = int(os.getenv('RESOURCE_CPU_SLOTS', str(HOST_CPU_SHARE)))
+# Memory budget for all limited processes (0 = this process's share of 80% of
+# the cgroup or physical memory)
+RESOURCE_MEMORY_MB = float(os.getenv('RESOURCE_MEMORY_MB', '0'))
+# Optional hard address-space limit applied with prlimit to each child (0 = off);
+# virtual size is much larger than RSS for Manim/Cairo, so this is a last resort
+RESOURCE_ADDRESS_SPACE_MB = float(os.getenv('RESOURCE_ADDRESS_SPACE_MB', '0'))
+# How often running processes are checked against their RSS limit (seconds)
+RESOURCE_WATCHDOG_INTERVAL = float(os.getenv('RESOURCE_WATCHDOG_INTERVAL', '1.0'))
+
+# Per-process RSS limits, also what each process reserves from the budget
+RENDER_MEMORY_LIMIT_MB = float(os.getenv('RENDER_MEMORY_LIMIT_MB', '2048'))
+FFMPEG_MEMORY_LIMIT_MB = float(os.getenv('FFMPEG_MEMORY_LIMIT_MB', '1024'))
+# CPU slots reserved by an ffmpeg re-encode (libx264 is multi-threaded)
+FFMPEG_CPUS = int(os.getenv('FFMPEG_CPUS', '2'))
+FFMPEG_TIMEOUT = int(os.getenv('FFMPEG_TIMEOUT', '600'))
+
+
+class ResourceLimitExceeded(subprocess.SubprocessError):
+    """Raised when a limited process is killed for using too much memory"""
+
+    def __init__(self, cmd, limit_bytes, rss_bytes, output=None, stderr=None):
+        self.cmd = cmd
+        self.limit_bytes = limit_bytes
+        self.rss_bytes = rss_bytes
+        self.output = output
+        self.stderr = stderr
+
+    def __str__(self):
+        return (f"Command '{self.cmd[0]}' was killed after using {self.rss_bytes / MB:.0f} MB "
+                f"(limit {self.limit_bytes / MB:.0f} MB)")
+
+
+def detect_memory_bytes():
+    """Returns 80% of the container's memory limit, or of physical memory"""
+    limits = []
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path, 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # "max" (cgroup v2) or a huge number (v1) means unlimited
+        if value.isdigit() and int(value) < 1 << 60:
+            limits.append(int(value))
+    try:
+        limits.append(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    except (ValueError, OSError, AttributeError):
+        pass
+    return int(min(limits) * 0.8) if limits else 0
+
+
+def _read_stat_fields(pid):
+    """Returns the /proc/<pid>/stat fields after the command name, or None"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses
+    return stat[stat.rfind(')') + 2:].split()
+
+
+def _read_children(pid):
+    """Returns the child pids of a process from /proc/<pid>/task/*/children, or None if unsupported"""
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return []
+    children = []
+    for tid in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{tid}/children', 'r') as f:
+                children.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            # Kernel built without CONFIG_PROC_CHILDREN (or the task just exited)
+            if not os.path.exists(f'/proc/{pid}/task/{tid}'):
+                continue
+            return None
+        except OSError:
+            continue
+    return children
+
+
+def _usage_of(fields, page_size):
+    # RSS pages; utime, stime, cutime, cstime ticks
+    return int(fields[21]) * page_size, sum(int(value) for value in fields[11:15])
+
+
+# One /proc scan per interval, shared by every process being watched
+_session_table = {'at': None, 'sessions': {}}
+_session_table_lock = threading.Lock()
+
+
+def _scan_sessions(max_age):
+    """Returns {session id: (rss bytes, cpu ticks)} from a /proc scan at most max_age seconds old"""
+    with _session_table_lock:
+        now = time.monotonic()
+        if _session_table['at'] is None or now - _session_table['at'] > max_age:
+            page_size = os.sysconf('SC_PAGE_SIZE')
+            sessions = {}
+            for entry in os.listdir('/proc'):
+                if not entry.isdigit():
+                    continue
+                fields = _read_stat_fields(entry)
+                if fields:
+                    rss, cpu_ticks = _usage_of(fields, page_size)
+                    total = sessions.get(int(fields[3]), (0, 0))
+                    sessions[int(fields[3])] = (total[0] + rss, total[1] + cpu_ticks)
+            _session_table.update(at=now, sessions=sessions)
+        return _session_table['sessions']
+
+
+def session_usage(session_id):
+    """
+    Resident memory (bytes) and CPU time (seconds) of a session leader and its children
+
+    Limited processes start their own session, so this covers the children
+    they spawn too (LaTeX, dvisvgm, ffmpeg). CPU time includes children
+    that already exited and were waited for. Returns (0, 0.0) without /proc.
+
+    The leader's descendants are followed through /proc/<pid>/task/*/children,
+    which costs one read per process in the tree. Kernels without that file
+    fall back to a full /proc scan, shared by all callers for half of
+    RESOURCE_WATCHDOG_INTERVAL, so watching many processes doesn't
+    multiply the scans.
+    """
+    if not os.path.isdir('/proc'):
+        return 0, 0.0
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    ticks = os.sysconf('SC_CLK_TCK')
+
+    rss = 0
+    cpu_ticks = 0
+    stack = [session_id]
+    while stack:
+        pid = stack.pop()
+        children = _read_children(pid)
+        if children is None:
+            rss, cpu_ticks = _scan_sessions(RESOURCE_WATCHDOG_INTERVAL / 2).get(session_id, (0, 0))
+            break
+        fields = _read_stat_fields(pid)
+        if fields:
+            process_rss, process_ticks = _usage_of(fields, page_size)
+            rss += process_rss
+            cpu_ticks += process_ticks
+        stack.extend(children)
+    return rss, cpu_ticks / ticks
+
+
+def process_tree_rss(pid):
+    """Resident memory of a process and all of its descendants, in bytes (0 without /proc)"""
+    if not os.path.isdir('/proc'):
+        return 0
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    children = {}
+    rss = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        fields = _read_stat_fields(entry)
+        if fields:
+            children.setdefault(int(fields[1]), []).append(int(entry))
+            rss[int(entry)] = int(fields[21]) * page_size
+
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total
+
+
+def apply_child_limits(pid, address_space_bytes=0):
+    """
+    Sets a started child's rlimits from the parent with prlimit
+
+    preexec_fn would run Python between fork and exec, which can deadlock
+    in a multi-threaded process. The child may run briefly before the
+    limits land, but processes it spawns afterwards inherit them.
+    """
+    if not hasattr(resource, 'prlimit'):  # Linux only
+        return
+    try:
+        # A killed render must not leave a multi-GB core dump behind
+        resource.prlimit(pid, resource.RLIMIT_CORE, (0, 0))
+        if address_space_bytes:
+            resource.prlimit(pid, resource.RLIMIT_AS, (address_space_bytes, address_space_bytes))
+    except (ProcessLookupError, PermissionError):
+        pass  # Already exited
+
+
+class ResourceScheduler:
+    """
+    Admission control for CPU- and memory-heavy child processes
+
+    Each process reserves CPU slots and its memory limit from a shared
+    budget before it starts, and waits while the box is saturated. Running
+    processes are polled through /proc and killed (with their whole
+    session) when they exceed their RSS or time limit.
+    """
+
+    def __init__(self, cpu_slots, memory_bytes=0):
+        """
+        Args:
+            cpu_slots: Number of CPU slots to hand out
+            memory_bytes: Memory budget (0 = CPU slots only)
+        """
+        self.cpu_slots = cpu_slots
+        self.memory_bytes = memory_bytes
+        self._cpus_used = 0
+        self._memory_used = 0
+        self._waiting = 0
+        self._processes = set()
+        self._terminated = False
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, cpus=1, memory_bytes=0):
+        """Blocks until the resources are free and holds them for the with-block"""
+        # Oversized requests are clamped so they can still run (alone)
+        cpus = min(cpus, self.cpu_slots)
+        memory_bytes = min(memory_bytes, self.memory_bytes) if self.memory_bytes else 0
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                self._cond.wait_for(
+                    lambda: self._cpus_used + cpus <= self.cpu_slots
+                    and self._memory_used + memory_bytes <= (self.memory_bytes or memory_bytes)
+                )
+            finally:
+                self._waiting -= 1
+            self._cpus_used += cpus
+            self._memory_used += memory_bytes
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._cpus_used -= cpus
+                self._memory_used -= memory_bytes
+                self._cond.notify_all()
+
+    def run(self, cmd, timeout=None, memory_limit=None, cpus=1):
+        """
+        Runs a command once resources are available, enforcing its limits
+
+        Args:
+            cmd: Command list
+            timeout: Wall-clock limit in seconds (None = no limit)
+            memory_limit: RSS limit in bytes for the process and its children
+            cpus: CPU slots to reserve
+
+        Returns:
+            subprocess.CompletedProcess (text output), with peak_rss in bytes
+            and cpu_seconds; both are sampled by the watchdog, so they are
+            low for processes shorter than RESOURCE_WATCHDOG_INTERVAL
+
+        Raises:
+            subprocess.TimeoutExpired: The process ran longer than timeout
+            ResourceLimitExceeded: The process used more than memory_limit
+        """
+        with self.reserve(cpus=cpus, memory_bytes=memory_limit or 0):
+            with self._cond:
+                if self._terminated:
+                    raise subprocess.SubprocessError("The process is shutting down")
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    start_new_session=True
+                )
+                self._processes.add(process)
+            apply_child_limits(process.pid, int(RESOURCE_ADDRESS_SPACE_MB * MB))
+            try:
+                stdout, stderr, peak_rss, cpu_seconds = self._watch(process, cmd, timeout, memory_limit)
+            finally:
+                with self._cond:
+                    self._processes.discard(process)
+
+        result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+        result.peak_rss = peak_rss
+        result.cpu_seconds = cpu_seconds
+        return result
+
+    def _watch(self, process, cmd, timeout, memory_limit):
+        """Waits for a process, enforcing its limits; returns (stdout, stderr, peak_rss, cpu_seconds)"""
+        deadline = time.monotonic() + timeout if timeout else None
+        peak_rss = 0
+        cpu_seconds = 0.0
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=RESOURCE_WATCHDOG_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+
+            rss, cpu = session_usage(process.pid)
+            peak_rss = max(peak_rss, rss)
+            cpu_seconds = max(cpu_seconds, cpu)
+            if memory_limit and rss > memory_limit:
+                stdout, stderr = self._kill(process)
+                raise ResourceLimitExceeded(cmd, memory_limit, rss, output=stdout, stderr=stderr)
+            if deadline and time.monotonic() > deadline:
+                stdout, stderr = self._kill(process)
+                raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+        return stdout, stderr, peak_rss, cpu_seconds
+
+    def _kill(self, process):
+        """Kills a process and everything it spawned, returning its output"""
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        return process.communicate()
+
+    def terminate(self):
+        """Kills every running process (with its session) and refuses new ones, for shutdown"""
+        with self._cond:
+            self._terminated = True
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except ProcessLookupError:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                'cpu_slots': self.cpu_slots,
+                'cpus_used': self._cpus_used,
+                'memory_bytes': self.memory_bytes,
+                'memory_used': self._memory_used,
+                'waiting': self._waiting
+            }
+
+
+# Process-wide scheduler shared by every render and encode
+scheduler = ResourceScheduler(
+    cpu_slots=RESOURCE_CPU_SLOTS,
+    memory_bytes=int(RESOURCE_MEMORY_MB * MB) if RESOURCE_MEMORY_MB else detect_memory_bytes() // RESOURCE_HOST_WORKERS
+)
+
+# Load gauges, read on every /metrics scrape of the process running the jobs
+register_gauge('topic2manim_scheduler_cpu_slots_used', 'CPU slots held by renders and encodes',
+               lambda: scheduler.stats()['cpus_used'])
+register_gauge('topic2manim_scheduler_memory_reserved_bytes', 'Memory reserved by renders and encodes',
+               lambda: scheduler.stats()['memory_used'])
+register_gauge('topic2manim_scheduler_waiting', 'Processes waiting for CPU slots or memory',
+               lambda: scheduler.stats()['waiting'])
+
+
+def run_limited(cmd, timeout=None, memory_limit_mb=None, cpus=1):
+    """
+    Runs a command through the process-wide scheduler (see ResourceScheduler.run)
+
+    The process's CPU time and peak RSS are added to the current metrics span.
+    """
+    result = scheduler.run(
+        cmd,
+        timeout=timeout,
+        memory_limit=int(memory_limit_mb * MB) if memory_limit_mb else None,
+        cpus=cpus
+    )
+    annotate(cpu_seconds=result.cpu_seconds, peak_rss=result.peak_rss)
+    return result
@@ -0,0 +1,204 @@
+import os
+import re
+import sys
+import ast
+import subprocess
+
+# Import generated scenes in a throwaway interpreter before rendering them,
+# catching bad imports and module-level errors without a full manim run
+SCENE_IMPORT_CHECK = os.getenv('SCENE_IMPORT_CHECK', 'true').lower() == 'true'
+SCENE_IMPORT_TIMEOUT = int(os.getenv('SCENE_IMPORT_TIMEOUT', '60'))
+# Dry run: also execute construct() with animations skipped and no output
+# written, catching runtime errors in a fraction of the render time
+SCENE_DRY_RUN = os.getenv('SCENE_DRY_RUN', 'false').lower() == 'true'
+SCENE_DRY_RUN_TIMEOUT = int(os.getenv('SCENE_DRY_RUN_TIMEOUT', '120'))
+
+# Colour variants (RED_A, BLUE_E, ...) the prompt forbids
+COLOR_VARIANT_PATTERN = re.compile(r'^(WHITE|BLACK|RED|GREEN|BLUE|YELLOW|PURPLE|ORANGE|PINK|GRAY|GREY|TEAL|GOLD|MAROON)_[A-E]$')
+# Text mobjects that must never be created empty
+TEXT_CLASSES = {'Text', 'Paragraph', 'MarkupText', 'Tex', 'MathTex'}
+
+# Runs the module under a non-__main__ name and checks the scene class exists
+_IMPORT_SNIPPET = (
+    "import runpy, sys\n"
+    "namespace = runpy.run_path(sys.argv[1], run_name='scene_check')\n"
+    "if sys.argv[2] not in namespace:\n"
+    "    sys.exit(f'NameError: class {sys.argv[2]} is not defined in the generated code')\n"
+)
+
+# Imports the module, then runs construct() without rendering any frames
+_DRY_RUN_SNIPPET = _IMPORT_SNIPPET + (
+    "from manim import tempconfig\n"
+    "with tempconfig({'dry_run': True, 'quality': 'low_quality', 'disable_caching': True}):\n"
+    "    namespace[sys.argv[2]](skip_animations=True).render()\n"
+)
+
+
+def make_error(code, message, line=None):
+    """Builds a structured validation error as stored in job status"""
+    return {'code': code, 'message': message, 'line': line}
+
+
+def format_errors(errors):
+    """Renders validation errors as plain text for logs and repair prompts"""
+    lines = []
+    for error in errors:
+        location = f"line {error['line']}: " if error.get('line') else ''
+        lines.append(f"{location}[{error['code']}] {error['message']}")
+    return '\n'.join(lines)
+
+
+def errors_from_traceback(output, file_path, code):
+    """
+    Converts a Python/Manim traceback into a single structured error
+
+    The line number is taken from the innermost frame in the scene file.
+    """
+    output = (output or '').strip()
+    line = None
+    for match in re.finditer(r'File "([^"]+)", line (\d+)', output):
+        if os.path.abspath(match.group(1)) == os.path.abspath(file_path):
+            line = int(match.group(2))
+    return [make_error(code, output[-4000:] or 'Unknown error', line)]
+
+
+def _attribute_chain(node):
+    """Returns the dotted name of an attribute access (self.camera.frame), or None"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return '.'.join(reversed(parts))
+    return None
+
+
+def _base_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def check_syntax(source, class_name):
+    """
+    Statically checks a generated scene
+
+    Parses the source and checks the rules the code generation prompt asks
+    for: the class matches class_name and inherits from Scene, no
+    self.camera.frame, no colour variants, no empty Text/Paragraph.
+
+    Returns:
+        List of structured errors (empty if the source looks renderable)
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        message = f"SyntaxError: {e.msg}: {(e.text or '').strip()}"
+        # Over-escaped JSON leaves literal \n sequences instead of newlines
+        if '\\n' in source and source.count('\n') < 3:
+            return [make_error('json_escaping', 'Code contains literal \\n sequences instead of newlines; '
+                                               'the JSON string was escaped twice', e.lineno)]
+        return [make_error('syntax_error', message, e.lineno)]
+
+    errors = []
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    scene_class = classes.get(class_name)
+    if scene_class is None:
+        errors.append(make_error(
+            'class_name_mismatch',
+            f"class_name is {class_name} but the code defines {', '.join(classes) or 'no classes'}"
+        ))
+    elif 'Scene' not in [_base_name(base) for base in scene_class.bases]:
+        bases = ', '.join(filter(None, (_base_name(base) for base in scene_class.bases))) or 'nothing'
+        errors.append(make_error(
+            'bad_base_class',
+            f"{class_name} must inherit from Scene, not {bases}",
+            scene_class.lineno
+        ))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and _attribute_chain(node) == 'self.camera.frame':
+            errors.append(make_error(
+                'camera_frame',
+                'self.camera.frame does not exist in Scene; animate the objects instead',
+                node.lineno
+            ))
+        elif isinstance(node, ast.Name) and COLOR_VARIANT_PATTERN.match(node.id):
+            errors.append(make_error(
+                'color_variant',
+                f"Colour variant {node.id} is not allowed; use a basic colour or a hex code",
+                node.lineno
+            ))
+        elif (isinstance(node, ast.Call) and _base_name(node.func) in TEXT_CLASSES and node.args
+              and isinstance(node.args[0], ast.Constant) and node.args[0].value == ''):
+            errors.append(make_error(
+                'empty_text',
+                f"{_base_name(node.func)}('') creates an empty mobject; use real text",
+                node.lineno
+            ))
+    return errors
+
+
+def _run_check(snippet, file_path, class_name, timeout, code):
+    try:
+        result = subprocess.run(
+            [sys.executable, '-c', snippet, file_path, class_name],
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return [make_error('timeout', f"{code} check took longer than {timeout}s")]
+
+    if result.returncode != 0:
+        return errors_from_traceback(result.stderr or result.stdout, file_path, code)
+    return []
+
+
+def check_import(file_path, class_name, timeout=None):
+    """
+    Imports a generated scene in a separate interpreter
+
+    Much cheaper than a render (no scene is constructed), but catches
+    unknown names, bad imports and other module-level errors.
+
+    Returns:
+        List of structured errors (empty if the module imports cleanly)
+    """
+    return _run_check(_IMPORT_SNIPPET, file_path, class_name,
+                      timeout or SCENE_IMPORT_TIMEOUT, 'import_error')
+
+
+def dry_run_scene(file_path, class_name, timeout=None):
+    """
+    Executes construct() with animations skipped and no files written
+
+    Returns:
+        List of structured errors (empty if construct() ran cleanly)
+    """
+    return _run_check(_DRY_RUN_SNIPPET, file_path, class_name,
+                      timeout or SCENE_DRY_RUN_TIMEOUT, 'runtime_error')
+
+
+def check_scene(file_path, class_name):
+    """
+    Runs the pre-render checks on a scene file: static checks, then either
+    a dry run (SCENE_DRY_RUN) or an import check (SCENE_IMPORT_CHECK)
+
+    Returns:
+        List of structured errors (empty if the scene should be rendered)
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        source = f.read()
+
+    errors = check_syntax(source, class_name)
+    if errors:
+        return errors
+    if SCENE_DRY_RUN:
+        return dry_run_scene(file_path, class_name)
+    if SCENE_IMPORT_CHECK:
+        return check_import(file_path, class_name)
+    return []
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Modules read their configuration at import time: keep caches and job state
+# out of the repo and make backoff fast before anything imports them
+_cache_dir = tempfile.mkdtemp(prefix='topic2manim-tests-')
+os.environ.update({
+    'LLM_CACHE_ENABLED': 'false',
+    'LLM_CACHE_DIR': os.path.join(_cache_dir, 'llm'),
+    'LLM_BACKOFF_BASE': '0.01',
+    'TTS_CACHE_ENABLED': 'false',
+    'TTS_CACHE_DIR': os.path.join(_cache_dir, 'tts'),
+    'TTS_BACKOFF_BASE': '0.01',
+    'JOB_STORE_PATH': os.path.join(_cache_dir, 'jobs.db'),
+    'JOB_QUEUE_FILE': os.path.join(_cache_dir, 'job_queue.json'),
+    'PROGRESS_STATS_FILE': os.path.join(_cache_dir, 'progress_stats.json'),
+    'WORKSPACE_ROOT': os.path.join(_cache_dir, 'jobs'),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeAPI:
+    """
+    Local HTTP server standing in for the OpenAI API
+
+    Tests queue responses with respond(); each request takes the next one
+    (the last one is repeated once the queue runs out). Requests are
+    recorded, along with the highest number handled at the same time.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.max_active = 0
+        self._active = 0
+        self._responses = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, status=200, body=b'', headers=None, chunks=None, delay=0):
+        """
+        Queues a response
+
+        Args:
+            status: HTTP status code
+            body: Response body (dicts are sent as JSON)
+            headers: Extra response headers
+            chunks: Sent as Server-Sent Events instead of body, one per chunk
+            delay: Seconds to wait before answering
+        """
+        self._responses.append((status, body, headers or {}, chunks, delay))
+
+    def _next_response(self):
+        with self._lock:
+            if len(self._responses) > 1:
+                return self._responses.pop(0)
+            return self._responses[0]
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with api._lock:
+                    api.requests.append({'path': self.path, 'json': payload})
+                    api._active += 1
+                    api.max_active = max(api.max_active, api._active)
+                try:
+                    self._send(*api._next_response())
+                finally:
+                    with api._lock:
+                        api._active -= 1
+
+            def _send(self, status, body, headers, chunks, delay):
+                time.sleep(delay)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if chunks is not None:
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.end_headers()
+                    for chunk in chunks:
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+                if isinstance(body, dict):
+                    body = json.dumps(body).encode()
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def fake_api():
+    api = FakeAPI()
+    api.start()
+    yield api
+    api.stop()
+
+
+@pytest.fixture
+def openai_client(fake_api, monkeypatch):
+    """The process-wide OpenAI client, pointed at fake_api with fresh limiters"""
+    import llm_client
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENAI_BASE_URL', fake_api.url)
+    monkeypatch.setattr(llm_client, '_clients', {})
+    monkeypatch.setattr(llm_client, '_limiters', {})
+    return llm_client.get_client('openai')
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from animations import SceneStreamParser, parse_script_stream, validate_scene, stream_script_scenes
+from test_llm_client import completion_chunk
+
+
+SCENES = [
+    {'text': "A circle {grows} into [a] square", 'animation': "Create(Circle()) then Transform"},
+    {'text': "Escaped \"quotes\" and a \\ backslash", 'animation': "Write(Text('hi'))"},
+    {'text': "Nested data", 'animation': "FadeIn", 'extra': {'colors': ['BLUE', 'RED']}},
+]
+
+
+def feed_in_pieces(text, size):
+    parser = SceneStreamParser()
+    received = []
+    for start in range(0, len(text), size):
+        received.append(parser.feed(text[start:start + size]))
+    return parser, received
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64])
+def test_scenes_arrive_as_soon_as_they_close_however_the_text_is_split(size):
+    text = json.dumps(SCENES, indent=2)
+
+    parser, received = feed_in_pieces(text, size)
+
+    assert [scene for scenes in received for scene in scenes] == SCENES
+    assert parser.finished
+    # The first scene is available well before the response ends
+    first = next(i for i, scenes in enumerate(received) if scenes)
+    assert first < len(received) // 2
+
+
+def test_fenced_output_with_bracketed_prose_is_skipped():
+    text = ("Here is the script [as requested]:\n```json\n"
+            + json.dumps(SCENES[:2]) + "\n```\nLet me know [if] you need {changes}.")
+
+    parser, received = feed_in_pieces(text, 5)
+
+    assert [scene for scenes in received for scene in scenes] == SCENES[:2]
+    assert parser.finished
+
+
+def test_parse_script_stream_rejects_unterminated_and_invalid_scripts():
+    assert parse_script_stream("```json\n" + json.dumps(SCENES) + "\n```") == SCENES
+
+    with pytest.raises(ValueError, match="no complete JSON array"):
+        parse_script_stream(json.dumps(SCENES)[:-1])
+    with pytest.raises(ValueError, match="Scene 2 has no 'animation'"):
+        parse_script_stream(json.dumps([SCENES[0], {'text': "No animation"}]))
+
+
+def test_validate_scene_requires_text_and_animation_strings():
+    validate_scene(SCENES[0], 1)
+    for scene in ([], {'text': "x"}, {'text': "  ", 'animation': "y"}, {'text': "x", 'animation': 3}):
+        with pytest.raises(ValueError):
+            validate_scene(scene, 1)
+
+
+def test_streamed_script_is_yielded_scene_by_scene_and_saved(fake_api, openai_client, tmp_path):
+    text = "```json\n" + json.dumps(SCENES[:2]) + "\n```"
+    fake_api.respond(chunks=[completion_chunk(text[i:i + 10]) for i in range(0, len(text), 10)])
+    output_file = tmp_path / 'script.json'
+
+    scenes = list(stream_script_scenes(openai_client, "Shapes", str(output_file), 'openai', 'test-model'))
+
+    assert scenes == SCENES[:2]
+    assert json.loads(output_file.read_text()) == SCENES[:2]
+
+
+def test_malformed_scene_stops_the_stream(fake_api, openai_client, tmp_path):
+    fake_api.respond(chunks=[completion_chunk(json.dumps([SCENES[0], {'text': "No animation"}, SCENES[1]]))])
+    received = []
+
+    with pytest.raises(ValueError, match="Scene 2"):
+        for scene in stream_script_scenes(openai_client, "Shapes", str(tmp_path / 'script.json'), 'openai', 'test-model'):
+            received.append(scene)
+    assert received == [SCENES[0]]
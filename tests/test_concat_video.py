@@ -0,0 +1,38 @@
+import concat_video
+
+
+def test_small_same_sign_mismatches_add_up_to_drift():
+    # 0.05s per scene is under the tolerance, eight of them are not
+    videos = [3.05] * 8
+    audios = [3.0] * 8
+
+    assert not concat_video.streams_aligned(videos, audios, tolerance=0.1)
+    assert concat_video.streams_aligned(videos[:2], audios[:2], tolerance=0.1)
+
+
+def test_mismatches_that_cancel_out_stay_aligned():
+    videos = [3.08, 2.92, 3.08, 2.92]
+    audios = [3.0, 3.0, 3.0, 3.0]
+
+    assert concat_video.streams_aligned(videos, audios, tolerance=0.1)
+
+
+def test_scene_without_narration_needs_the_filter_graph():
+    assert not concat_video.streams_aligned([3.0, 3.0], [3.0, None], tolerance=0.1)
+
+
+def test_plan_pads_or_conforms_each_scene():
+    videos = [3.0, 5.0, 4.0]
+    audios = [4.0, 2.0, None]
+
+    assert concat_video.plan_scene_alignment(videos, audios, mode='pad') == [4.0, 5.0, 4.0]
+    assert concat_video.plan_scene_alignment(videos, audios, mode='audio') == [4.0, 2.0, 4.0]
+
+
+def test_alignment_filter_freezes_short_video_and_pads_audio():
+    graph = concat_video.build_alignment_filter([3.0, 5.0], [4.0, 5.0], has_audio=True)
+
+    assert "[0:v]tpad=stop_mode=clone:stop_duration=1.000,trim=duration=4.000" in graph
+    assert "[1:v]trim=duration=5.000" in graph
+    assert "[2:a]aformat=sample_rates=44100:channel_layouts=stereo,apad,atrim=duration=4.000" in graph
+    assert graph.endswith("[v0][a0][v1][a1]concat=n=2:v=1:a=1[v][a]")
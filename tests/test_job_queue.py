@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from job_queue import JobQueue, QueueFullError
+
+
+class Recorder:
+    """worker_fn that records job ids; the job 'blocker' waits until released"""
+
+    def __init__(self):
+        self.order = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.expected = 0
+
+    def __call__(self, job_id, **kwargs):
+        if job_id == 'blocker':
+            self.started.set()
+            self.release.wait(5)
+        self.order.append(job_id)
+        if len(self.order) >= self.expected:
+            self.done.set()
+
+
+def blocked_queue(recorder, **kwargs):
+    """A one-worker queue busy with 'blocker', so new jobs wait"""
+    queue = JobQueue(worker_fn=recorder, num_workers=1, **kwargs)
+    queue.start()
+    queue.submit('blocker', {})
+    assert recorder.started.wait(5)
+    return queue
+
+
+def test_jobs_run_by_priority_then_submission_order():
+    recorder = Recorder()
+    queue = blocked_queue(recorder)
+
+    for job_id, priority in [('low', 'low'), ('normal-1', 'normal'), ('high', 'high'), ('normal-2', 'normal')]:
+        queue.submit(job_id, {}, priority=priority)
+    assert [queue.position(job_id) for job_id in ('high', 'normal-1', 'normal-2', 'low')] == [1, 2, 3, 4]
+
+    recorder.expected = 5
+    recorder.release.set()
+    assert recorder.done.wait(5)
+    assert recorder.order == ['blocker', 'high', 'normal-1', 'normal-2', 'low']
+
+
+def test_cancelled_job_never_runs_and_the_queue_moves_up():
+    recorder = Recorder()
+    changes = []
+    queue = blocked_queue(recorder, on_change=changes.append)
+
+    queue.submit('first', {})
+    queue.submit('second', {})
+    changes.clear()
+
+    assert queue.cancel('first')
+    assert not queue.cancel('first')
+    assert queue.position('second') == 1
+    assert changes == [['second']]
+
+    recorder.expected = 2
+    recorder.release.set()
+    assert recorder.done.wait(5)
+    assert recorder.order == ['blocker', 'second']
+
+
+def test_full_queue_rejects_jobs():
+    recorder = Recorder()
+    queue = blocked_queue(recorder, max_size=1)
+
+    queue.submit('waiting', {})
+    with pytest.raises(QueueFullError):
+        queue.submit('rejected', {})
+    recorder.release.set()
+
+
+def test_waiting_and_running_jobs_are_restored_from_the_state_file(tmp_path):
+    state_file = str(tmp_path / 'queue.json')
+    recorder = Recorder()
+    blocked_queue(recorder, state_file=state_file).submit('waiting', {'topic': 'x'}, priority='low')
+
+    # A new process finds the running job first in line, then the waiting one
+    restored_recorder = Recorder()
+    restored_recorder.expected = 2
+    restored = JobQueue(worker_fn=restored_recorder, num_workers=1, state_file=state_file).start()
+
+    assert [entry['job_id'] for entry in restored] == ['blocker', 'waiting']
+    restored_recorder.release.set()
+    assert restored_recorder.done.wait(5)
+    assert restored_recorder.order == ['blocker', 'waiting']
+    recorder.release.set()
@@ -0,0 +1,95 @@
+import threading
+
+import openai
+import pytest
+
+import llm_client
+
+
+def completion(content):
+    return {
+        'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'test-model',
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 3, 'completion_tokens': 2, 'total_tokens': 5}
+    }
+
+
+def completion_chunk(content):
+    return {
+        'id': 'chatcmpl-test', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'test-model',
+        'choices': [{'index': 0, 'delta': {'content': content}, 'finish_reason': None}]
+    }
+
+
+def ask(client, prompt="Hello", **kwargs):
+    return llm_client.complete(client, 'openai', 'test-model', "system", prompt, use_cache=False, **kwargs)
+
+
+def test_client_is_shared_and_uses_base_url(fake_api, openai_client):
+    fake_api.respond(body=completion("Hi there"))
+
+    assert llm_client.get_client('openai') is openai_client
+    assert ask(openai_client) == "Hi there"
+    assert fake_api.requests[0]['path'] == '/v1/chat/completions'
+    assert fake_api.requests[0]['json']['messages'][1] == {'role': 'user', 'content': "Hello"}
+
+
+def test_rate_limit_and_server_errors_are_retried(fake_api, openai_client):
+    fake_api.respond(status=429, body={'error': {'message': 'slow down'}}, headers={'retry-after': '0'})
+    fake_api.respond(status=503, body={'error': {'message': 'unavailable'}}, headers={'retry-after': '0'})
+    fake_api.respond(body=completion("Recovered"))
+
+    assert ask(openai_client) == "Recovered"
+    assert len(fake_api.requests) == 3
+
+
+def test_client_errors_are_not_retried(fake_api, openai_client):
+    fake_api.respond(status=400, body={'error': {'message': 'bad request'}})
+
+    with pytest.raises(openai.BadRequestError):
+        ask(openai_client)
+    assert len(fake_api.requests) == 1
+
+
+def test_limiter_caps_concurrent_requests(fake_api, openai_client, monkeypatch):
+    monkeypatch.setenv('OPENAI_MAX_CONCURRENCY', '2')
+    fake_api.respond(body=completion("Done"), delay=0.1)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(ask(openai_client, f"Prompt {i}")))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["Done"] * 6
+    assert fake_api.max_active == 2
+
+
+def test_stream_yields_chunks_as_they_arrive(fake_api, openai_client):
+    fake_api.respond(chunks=[completion_chunk(text) for text in ('[{"a": ', '1}', ']')])
+    validated = []
+
+    chunks = list(llm_client.stream_complete(
+        openai_client, 'openai', 'test-model', "system", "Hello",
+        use_cache=False, validate=validated.append
+    ))
+
+    assert chunks == ['[{"a": ', '1}', ']']
+    assert validated == ['[{"a": 1}]']
+    assert fake_api.requests[0]['json']['stream'] is True
+
+
+def test_stream_is_retried_before_the_first_chunk(fake_api, openai_client):
+    fake_api.respond(status=503, body={'error': {'message': 'unavailable'}}, headers={'retry-after': '0'})
+    fake_api.respond(chunks=[completion_chunk("ok")])
+
+    chunks = list(llm_client.stream_complete(
+        openai_client, 'openai', 'test-model', "system", "Hello", use_cache=False
+    ))
+
+    assert chunks == ["ok"]
+    assert len(fake_api.requests) == 2
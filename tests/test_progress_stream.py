@@ -0,0 +1,111 @@
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """The Flask app with a queue that never runs jobs; main's media directory goes to tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    import main
+    import video_generator
+
+    queue = JobQueue(worker_fn=None, num_workers=0, max_size=0, on_change=video_generator.notify_queue_change)
+    monkeypatch.setattr(video_generator, '_job_queue', queue)
+    monkeypatch.setattr(main, '_stream_slots', threading.BoundedSemaphore(2))
+    monkeypatch.setattr(main, 'SSE_HEARTBEAT_SECONDS', 0.05)
+    return main, video_generator, queue
+
+
+def create_job(video_generator, job_id, queue=None):
+    now = datetime.now().isoformat()
+    video_generator.job_store.create({
+        'job_id': job_id, 'topic': job_id, 'status': 'queued', 'enable_tts': False,
+        'llm_provider': 'openai', 'render_profile': 'preview', 'render_pass': 'preview',
+        'progress': 0, 'current_step': 'script', 'created_at': now, 'updated_at': now
+    })
+    if queue:
+        queue.submit(job_id, {})
+
+
+class EventReader:
+    """Reads Server-Sent Events off a streamed test client response"""
+
+    def __init__(self, response):
+        self.response = response
+        self._chunks = response.iter_encoded()
+
+    def next_event(self):
+        chunk = next(self._chunks).decode()
+        if chunk.startswith('data: '):
+            return json.loads(chunk[len('data: '):])
+        return chunk.strip()
+
+    def next_job(self):
+        while not isinstance(event := self.next_event(), dict):
+            pass
+        return event
+
+
+def test_stream_reports_changes_until_the_job_finishes(api):
+    main, video_generator, _ = api
+    create_job(video_generator, 'stream-job')
+
+    response = main.app.test_client().get('/api/progress/stream-job/stream', buffered=False)
+    events = EventReader(response)
+    assert response.mimetype == 'text/event-stream'
+    assert events.next_job()['status'] == 'queued'
+
+    # Idle streams send keep-alive comments
+    assert events.next_event() == ': keep-alive'
+
+    video_generator.update_job_status('stream-job', status='running', progress=40, message='Rendering')
+    job = events.next_job()
+    assert (job['status'], job['progress']) == ('running', 40)
+
+    video_generator.update_job_status('stream-job', status='completed', progress=100, video_url='/media/x.mp4')
+    assert events.next_job()['video_url'] == '/media/x.mp4'
+    assert events.next_event() == 'event: end\ndata: {}'
+    response.close()
+
+
+def test_stream_reports_queue_position_changes(api):
+    main, video_generator, queue = api
+    create_job(video_generator, 'ahead', queue)
+    create_job(video_generator, 'behind', queue)
+
+    response = main.app.test_client().get('/api/progress/behind/stream', buffered=False)
+    events = EventReader(response)
+    assert events.next_job()['queue_position'] == 2
+
+    # Cancelling the job ahead changes no field of this job's record
+    queue.cancel('ahead')
+    assert events.next_job()['queue_position'] == 1
+    response.close()
+
+
+def test_streams_above_the_limit_get_503_and_slots_are_released(api):
+    main, video_generator, _ = api
+    create_job(video_generator, 'busy-job')
+    client = main.app.test_client()
+
+    streams = [client.get('/api/progress/busy-job/stream', buffered=False) for _ in range(2)]
+    rejected = client.get('/api/progress/busy-job/stream')
+    assert rejected.status_code == 503
+    assert rejected.headers['Retry-After']
+
+    # Closed in reverse: every stream's request context lives on this one thread
+    streams[1].close()
+    reopened = client.get('/api/progress/busy-job/stream', buffered=False)
+    assert reopened.status_code == 200
+    reopened.close()
+    streams[0].close()
+
+
+def test_unknown_job_is_404(api):
+    main, _, _ = api
+    assert main.app.test_client().get('/api/progress/missing/stream').status_code == 404
@@ -0,0 +1,90 @@
+import textwrap
+
+import pytest
+
+import scene_validator
+
+
+def codes(errors):
+    return [error['code'] for error in errors]
+
+
+def scene_source(body, class_name='CircleScene', base='Scene'):
+    return textwrap.dedent(f"""\
+        from manim import *
+
+        class {class_name}({base}):
+            def construct(self):
+        """) + textwrap.indent(textwrap.dedent(body), ' ' * 8)
+
+
+def test_valid_scene_passes_static_checks():
+    source = scene_source("""\
+        circle = Circle(color=BLUE)
+        self.play(Create(circle), Write(Text("Hello")))
+        """)
+
+    assert scene_validator.check_syntax(source, 'CircleScene') == []
+
+
+def test_static_checks_report_each_rule_with_its_line():
+    source = scene_source("""\
+        self.play(self.camera.frame.animate.scale(0.5))
+        circle = Circle(color=BLUE_E)
+        self.add(Text(''))
+        """)
+
+    errors = sorted(scene_validator.check_syntax(source, 'CircleScene'), key=lambda error: error['line'])
+
+    assert codes(errors) == ['camera_frame', 'color_variant', 'empty_text']
+    assert [error['line'] for error in errors] == [5, 6, 7]
+
+
+def test_class_name_and_base_class_are_checked():
+    source = scene_source("self.wait()\n", base='MovingCameraScene')
+
+    assert codes(scene_validator.check_syntax(source, 'OtherScene')) == ['class_name_mismatch']
+    assert codes(scene_validator.check_syntax(source, 'CircleScene')) == ['bad_base_class']
+
+
+def test_syntax_errors_and_double_escaped_json():
+    broken = scene_source("self.play(Create(Circle())\n")
+    escaped = "from manim import *\\n\\nclass CircleScene(Scene):\\n    pass"
+
+    assert codes(scene_validator.check_syntax(broken, 'CircleScene')) == ['syntax_error']
+    assert codes(scene_validator.check_syntax(escaped, 'CircleScene')) == ['json_escaping']
+
+
+def test_import_check_runs_the_module_in_a_separate_interpreter(tmp_path):
+    good = tmp_path / 'good.py'
+    good.write_text("class Scene:\n    pass\n\nclass CircleScene(Scene):\n    pass\n")
+    bad = tmp_path / 'bad.py'
+    bad.write_text("class Scene:\n    pass\n\nRADIUS = undefined_name\n")
+
+    assert scene_validator.check_import(str(good), 'CircleScene') == []
+    assert codes(scene_validator.check_import(str(good), 'MissingScene')) == ['import_error']
+
+    errors = scene_validator.check_import(str(bad), 'CircleScene')
+    assert codes(errors) == ['import_error']
+    assert errors[0]['line'] == 4
+    assert "NameError" in errors[0]['message']
+
+
+def test_check_scene_stops_at_static_errors(tmp_path, monkeypatch):
+    path = tmp_path / 'scene.py'
+    path.write_text(scene_source("self.add(Text(''))\n"))
+    monkeypatch.setattr(scene_validator, 'check_import', lambda *args: pytest.fail("import check ran"))
+
+    assert codes(scene_validator.check_scene(str(path), 'CircleScene')) == ['empty_text']
+
+
+def test_errors_are_formatted_for_repair_prompts():
+    errors = [
+        scene_validator.make_error('color_variant', "Colour variant BLUE_E is not allowed", 6),
+        scene_validator.make_error('timeout', "import_error check took longer than 60s")
+    ]
+
+    assert scene_validator.format_errors(errors) == (
+        "line 6: [color_variant] Colour variant BLUE_E is not allowed\n"
+        "[timeout] import_error check took longer than 60s"
+    )
@@ -0,0 +1,156 @@
+import time
+import threading
+
+import pytest
+
+from job_queue import SharedJobQueue
+from job_store import SQLiteJobStore, RedisJobStore
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def store(request, tmp_path, monkeypatch):
+    if request.param == 'sqlite':
+        return SQLiteJobStore(path=str(tmp_path / 'jobs.db'))
+    # The queue scripts run on fakeredis's Lua interpreter
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    import redis
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    return RedisJobStore(url='redis://fake')
+
+
+def enqueue(store, job_id, priority=1):
+    store.enqueue({'job_id': job_id, 'priority': priority, 'kwargs': {'topic': job_id}})
+
+
+def test_claims_follow_priority_then_submission_order(store):
+    enqueue(store, 'low', priority=2)
+    enqueue(store, 'first')
+    enqueue(store, 'high', priority=0)
+    enqueue(store, 'second')
+
+    claimed = [store.claim_next('worker-a')['job_id'] for _ in range(4)]
+
+    assert claimed == ['high', 'first', 'second', 'low']
+    assert store.claim_next('worker-a') is None
+    assert store.queue_stats(cutoff=0) == {'queued': 0, 'running': 4, 'workers': 0}
+
+
+def test_an_entry_is_claimed_by_one_worker_only(store):
+    for index in range(20):
+        enqueue(store, f'job-{index}')
+    claimed = []
+
+    def claim_all(worker_id):
+        while (entry := store.claim_next(worker_id)) is not None:
+            claimed.append(entry['job_id'])
+
+    workers = [threading.Thread(target=claim_all, args=(f'worker-{n}',)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(claimed) == sorted(f'job-{index}' for index in range(20))
+
+
+def test_release_keeps_a_follow_up_pass_queued(store):
+    enqueue(store, 'job')
+    entry = store.claim_next('worker-a')
+    # The preview pass queues the final pass before it returns
+    enqueue(store, 'job', priority=2)
+
+    store.release('job', entry['claim'])
+
+    assert store.queue_position('job') == 1
+    assert store.claim_next('worker-a')['kwargs'] == {'topic': 'job'}
+
+
+def test_heartbeat_keeps_claims_and_stale_claims_are_requeued_first_in_line(store):
+    enqueue(store, 'running')
+    enqueue(store, 'waiting')
+    store.touch_worker('worker-a', 2)
+    claim = store.claim_next('worker-a')
+
+    time.sleep(0.05)
+    store.touch_worker('worker-a', 2)
+    assert store.requeue_claims(cutoff=time.time() - 0.04) == []
+    assert store.queue_stats(cutoff=0)['workers'] == 2
+
+    # No heartbeat since: the claim and the worker are gone
+    time.sleep(0.05)
+    requeued = store.requeue_claims(cutoff=time.time() - 0.04)
+
+    assert [entry['job_id'] for entry in requeued] == ['running']
+    assert 'claim' not in requeued[0]
+    assert store.queue_position('running') == 1
+    assert store.queue_stats(cutoff=0)['workers'] == 0
+    # A stale claim can no longer release the requeued entry
+    store.release('running', claim['claim'])
+    assert store.queue_position('running') == 1
+
+
+def test_requeue_by_worker_only_touches_that_worker(store):
+    enqueue(store, 'a')
+    enqueue(store, 'b')
+    store.claim_next('worker-a')
+    store.claim_next('worker-b')
+
+    requeued = store.requeue_claims(worker_id='worker-a')
+
+    assert [entry['job_id'] for entry in requeued] == ['a']
+    assert store.queue_job_ids() == {'a', 'b'}
+    assert store.queue_stats(cutoff=0) == {'queued': 1, 'running': 1, 'workers': 0}
+
+
+def test_cancel_only_removes_waiting_entries(store):
+    enqueue(store, 'running')
+    enqueue(store, 'waiting')
+    store.claim_next('worker-a')
+
+    assert store.dequeue('waiting')
+    assert not store.dequeue('running')
+    assert store.queue_job_ids() == {'running'}
+
+
+def test_shared_queue_runs_jobs_of_a_dead_worker(store):
+    enqueue(store, 'orphan')
+    store.claim_next('dead-worker')
+    store.touch_worker('dead-worker', 1)
+    time.sleep(0.05)
+    ran = threading.Event()
+    restored = []
+
+    queue = SharedJobQueue(
+        store, worker_fn=lambda job_id, **kwargs: ran.set(), num_workers=1,
+        poll_interval=0.01, claim_timeout=0.04, on_restore=restored.extend
+    )
+    requeued = queue.start()
+    try:
+        assert [entry['job_id'] for entry in requeued] == ['orphan']
+        assert ran.wait(5)
+    finally:
+        queue.stop(timeout=5)
+    assert store.queue_job_ids() == set()
+
+
+def test_running_jobs_keep_their_claim_through_heartbeats(store):
+    started, finish = threading.Event(), threading.Event()
+
+    def work(job_id, **kwargs):
+        started.set()
+        finish.wait(5)
+
+    queue = SharedJobQueue(store, worker_fn=work, num_workers=1, poll_interval=0.01, claim_timeout=0.2)
+    queue.start()
+    try:
+        queue.submit('long', {'topic': 'long'})
+        assert started.wait(5)
+        # Another worker's heartbeat check, well after the claim was taken
+        time.sleep(0.4)
+        assert store.requeue_claims(cutoff=time.time() - 0.2) == []
+        assert store.queue_stats(cutoff=time.time() - 0.2)['running'] == 1
+    finally:
+        finish.set()
+        queue.stop(timeout=5)
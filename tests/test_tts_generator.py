@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+import tts_generator
+
+
+SCENES = [{'text': f"Scene number {index}"} for index in range(1, 5)]
+
+
+@pytest.fixture(autouse=True)
+def fixed_duration(monkeypatch):
+    # ffprobe can't read the fake MP3s; durations are not under test here
+    monkeypatch.setattr(tts_generator, 'get_audio_duration', lambda path: 1.5)
+
+
+def test_fragments_are_requested_concurrently_in_scene_order(fake_api, openai_client, tmp_path):
+    fake_api.respond(body=b'fake-mp3', delay=0.3)
+
+    started = time.monotonic()
+    fragments, durations = tts_generator.generate_audio_fragments(
+        openai_client, SCENES, output_dir=str(tmp_path), concurrency=4
+    )
+    elapsed = time.monotonic() - started
+
+    assert list(fragments) == [1, 2, 3, 4]
+    assert fragments[3] == str(tmp_path / 'audio_fragments' / 'fragment_3.mp3')
+    assert durations == {1: 1.5, 2: 1.5, 3: 1.5, 4: 1.5}
+    assert fake_api.max_active == 4
+    # Roughly one request's latency, not the sum of all four
+    assert elapsed < 0.3 * len(SCENES)
+    assert sorted(request['json']['input'] for request in fake_api.requests) == [
+        scene['text'] for scene in SCENES
+    ]
+
+
+def test_tts_limiter_caps_concurrent_requests(fake_api, openai_client, tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_TTS_MAX_CONCURRENCY', '2')
+    fake_api.respond(body=b'fake-mp3', delay=0.1)
+
+    fragments, _ = tts_generator.generate_audio_fragments(
+        openai_client, SCENES, output_dir=str(tmp_path), concurrency=4
+    )
+
+    assert len(fragments) == len(SCENES)
+    assert fake_api.max_active == 2
+
+
+def test_rate_limited_fragment_is_retried(fake_api, openai_client, tmp_path):
+    fake_api.respond(status=429, body={'error': {'message': 'slow down'}}, headers={'retry-after': '0'})
+    fake_api.respond(body=b'fake-mp3')
+
+    path, duration = tts_generator.generate_audio_fragment(
+        openai_client, "Hello", 1, output_dir=str(tmp_path)
+    )
+
+    assert len(fake_api.requests) == 2
+    assert duration == 1.5
+    with open(path, 'rb') as f:
+        assert f.read() == b'fake-mp3'
+
+
+def test_fragment_fails_after_retries_run_out(fake_api, openai_client, tmp_path):
+    fake_api.respond(status=503, body={'error': {'message': 'unavailable'}}, headers={'retry-after': '0'})
+
+    path, duration = tts_generator.generate_audio_fragment(
+        openai_client, "Hello", 1, output_dir=str(tmp_path), max_retries=2
+    )
+
+    assert (path, duration) == (None, None)
+    assert len(fake_api.requests) == 3
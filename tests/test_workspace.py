@@ -0,0 +1,34 @@
+import os
+
+import workspace
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_content_addressed_publish_names_the_file_after_its_bytes(tmp_path):
+    media = tmp_path / 'media'
+    job = 'output_1234'
+
+    first = workspace.publish_file(write(tmp_path / 'a.mp4', b'preview'), str(media / f'{job}.mp4'), content_addressed=True)
+    second = workspace.publish_file(write(tmp_path / 'b.mp4', b'resumed'), str(media / f'{job}.mp4'), content_addressed=True)
+
+    assert first != second
+    assert os.path.basename(second) == f"{job}.{workspace.file_digest(second)}.mp4"
+    # The earlier version is gone
+    assert os.listdir(media) == [os.path.basename(second)]
+
+
+def test_republishing_identical_bytes_keeps_the_url(tmp_path):
+    media = tmp_path / 'media'
+
+    first = workspace.publish_file(write(tmp_path / 'a.mp4', b'same'), str(media / 'output_1.mp4'), content_addressed=True)
+    second = workspace.publish_file(write(tmp_path / 'b.mp4', b'same'), str(media / 'output_1.mp4'), content_addressed=True)
+    workspace.publish_file(write(tmp_path / 'c.mp4', b'other'), str(media / 'output_1_preview.mp4'), content_addressed=True)
+
+    assert first == second
+    assert os.path.exists(second)
+    assert len(os.listdir(media)) == 2
@@ -1,7 +1,35 @@
 import os
+import threading
 import subprocess
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
+from disk_cache import DiskCache, make_cache_key, link_or_copy
+from llm_client import call_with_retry
+from metrics import traced, annotate, annotate_file, propagate_context
+
+
+# Concurrent TTS requests per job and retry policy for rate limits/server errors
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', '4'))
+TTS_MAX_RETRIES = int(os.getenv('TTS_MAX_RETRIES', '4'))
+TTS_BACKOFF_BASE = float(os.getenv('TTS_BACKOFF_BASE', '1.0'))
+
+# Content-addressed cache of generated fragments (MP3 + measured duration)
+TTS_CACHE_ENABLED = os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true'
+tts_cache = DiskCache(
+    os.getenv('TTS_CACHE_DIR', 'media/cache/tts'),
+    max_bytes=int(float(os.getenv('TTS_CACHE_MAX_MB', '512')) * 1024 * 1024)
+)
+
+_cache_stats_lock = threading.Lock()
+
+
+def _record_cache_result(cache_stats, hit):
+    if cache_stats is None:
+        return
+    with _cache_stats_lock:
+        key = 'hits' if hit else 'misses'
+        cache_stats[key] = cache_stats.get(key, 0) + 1
 
 
 def get_audio_duration(audio_path):
@@ -33,7 +61,8 @@ def get_audio_duration(audio_path):
         return None
 
 
-def generate_audio_fragment(client, text, index, output_dir="media/audio_fragments", tts_model="tts-1", voice="alloy"):
+@traced('tts', succeeded=lambda result: result[0] is not None)
+def generate_audio_fragment(client, text, index, output_dir="media/audio_fragments", tts_model="tts-1", voice="alloy", max_retries=TTS_MAX_RETRIES, cache_stats=None):
     """
     Generates an audio fragment from text using OpenAI TTS
     
@@ -44,10 +73,13 @@ def generate_audio_fragment(client, text, index, output_dir="media/audio_fragmen
         output_dir: Directory to save audio fragments
         tts_model: TTS model to use (tts-1 or tts-1-hd)
         voice: Voice to use (alloy, echo, fable, onyx, nova, shimmer)
+        max_retries: Retries on rate-limit and server errors
+        cache_stats: Optional dict whose 'hits'/'misses' counters are incremented
     
     Returns:
         Tuple of (audio_path, duration) or (None, None) if error
     """
+    annotate(scene=index)
     try:
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -55,21 +87,46 @@ def generate_audio_fragment(client, text, index, output_dir="media/audio_fragmen
         # Generate audio file path
         audio_path = os.path.join(output_dir, f"fragment_{index}.mp3")
         
+        # Identical narration is served from the cache: no API call, no ffprobe
+        cache_key = make_cache_key('tts', text, tts_model, voice)
+        if TTS_CACHE_ENABLED:
+            cached = tts_cache.get(cache_key)
+            if cached:
+                link_or_copy(cached['files']['audio.mp3'], audio_path)
+                _record_cache_result(cache_stats, hit=True)
+                annotate(cache_hit=True)
+                print(f"  [OK] Audio fragment {index} served from cache (duration: {cached.get('duration') or 0:.2f}s)")
+                return audio_path, cached.get('duration')
+            _record_cache_result(cache_stats, hit=False)
+        
+        # The old file may be hard-linked into the cache; never write through it
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        
         print(f"  Generating audio fragment {index}...")
         print(f"    Text preview: {text[:80]}...")
         
-        # Call OpenAI TTS API
-        response = client.audio.speech.create(
-            model=tts_model,
-            voice=voice,
-            input=text
-        )
+        # Call OpenAI TTS API under the shared TTS limits, backing off on rate limits
+        def create_speech():
+            response = client.audio.speech.create(
+                model=tts_model,
+                voice=voice,
+                input=text
+            )
+            # Save audio to file
+            response.stream_to_file(audio_path)
         
-        # Save audio to file
-        response.stream_to_file(audio_path)
+        call_with_retry('openai_tts', create_speech, max_retries=max_retries, backoff_base=TTS_BACKOFF_BASE)
         
         # Get audio duration
         duration = get_audio_duration(audio_path)
+        annotate_file(audio_path)
+        
+        if TTS_CACHE_ENABLED and duration:
+            try:
+                tts_cache.put(cache_key, files={'audio.mp3': audio_path}, meta={'duration': duration})
+            except OSError as e:
+                print(f"  [WARNING] Could not cache audio fragment {index}: {e}")
         
         if duration:
             print(f"  [OK] Audio fragment saved: {audio_path} (duration: {duration:.2f}s)")
@@ -83,13 +140,15 @@ def generate_audio_fragment(client, text, index, output_dir="media/audio_fragmen
         return None, None
 
 
-def concatenate_audio_fragments(audio_paths, output_path="media/audio.mp3"):
+@traced('concat_audio')
+def concatenate_audio_fragments(audio_paths, output_path="media/audio.mp3", list_file=None):
     """
     Concatenates multiple audio fragments into a single MP3 file using ffmpeg
     
     Args:
         audio_paths: List of paths to audio fragments
         output_path: Path for the final concatenated audio file
+        list_file: Path for the ffmpeg concat list (defaults to next to output_path)
     
     Returns:
         True if successful, False otherwise
@@ -98,11 +157,13 @@ def concatenate_audio_fragments(audio_paths, output_path="media/audio.mp3"):
         print("[ERROR] No audio fragments to concatenate")
         return False
     
-    # Create media folder if it doesn't exist
-    os.makedirs("media", exist_ok=True)
+    # Create output folder if it doesn't exist
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
     
     # Create list file for ffmpeg
-    list_file = "media/audio_list.txt"
+    if list_file is None:
+        list_file = os.path.join(output_dir, "audio_list.txt")
     with open(list_file, 'w') as f:
         for audio_path in audio_paths:
             if os.path.exists(audio_path):
@@ -124,6 +185,7 @@ def concatenate_audio_fragments(audio_paths, output_path="media/audio.mp3"):
         
         if result.returncode == 0:
             print(f"  [OK] Final audio created: {output_path}")
+            annotate_file(output_path)
             # Clean up temporary file
             os.remove(list_file)
             return True
@@ -137,12 +199,22 @@ def concatenate_audio_fragments(audio_paths, output_path="media/audio.mp3"):
         return False
 
 
-def generate_complete_audio(client, video_data, tts_model="tts-1", voice="alloy"):
+def generate_audio_fragments(client, video_data, tts_model="tts-1", voice="alloy", output_dir="media", concurrency=None, cache_stats=None, indices=None):
     """
-    Generates complete audio for all scenes
+    Generates one audio fragment per scene without concatenating them
+    
+    Fragments are requested concurrently (every scene's text is known up
+    front); results are collected by scene index so ordering is preserved.
+    
+    Args:
+        output_dir: Directory for the audio_fragments folder
+        concurrency: Maximum simultaneous TTS requests (defaults to TTS_CONCURRENCY)
+        cache_stats: Optional dict collecting TTS cache 'hits'/'misses'
+        indices: Only generate these scene indices (default: all scenes)
     
     Returns:
-        Tuple of (audio_path, durations_dict) where durations_dict maps scene index to duration
+        Tuple of (fragments_dict, durations_dict) mapping scene index to
+        fragment path and to duration
     """
     print(f"\n{'='*80}")
     print(f"GENERATING AUDIO WITH TTS")
@@ -151,39 +223,74 @@ def generate_complete_audio(client, video_data, tts_model="tts-1", voice="alloy"
     print(f"Voice: {voice}")
     print(f"Scenes: {len(video_data)}\n")
     
-    audio_fragments = []
+    audio_fragments = {}  # Map scene index to fragment path
     audio_durations = {}  # Map scene index to duration
+    fragments_dir = os.path.join(output_dir, "audio_fragments")
     
-    # Generate audio for each scene
-    for index, scene_data in enumerate(video_data, 1):
-        text = scene_data.get('text', '')
-        
-        if not text:
-            print(f"  [WARNING] Scene {index} has no text, skipping...")
-            continue
-        
-        audio_path, duration = generate_audio_fragment(
-            client=client,
-            text=text,
-            index=index,
-            tts_model=tts_model,
-            voice=voice
-        )
+    # Generate audio for all scenes concurrently
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency or TTS_CONCURRENCY),
+                            thread_name_prefix='tts') as pool:
+        for index, scene_data in enumerate(video_data, 1):
+            if indices is not None and index not in indices:
+                continue
+            
+            text = scene_data.get('text', '')
+            
+            if not text:
+                print(f"  [WARNING] Scene {index} has no text, skipping...")
+                continue
+            
+            futures[index] = pool.submit(
+                propagate_context(generate_audio_fragment),
+                client=client,
+                text=text,
+                index=index,
+                output_dir=fragments_dir,
+                tts_model=tts_model,
+                voice=voice,
+                cache_stats=cache_stats
+            )
+    
+    # Collect in scene order
+    for index in sorted(futures):
+        audio_path, duration = futures[index].result()
         
         if audio_path and os.path.exists(audio_path):
-            audio_fragments.append(audio_path)
+            audio_fragments[index] = audio_path
             if duration:
                 audio_durations[index] = duration
         else:
             print(f"  [WARNING] Could not generate audio for scene {index}")
     
+    return audio_fragments, audio_durations
+
+
+def generate_complete_audio(client, video_data, tts_model="tts-1", voice="alloy", output_dir="media", concurrency=None, cache_stats=None):
+    """
+    Generates complete audio for all scenes
+    
+    Args:
+        output_dir: Directory for the fragments and the concatenated audio.mp3
+        concurrency: Maximum simultaneous TTS requests (defaults to TTS_CONCURRENCY)
+        cache_stats: Optional dict collecting TTS cache 'hits'/'misses'
+    
+    Returns:
+        Tuple of (audio_path, durations_dict) where durations_dict maps scene index to duration
+    """
+    fragments, audio_durations = generate_audio_fragments(
+        client, video_data, tts_model=tts_model, voice=voice, output_dir=output_dir,
+        concurrency=concurrency, cache_stats=cache_stats
+    )
+    audio_fragments = [fragments[index] for index in sorted(fragments)]
+    
     # Concatenate all audio fragments
     if audio_fragments:
         print(f"\n{'='*80}")
         print(f"CONCATENATING {len(audio_fragments)} AUDIO FRAGMENTS")
         print(f"{'='*80}")
         
-        output_path = "media/audio.mp3"
+        output_path = os.path.join(output_dir, "audio.mp3")
         success = concatenate_audio_fragments(audio_fragments, output_path)
         
         if success:
@@ -1,100 +1,616 @@
 import os
 import json
+import time
 import uuid
+import queue
 import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from dotenv import load_dotenv
-import openai
-import anthropic
-from animations import generate_script_json
-from manim_generator import generate_manim_code
-from concat_video import compile_video, concatenate_videos, sanitize_filename, merge_video_and_audio
-from tts_generator import generate_complete_audio
+from animations import generate_script_json, stream_script_scenes
+from llm_client import get_client, forget_completion
+from manim_generator import generate_manim_code, generate_manim_code_batch
+from concat_video import render_scene, sanitize_filename, finalize_video, parse_render_profile
+from resource_scheduler import scheduler, HOST_CPU_SHARE
+from render_worker import terminate_render_worker_pool
+from tts_generator import generate_audio_fragments, generate_audio_fragment, TTS_CONCURRENCY
+from job_queue import JobQueue, SharedJobQueue, JobCancelledError, JobInterruptedError, QueueFullError
+from job_store import create_job_store, FINISHED_STATUSES
+from workspace import create_job_workspace, publish_file, cleanup_job_workspace, prune_workspaces
+from job_events import job_events, StoreWatcher
+from checkpoint import JobManifest
+from scene_validator import check_scene, format_errors, errors_from_traceback
+from metrics import job_context, span, job_spans, propagate_context
+from progress_estimator import (
+    ProgressTracker, progress_stats, start_tracking, get_tracker, stop_tracking, estimate_job_seconds
+)
 
 load_dotenv()
 
-# Global job storage (in production, use Redis or a database)
-jobs = {}
+# Job storage backend (SQLite by default, see JOB_STORE_BACKEND)
+job_store = create_job_store()
 
-def setup_llm_client(provider_preference='auto'):
-    """Sets up the LLM client based on preference and available API keys"""
+# Job queue configuration
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', '2'))
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', '20'))
+JOB_QUEUE_FILE = os.getenv('JOB_QUEUE_FILE', 'media/job_queue.json')
+# "local": jobs run in worker threads of the API process; "external": the queue
+# lives in the job store and jobs are run by separate worker.py processes
+JOB_QUEUE_MODE = os.getenv('JOB_QUEUE_MODE', 'local').lower()
+# External mode: idle worker poll interval, and seconds without a heartbeat
+# after which a worker's jobs are handed to another worker
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv('JOB_QUEUE_POLL_INTERVAL', '1'))
+JOB_CLAIM_TIMEOUT = float(os.getenv('JOB_CLAIM_TIMEOUT', '120'))
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+# Set when this worker process shuts down: running jobs stop and are requeued
+_interrupted = threading.Event()
+# External mode: relays changes made by worker processes to this process's streams
+store_watcher = StoreWatcher(job_store, job_events, interval=JOB_QUEUE_POLL_INTERVAL)
+
+# Scene pipeline configuration
+CODEGEN_WORKERS = int(os.getenv('CODEGEN_WORKERS', '4'))
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', str(HOST_CPU_SHARE)))
+SCENE_CONTINUITY = os.getenv('SCENE_CONTINUITY', 'true').lower() == 'true'
+# Stream the script and start narration/code generation as each scene arrives
+SCRIPT_STREAMING = os.getenv('SCRIPT_STREAMING', 'true').lower() == 'true'
+# Code generation: "scene" (one request per scene) or "batch" (CODEGEN_BATCH_SIZE
+# scenes per request, sharing one copy of the rules prompt)
+CODEGEN_MODE = os.getenv('CODEGEN_MODE', 'scene').lower()
+CODEGEN_BATCH_SIZE = int(os.getenv('CODEGEN_BATCH_SIZE', '4'))
+# LLM repair attempts per scene after a failed check or render (0 = drop the scene)
+SCENE_REPAIR_ATTEMPTS = int(os.getenv('SCENE_REPAIR_ATTEMPTS', '2'))
+
+# Keep job workspaces after the job finishes (for debugging)
+KEEP_WORKSPACES = os.getenv('KEEP_WORKSPACES', 'false').lower() == 'true'
+
+# Shared render pool: every job submits its scenes here, so the number of
+# concurrent manim processes on the box never exceeds RENDER_WORKERS
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Returns the process-wide render executor, creating it on first use"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ThreadPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                thread_name_prefix='render'
+            )
+        return _render_pool
+
+def resolve_llm_provider(provider_preference='auto'):
+    """
+    Picks the LLM provider based on preference and available API keys
     
-    openai_api_key = os.getenv('OPENAI_API_KEY')
+    Raises:
+        ValueError: If neither API key is configured
+    """
     claude_api_key = os.getenv('CLAUDE_API_KEY')
-    openai_model = os.getenv("OPENAI_MODEL", "gpt-4")
-    claude_model = os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-20241022")
+    openai_api_key = os.getenv('OPENAI_API_KEY')
     
     # If specific provider requested
     if provider_preference == 'claude' and claude_api_key:
-        client = anthropic.Anthropic(api_key=claude_api_key)
-        return {
-            'client': client,
-            'provider': 'claude',
-            'model': claude_model
-        }
-    
+        return 'claude'
     if provider_preference == 'openai' and openai_api_key:
-        client = openai.OpenAI(api_key=openai_api_key)
-        return {
-            'client': client,
-            'provider': 'openai',
-            'model': openai_model
-        }
+        return 'openai'
     
     # Auto mode: Priority 1 Claude, Priority 2 OpenAI
     if claude_api_key:
-        client = anthropic.Anthropic(api_key=claude_api_key)
-        return {
-            'client': client,
-            'provider': 'claude',
-            'model': claude_model
-        }
-    
+        return 'claude'
     if openai_api_key:
-        client = openai.OpenAI(api_key=openai_api_key)
-        return {
-            'client': client,
-            'provider': 'openai',
-            'model': openai_model
-        }
+        return 'openai'
     
     raise ValueError(
         "No API key found! Please configure either CLAUDE_API_KEY or OPENAI_API_KEY in your .env file"
     )
 
 
-def update_job_status(job_id, status=None, progress=None, current_step=None, message=None, error=None, video_url=None):
-    """Update job status in storage"""
-    if job_id not in jobs:
-        jobs[job_id] = {}
+def setup_llm_client(provider_preference='auto'):
+    """Returns the client and model of the provider picked by resolve_llm_provider (clients are shared, see llm_client.get_client)"""
+    provider = resolve_llm_provider(provider_preference)
+    if provider == 'claude':
+        model = os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-20241022")
+    else:
+        model = os.getenv("OPENAI_MODEL", "gpt-4")
+    return {
+        'client': get_client(provider),
+        'provider': provider,
+        'model': model
+    }
+
+
+def pass_tracking_options(enable_tts, render_pass, has_script=False):
+    """
+    ProgressTracker phase options for a job pass
+    
+    Shared by the tracker of a running pass and the estimate of a queued
+    one, so both read and record the same stats.
+    """
+    return {
+        'tts': bool(enable_tts and os.getenv('OPENAI_API_KEY')),
+        'streaming': SCRIPT_STREAMING and render_pass == 'preview' and not has_script
+    }
+
+
+def update_job_status(job_id, status=None, progress=None, current_step=None, message=None, error=None, video_url=None, **extra):
+    """
+    Update job status in storage (extra keyword arguments are stored as-is)
+    
+    While the job has a ProgressTracker in this process, every update
+    without an explicit progress refreshes progress and ETA from it.
+    """
+    fields = dict(extra)
+    
+    tracker = get_tracker(job_id)
+    if progress is None and tracker and status in (None, 'running'):
+        fields.update(tracker.status())
+    elif status and status != 'running':
+        # Queued and finished jobs have no running estimate
+        fields.update(eta_seconds=None, eta_at=None)
     
     if status:
-        jobs[job_id]['status'] = status
+        fields['status'] = status
     if progress is not None:
-        jobs[job_id]['progress'] = progress
+        fields['progress'] = progress
     if current_step:
-        jobs[job_id]['current_step'] = current_step
+        fields['current_step'] = current_step
     if message:
-        jobs[job_id]['message'] = message
+        fields['message'] = message
     if error:
-        jobs[job_id]['error'] = error
+        fields['error'] = error
     if video_url:
-        jobs[job_id]['video_url'] = video_url
+        fields['video_url'] = video_url
+    
+    fields['updated_at'] = datetime.now().isoformat()
+    job = job_store.update(job_id, fields)
+    
+    # Wake up progress streams waiting on this job (a missing job ends them)
+    job_events.notify(job_id, finished=job is None or job.get('status') in FINISHED_STATUSES)
+    return job
+
+
+def generate_scene_code(client, scene_data, index, previous_scene, provider, model,
+                        audio_duration, topic_slug, job_id, content_dir, repair_context=None):
+    """
+    Generates (or repairs) the Manim source for one scene and writes it to disk
+    
+    The written file goes through the cheap pre-render checks (parse, class
+    name, import) so broken code never reaches the render pool.
+    
+    Returns:
+        Tuple of (filepath, class_name, errors, cache_key) or None if code
+        generation failed; errors is a list of structured validation errors
+        (empty when the checks pass), cache_key the LLM cache entry of the code
+    """
+    check_cancelled(job_id)
+    
+    text = scene_data.get('text', '')
+    animation = scene_data.get('animation', '')
+    
+    # Context comes from the script, not from the previous scene's compiled
+    # code, so scenes don't have to wait on each other
+    previous_context = None
+    if previous_scene:
+        previous_context = {
+            'text': previous_scene.get('text', ''),
+            'animation': previous_scene.get('animation', '')
+        }
+    
+    manim_code = generate_manim_code(
+        client, text, animation, index, 
+        previous_context, provider, model, 
+        audio_duration=audio_duration,
+        repair_context=repair_context
+    )
+    
+    if not manim_code:
+        return None
+    
+    return write_scene_code(manim_code, index, topic_slug, job_id, content_dir)
+
+
+def write_scene_code(manim_code, index, topic_slug, job_id, content_dir):
+    """
+    Writes generated code ({'content', 'class_name', 'cache_key'}) to disk and runs the pre-render checks
+    
+    Returns:
+        Tuple of (filepath, class_name, errors, cache_key)
+    """
+    code_content = manim_code.get('content', '')
+    class_name = manim_code.get('class_name', f'Scene{index}')
+    
+    filename = f"{topic_slug}-{job_id}-{index}.py"
+    filepath = os.path.join(content_dir, filename)
+    
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(code_content)
     
-    jobs[job_id]['updated_at'] = datetime.now().isoformat()
+    return filepath, class_name, check_scene(filepath, class_name), manim_code.get('cache_key')
 
 
-def generate_video_workflow(job_id, topic, enable_tts, llm_provider):
-    """Background worker for video generation"""
+def generate_scene_code_batch(client, video_data, indices, previous_scene, provider, model,
+                              audio_durations, topic_slug, job_id, content_dir):
+    """
+    Generates the Manim source for several scenes with one LLM request
+    
+    Returns:
+        Dict mapping scene index to (filepath, class_name, errors, cache_key);
+        scenes the response left out are missing from the dict
+    """
+    check_cancelled(job_id)
+    
+    scenes = [
+        {
+            'index': index,
+            'text': video_data[index - 1].get('text', ''),
+            'animation': video_data[index - 1].get('animation', ''),
+            'audio_duration': audio_durations.get(index)
+        }
+        for index in indices
+    ]
+    previous_context = None
+    if previous_scene:
+        previous_context = {
+            'text': previous_scene.get('text', ''),
+            'animation': previous_scene.get('animation', '')
+        }
+    
+    manim_codes = generate_manim_code_batch(client, scenes, previous_context, provider, model)
+    return {
+        index: write_scene_code(manim_code, index, topic_slug, job_id, content_dir)
+        for index, manim_code in manim_codes.items()
+    }
+
+
+def run_scene_pipeline(job_id, video_data, client, provider, model,
+                       audio_durations, topic_slug, workspace, manifest=None,
+                       profile='preview', indices=None, scene_feed=None):
+    """
+    Generates and compiles all scenes, overlapping LLM calls and renders
+    
+    Code generation runs on a per-job thread pool; as soon as a scene's code
+    is ready its render is submitted to the shared render pool, so scene N+1
+    is being generated while scene N renders. Scenes with a render or code
+    checkpoint in the manifest skip the corresponding stage.
+    
+    In CODEGEN_MODE=batch, scenes are generated CODEGEN_BATCH_SIZE at a time
+    with one request each; scenes a batch misses fall back to one request
+    per scene, and repairs are always per scene.
+    
+    A scene whose code fails the pre-render checks or the render itself is
+    sent back to the LLM with the errors, up to SCENE_REPAIR_ATTEMPTS times,
+    before it is dropped from the video. The latest errors of every failing
+    scene are published in the job's scene_errors field.
+    
+    Renders use the given render profile; only the scenes listed in indices
+    (1-based, default all) are processed.
+    
+    With scene_feed (a queue.Queue), scenes are started as their indices
+    arrive on the queue instead: video_data and audio_durations keep growing
+    while the pipeline runs, and None marks the end of the feed. An
+    exception put on the feed stops the pipeline and is raised.
+    
+    Returns:
+        Dict mapping scene index to compiled video path
+    """
+    if scene_feed is None:
+        indices = list(indices or range(1, len(video_data) + 1))
+    else:
+        indices = []
+    
+    def scene_total():
+        return len(video_data) if scene_feed is not None else len(indices)
+    
+    # Preview renders keep the original checkpoint name so old manifests resume
+    render_stage = 'render' if profile == 'preview' else f'render_{profile}'
+    render_pool = get_render_pool()
+    tracker = get_tracker(job_id)
+    pending = {}  # future -> (stage, scene index or batch of indices, repair attempt)
+    sources = {}  # scene index -> (filepath, class_name) of the latest attempt
+    videos_by_index = {}
+    batch_buffer = []  # scenes waiting for a full batch (CODEGEN_MODE=batch)
+    scene_errors = {}  # scene index (str) -> structured errors of the latest attempt
+    cache_keys = {}  # scene index -> LLM cache entry of its current code
+    finished = 0
+    
+    with ThreadPoolExecutor(max_workers=CODEGEN_WORKERS, thread_name_prefix='codegen') as codegen_pool:
+        
+        def submit_code(index, attempt=0, repair_context=None):
+            previous_scene = video_data[index - 2] if SCENE_CONTINUITY and index > 1 else None
+            future = codegen_pool.submit(
+                propagate_context(generate_scene_code), client, video_data[index - 1], index, previous_scene,
+                provider, model, audio_durations.get(index, None),
+                topic_slug, job_id, workspace['scenes'], repair_context=repair_context
+            )
+            pending[future] = ('code', index, attempt)
+        
+        def flush_batch():
+            if not batch_buffer:
+                return
+            indices_in_batch = list(batch_buffer)
+            batch_buffer.clear()
+            first = indices_in_batch[0]
+            previous_scene = video_data[first - 2] if SCENE_CONTINUITY and first > 1 else None
+            future = codegen_pool.submit(
+                propagate_context(generate_scene_code_batch), client, video_data, indices_in_batch, previous_scene,
+                provider, model, audio_durations, topic_slug, job_id, workspace['scenes']
+            )
+            pending[future] = ('batch', indices_in_batch, 0)
+        
+        def submit_render(index, attempt, filepath, class_name):
+            sources[index] = (filepath, class_name)
+            future = render_pool.submit(
+                propagate_context(render_scene), filepath, class_name, topic_slug, index,
+                media_dir=workspace['renders'], profile=profile
+            )
+            pending[future] = ('render', index, attempt)
+        
+        def repair_or_drop(index, attempt, errors):
+            """Returns True if a repair was submitted, False once the budget is spent"""
+            scene_errors[str(index)] = errors
+            error = format_errors(errors)
+            # Don't replay known-broken code on the next run of the same script
+            forget_completion(cache_keys.pop(index, None))
+            if attempt >= SCENE_REPAIR_ATTEMPTS:
+                print(f"[ERROR] Dropping scene {index} after {attempt + 1} attempts:\n{error}")
+                update_job_status(job_id, message=f'Scene {index} dropped after {attempt + 1} attempts', 
+                                 scene_errors=scene_errors)
+                return False
+            
+            with open(sources[index][0], 'r', encoding='utf-8') as f:
+                failing_code = f.read()
+            update_job_status(job_id, current_step='code', 
+                             message=f'Scene {index} failed, repairing (attempt {attempt + 1}/{SCENE_REPAIR_ATTEMPTS})...',
+                             scene_errors=scene_errors)
+            submit_code(index, attempt + 1, {'code': failing_code, 'error': error})
+            return True
+        
+        def handle_code(index, attempt, generated):
+            """Renders freshly generated code, or repairs/drops it if it failed"""
+            nonlocal finished
+            if not generated:
+                finished += 1
+                if tracker:
+                    tracker.scene_done(index)
+                return
+            
+            filepath, class_name, errors, cache_keys[index] = generated
+            sources[index] = (filepath, class_name)
+            if errors:
+                if not repair_or_drop(index, attempt, errors):
+                    finished += 1
+                    if tracker:
+                        tracker.scene_done(index)
+                return
+            
+            if tracker:
+                tracker.scene_coded(index)
+            if manifest:
+                manifest.set('code', {'path': filepath, 'class_name': class_name}, index)
+            update_job_status(job_id, current_step='code', 
+                             message=f'Scene {index}/{scene_total()} code generated, rendering...')
+            submit_render(index, attempt, filepath, class_name)
+        
+        def start_scene(index):
+            """Submits a scene's first stage; returns True if it was already rendered"""
+            if tracker:
+                tracker.scene_started(index)
+            # Resume: reuse finished renders, or render checkpointed code
+            if manifest:
+                rendered = manifest.get(render_stage, index)
+                if rendered:
+                    videos_by_index[index] = rendered['path']
+                    if tracker:
+                        tracker.scene_done(index)
+                    return True
+                code = manifest.get('code', index)
+                if code:
+                    submit_render(index, 0, code['path'], code['class_name'])
+                    return False
+            
+            if CODEGEN_MODE == 'batch':
+                batch_buffer.append(index)
+                if len(batch_buffer) >= CODEGEN_BATCH_SIZE:
+                    flush_batch()
+            else:
+                submit_code(index)
+            return False
+        
+        try:
+            for index in indices:
+                if start_scene(index):
+                    finished += 1
+            flush_batch()
+            
+            feeding = scene_feed is not None
+            while pending or feeding:
+                # Start scenes that arrived from the feed (block only when idle)
+                while feeding:
+                    try:
+                        index = scene_feed.get(block=not pending, timeout=1)
+                    except queue.Empty:
+                        check_cancelled(job_id)
+                        if pending:
+                            break
+                        continue
+                    if index is None:
+                        feeding = False
+                        flush_batch()
+                    elif isinstance(index, Exception):
+                        raise index
+                    elif start_scene(index):
+                        finished += 1
+                
+                if not pending:
+                    continue
+                # While feeding, wake up regularly to pick up new scenes
+                done, _ = wait(pending, timeout=0.5 if feeding else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    check_cancelled(job_id)
+                    stage, index, attempt = pending.pop(future)
+                    
+                    if stage == 'batch':
+                        # index holds the batch's scene indices here
+                        try:
+                            generated_batch = future.result()
+                        except JobCancelledError:
+                            raise
+                        except Exception as e:
+                            print(f"[ERROR] Code generation failed for scenes {index}: {e}")
+                            generated_batch = {}
+                        
+                        for scene_index in index:
+                            if scene_index in generated_batch:
+                                handle_code(scene_index, 0, generated_batch[scene_index])
+                            else:
+                                submit_code(scene_index)
+                        continue
+                    
+                    if stage == 'code':
+                        try:
+                            generated = future.result()
+                        except JobCancelledError:
+                            raise
+                        except Exception as e:
+                            print(f"[ERROR] Code generation failed for scene {index}: {e}")
+                            generated = None
+                        
+                        handle_code(index, attempt, generated)
+                        continue
+                    
+                    try:
+                        video_path, error = future.result()
+                    except Exception as e:
+                        video_path, error = None, str(e)
+                    
+                    if not (video_path and os.path.exists(video_path)):
+                        errors = errors_from_traceback(error or 'Render produced no video file',
+                                                       sources[index][0], 'render_error')
+                        if repair_or_drop(index, attempt, errors):
+                            continue
+                    else:
+                        videos_by_index[index] = video_path
+                        if scene_errors.pop(str(index), None) is not None:
+                            update_job_status(job_id, scene_errors=scene_errors)
+                        if manifest:
+                            manifest.set(render_stage, {'path': video_path}, index)
+                    
+                    finished += 1
+                    if tracker:
+                        tracker.scene_done(index)
+                    total = max(scene_total(), finished)
+                    update_job_status(job_id, current_step='code', 
+                                     message=f'Rendered scene {index} ({finished}/{total})')
+        except Exception:
+            # Free the shared render pool for other jobs
+            for future in pending:
+                future.cancel()
+            raise
+    
+    return videos_by_index
+
+
+def stream_script_and_audio(job_id, topic, enable_tts, client, provider, model, workspace, manifest,
+                            video_data, audio_fragments, audio_durations, scene_feed, stream_state):
+    """
+    Streams the script and narrates each scene as soon as it arrives
+    
+    Runs on its own thread next to run_scene_pipeline: scenes are appended
+    to video_data, their narration recorded in audio_fragments and
+    audio_durations, and each scene's index is put on scene_feed once it is
+    ready for code generation. None is put on the feed when the stream ends;
+    an exception that ended it is stored in stream_state['error'] and put
+    on the feed instead, which stops the scene pipeline.
+    """
+    json_file = os.path.join(workspace['scripts'], "video-output.json")
+    tts_client = None
+    if enable_tts and os.getenv('OPENAI_API_KEY'):
+        tts_client = get_client('openai')
+        tts_model = os.getenv("TTS_MODEL", "tts-1")
+        voice = os.getenv("VOICE", "alloy")
+    tts_cache_stats = {'hits': 0, 'misses': 0}
+    
+    def narrate(index, text):
+        try:
+            fragment_path, duration = generate_audio_fragment(
+                tts_client, text, index,
+                # Same folder generate_audio_fragments writes to
+                output_dir=os.path.join(workspace['audio'], 'audio_fragments'),
+                tts_model=tts_model,
+                voice=voice,
+                cache_stats=tts_cache_stats
+            )
+            if fragment_path:
+                audio_fragments[index] = fragment_path
+                if duration:
+                    audio_durations[index] = duration
+                manifest.set('audio', {'path': fragment_path, 'duration': duration}, index)
+        finally:
+            # Without narration the scene is still generated, just not synced
+            scene_feed.put(index)
     
     try:
-        # Create necessary directories
-        content_dir = "content"
-        os.makedirs(content_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix='tts') as tts_pool:
+            try:
+                for scene in stream_script_scenes(client, topic, json_file, provider, model):
+                    check_cancelled(job_id)
+                    video_data.append(scene)
+                    index = len(video_data)
+                    update_job_status(job_id, current_step='script', 
+                                     message=f'Scene {index} scripted, generating...')
+                    if tts_client:
+                        tts_pool.submit(propagate_context(narrate), index, scene.get('text', ''))
+                    else:
+                        scene_feed.put(index)
+            except Exception:
+                # Narration for a script that failed is wasted work
+                tts_pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        
+        if not video_data:
+            raise Exception("Could not generate script")
+        manifest.set('script', {'path': json_file, 'scenes': len(video_data)})
+        tracker = get_tracker(job_id)
+        if tracker:
+            tracker.set_scene_count(len(video_data))
+            tracker.start_phase('scenes')
+        update_job_status(job_id, message=f'Script generated with {len(video_data)} scenes')
+        if tts_client:
+            update_job_status(job_id, tts_cache=tts_cache_stats)
+    except Exception as e:
+        stream_state['error'] = e
+    finally:
+        scene_feed.put(stream_state.get('error'))
+
+
+def generate_video_workflow(job_id, topic, enable_tts, llm_provider, render_profile='preview', render_pass='preview'):
+    """
+    Background worker for video generation
+    
+    Jobs with a render profile above 'preview' run twice: the preview pass
+    renders at preview quality and publishes a preview, then queues the
+    final pass at low priority, which re-renders the already-validated scene
+    code at the requested profile (script, audio and code come from the
+    workspace manifest).
+    """
+    
+    workspace = None
+    tracker = None
+    completed = False
+    pass_profile = 'preview' if render_pass == 'preview' else render_profile
+    try:
+        # Every intermediate file lives in the job's own workspace
         os.makedirs('media', exist_ok=True)
+        workspace = create_job_workspace(job_id)
+        manifest = JobManifest(workspace)
         
         # Step 1: Setup LLM
-        update_job_status(job_id, status='running', progress=5, current_step='script', 
+        update_job_status(job_id, status='running', current_step='script', 
                          message='Setting up LLM client...')
         
         llm_config = setup_llm_client(llm_provider)
@@ -102,171 +618,503 @@ def generate_video_workflow(job_id, topic, enable_tts, llm_provider):
         provider = llm_config['provider']
         model = llm_config['model']
         
-        # Step 2: Generate Script
-        update_job_status(job_id, progress=10, current_step='script', 
-                         message=f'Generating script with {provider}...')
+        # Queued estimates of later passes use the provider this job really runs on
+        update_job_status(job_id, resolved_provider=provider)
         
-        json_file = f"video-output-{job_id}.json"
-        video_data = generate_script_json(client, topic, json_file, provider, model)
+        json_file = os.path.join(workspace['scripts'], "video-output.json")
+        stream_thread = None
+        tracking_options = pass_tracking_options(enable_tts, render_pass, has_script=bool(manifest.get('script')))
+        streaming = tracking_options['streaming']
         
-        if not video_data:
-            raise Exception("Could not generate script")
-        
-        update_job_status(job_id, progress=25, current_step='script', 
-                         message=f'Script generated with {len(video_data)} scenes')
-        
-        # Step 3: Generate TTS Audio (if enabled)
-        audio_path = None
-        audio_durations = {}
+        # Progress and ETA come from how long similar jobs took; resumed
+        # passes skip work, so their timings are not learned
+        render_stage = 'render' if pass_profile == 'preview' else f'render_{pass_profile}'
+        resumed = bool(manifest.scene_entries(render_stage)) or bool(render_pass == 'preview' and manifest.get('script'))
+        tracker = start_tracking(job_id, ProgressTracker(
+            progress_stats, provider, pass_profile, render_pass,
+            learn=not resumed, **tracking_options
+        ))
         
-        if enable_tts:
-            update_job_status(job_id, progress=30, current_step='tts', 
-                             message='Generating audio with TTS...')
+        if streaming:
+            # Steps 2-3 streamed: each scene is narrated and handed to the scene
+            # pipeline as soon as the LLM finishes writing it
+            update_job_status(job_id, current_step='script', 
+                             message=f'Streaming script with {provider}...')
             
-            openai_api_key = os.getenv('OPENAI_API_KEY')
-            if openai_api_key:
-                tts_client = openai.OpenAI(api_key=openai_api_key)
-                tts_model = os.getenv("TTS_MODEL", "tts-1")
-                voice = os.getenv("VOICE", "alloy")
-                
-                audio_path, audio_durations = generate_complete_audio(
-                    client=tts_client,
-                    video_data=video_data,
-                    tts_model=tts_model,
-                    voice=voice
-                )
+            # Checkpoints without a script belong to a different script, including
+            # the renders and video of an earlier final pass at any profile
+            manifest.clear_families('audio', 'code', 'render', 'final')
+            video_data, audio_fragments, audio_durations = [], {}, {}
+            scene_feed = queue.Queue()
+            stream_state = {}
+            stream_thread = threading.Thread(
+                target=propagate_context(stream_script_and_audio),
+                args=(job_id, topic, enable_tts, client, provider, model, workspace, manifest,
+                      video_data, audio_fragments, audio_durations, scene_feed, stream_state),
+                name=f'script-stream-{job_id[:8]}',
+                daemon=True
+            )
+            stream_thread.start()
+        else:
+            scene_feed = None
+            # Step 2: Generate Script
+            update_job_status(job_id, current_step='script', 
+                             message=f'Generating script with {provider}...')
+            
+            if manifest.get('script'):
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    video_data = json.load(f)
+            else:
+                video_data = generate_script_json(client, topic, json_file, provider, model)
+            
+            if not video_data:
+                raise Exception("Could not generate script")
+            manifest.set('script', {'path': json_file, 'scenes': len(video_data)})
+            tracker.set_scene_count(len(video_data))
+            
+            update_job_status(job_id, current_step='script', 
+                             message=f'Script generated with {len(video_data)} scenes')
+            check_cancelled(job_id)
+            
+            # Step 3: Generate TTS Audio (if enabled)
+            audio_fragments = {}
+            audio_durations = {}
+            for index, entry in manifest.scene_entries('audio').items():
+                audio_fragments[index] = entry['path']
+                if entry.get('duration'):
+                    audio_durations[index] = entry['duration']
+            missing_audio = [index for index in range(1, len(video_data) + 1) if index not in audio_fragments]
+            
+            if enable_tts and not missing_audio:
+                update_job_status(job_id, current_step='tts', 
+                                 message='Reusing audio from previous run')
+            elif enable_tts:
+                tracker.start_phase('tts')
+                update_job_status(job_id, current_step='tts', 
+                                 message='Generating audio with TTS...')
                 
-                update_job_status(job_id, progress=40, current_step='tts', 
-                                 message='Audio generated successfully')
+                openai_api_key = os.getenv('OPENAI_API_KEY')
+                if openai_api_key:
+                    tts_client = get_client('openai')
+                    tts_model = os.getenv("TTS_MODEL", "tts-1")
+                    voice = os.getenv("VOICE", "alloy")
+                    
+                    tts_cache_stats = {'hits': 0, 'misses': 0}
+                    new_fragments, new_durations = generate_audio_fragments(
+                        client=tts_client,
+                        video_data=video_data,
+                        tts_model=tts_model,
+                        voice=voice,
+                        output_dir=workspace['audio'],
+                        cache_stats=tts_cache_stats,
+                        indices=missing_audio
+                    )
+                    for index, fragment_path in new_fragments.items():
+                        manifest.set('audio', {'path': fragment_path, 'duration': new_durations.get(index)}, index)
+                    audio_fragments.update(new_fragments)
+                    audio_durations.update(new_durations)
+                    
+                    update_job_status(job_id, current_step='tts', 
+                                     message='Audio generated successfully',
+                                     tts_cache=tts_cache_stats)
+                else:
+                    update_job_status(job_id, current_step='tts', 
+                                     message='Skipping TTS (no OpenAI key)')
             else:
-                update_job_status(job_id, progress=40, current_step='tts', 
-                                 message='Skipping TTS (no OpenAI key)')
-        else:
-            update_job_status(job_id, progress=40, current_step='code', 
-                             message='Skipping TTS (disabled)')
-        
-        # Step 4: Generate Manim Code and Compile Videos
-        update_job_status(job_id, progress=45, current_step='code', 
-                         message='Generating Manim code...')
-        
-        topic_slug = sanitize_filename(topic.lower().replace(" ", "_"))
-        generated_videos = []
-        previous_context = None
+                update_job_status(job_id, current_step='code', 
+                                 message='Skipping TTS (disabled)')
+            
+        check_cancelled(job_id)
         
-        for index, scene_data in enumerate(video_data, 1):
-            scene_progress = 45 + (index / len(video_data)) * 30  # 45% to 75%
+        final_stage = 'final' if pass_profile == 'preview' else f'final_{pass_profile}'
+        final_output_path = os.path.join(workspace['output'], f"output_{pass_profile}.mp4")
+        if manifest.get(final_stage):
+            tracker.start_phase('finalize')
+            update_job_status(job_id, current_step='video', 
+                             message='Reusing finalized video from previous run')
+        else:
+            # Step 4: Generate Manim Code and Compile Videos
+            # (the final pass only re-renders scenes that made it into the preview)
+            scene_indices = None
+            if not streaming:
+                # A streamed script moves to the scenes phase when the stream ends
+                tracker.start_phase('scenes')
+            if render_pass == 'final':
+                scene_indices = sorted(manifest.scene_entries('render')) or None
+                tracker.set_scene_count(len(scene_indices or manifest.scene_entries('code')))
+                update_job_status(job_id, current_step='code', 
+                                 message=f'Rendering final video at {pass_profile} quality...')
+            else:
+                update_job_status(job_id, current_step='code', 
+                                 message='Generating Manim code...')
             
-            update_job_status(job_id, progress=scene_progress, current_step='code', 
-                             message=f'Processing scene {index}/{len(video_data)}...')
+            topic_slug = sanitize_filename(topic.lower().replace(" ", "_"))
+            generated_videos = run_scene_pipeline(
+                job_id, video_data, client, provider, model,
+                audio_durations, topic_slug, workspace, manifest,
+                profile=pass_profile, indices=scene_indices, scene_feed=scene_feed
+            )
             
-            text = scene_data.get('text', '')
-            animation = scene_data.get('animation', '')
-            audio_duration = audio_durations.get(index, None)
+            if stream_thread:
+                stream_thread.join()
+                if stream_state.get('error'):
+                    raise stream_state['error']
             
-            manim_code = generate_manim_code(
-                client, text, animation, index, 
-                previous_context, provider, model, 
-                audio_duration=audio_duration
-            )
+            if not generated_videos:
+                raise Exception("No videos were generated")
             
-            if not manim_code:
-                continue
+            check_cancelled(job_id)
             
-            code_content = manim_code.get('content', '')
-            class_name = manim_code.get('class_name', f'Scene{index}')
+            # Step 5: Concatenate scenes and mux audio in a single ffmpeg pass
+            tracker.start_phase('finalize')
+            update_job_status(job_id, current_step='video', 
+                             message='Finalizing video...')
             
-            filename = f"{topic_slug}-{job_id}-{index}.py"
-            filepath = os.path.join(content_dir, filename)
+            rendered_indices = sorted(generated_videos)
+            video_paths = [generated_videos[index] for index in rendered_indices]
+            # Narration per rendered scene, so each scene's audio starts with its video
+            audio_paths = [audio_fragments.get(index) for index in rendered_indices] if audio_fragments else []
+            scene_audio_durations = [audio_durations.get(index) for index in rendered_indices]
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(code_content)
+            success = finalize_video(video_paths, audio_paths, final_output_path,
+                                     audio_durations=scene_audio_durations)
             
-            # Compile video
-            video_path = compile_video(filepath, class_name, topic_slug, index)
+            if not success and audio_paths:
+                # If muxing fails, fall back to the silent video
+                success = finalize_video(video_paths, [], final_output_path)
             
-            if video_path and os.path.exists(video_path):
-                generated_videos.append(video_path)
-                previous_context = {
-                    'text': text,
-                    'animation': animation,
-                    'code': code_content
-                }
-        
-        if not generated_videos:
-            raise Exception("No videos were generated")
-        
-        # Step 5: Concatenate Videos
-        update_job_status(job_id, progress=80, current_step='video', 
-                         message='Concatenating video scenes...')
-        
-        silent_video_path = f"media/output_silent_{job_id}.mp4"
-        success = concatenate_videos(generated_videos, silent_video_path)
+            if not success:
+                raise Exception("Failed to concatenate videos")
+            
+            manifest.set(final_stage, {'path': final_output_path})
         
-        if not success:
-            raise Exception("Failed to concatenate videos")
+        tracker.finish()
         
-        # Step 6: Merge Audio (if available)
-        final_output_path = f"media/output_{job_id}.mp4"
+        if render_pass == 'preview' and render_profile != 'preview':
+            # Two-tier: hand out the preview now, render the final quality later
+            published_path = publish_file(final_output_path, f"media/output_{job_id}_preview.mp4",
+                                          content_addressed=True)
+            preview_url = f"/media/{os.path.basename(published_path)}"
+            completed = queue_final_render(job_id, preview_url)
+            return
         
-        if audio_path and os.path.exists(audio_path):
-            update_job_status(job_id, progress=90, current_step='video', 
-                             message='Merging audio with video...')
-            
-            merge_success = merge_video_and_audio(
-                video_path=silent_video_path,
-                audio_path=audio_path,
-                output_path=final_output_path
-            )
-            
-            if not merge_success:
-                # If merge fails, use silent video
-                final_output_path = silent_video_path
-        else:
-            # No audio, use silent video
-            os.rename(silent_video_path, final_output_path)
+        # Publish atomically so the video is only visible once complete
+        published_path = publish_file(final_output_path, f"media/output_{job_id}.mp4",
+                                      content_addressed=True)
         
         # Complete!
-        video_url = f"/media/{os.path.basename(final_output_path)}"
+        video_url = f"/media/{os.path.basename(published_path)}"
         update_job_status(job_id, status='completed', progress=100, current_step='video', 
                          message='Video generation completed!', video_url=video_url)
+        completed = True
         
-        # Cleanup
-        if os.path.exists(json_file):
-            os.remove(json_file)
+    except JobInterruptedError:
+        # Not cancelled: the queue hands the job to another worker
+        raise
+    
+    except JobCancelledError:
+        update_job_status(job_id, status='cancelled', message='Job cancelled')
         
     except Exception as e:
         update_job_status(job_id, status='failed', error=str(e), 
                          message=f'Error: {str(e)}')
+    
+    finally:
+        # The final pass may already be running with its own tracker
+        stop_tracking(job_id, tracker)
+        # Cleanup; failed and cancelled jobs keep their workspace so they can be resumed
+        if workspace and completed and not KEEP_WORKSPACES:
+            cleanup_job_workspace(workspace)
+
+
+def run_job(job_id, **job_kwargs):
+    """
+    Job queue entry point: runs one pass of generate_video_workflow with metrics
+
+    Every stage span the pass records (script, TTS, code generation,
+    renders, ffmpeg) is appended to the job record's spans field.
+    """
+    with job_context(job_id) as spans_key:
+        try:
+            with span('job', render_pass=job_kwargs.get('render_pass', 'preview')):
+                generate_video_workflow(job_id, **job_kwargs)
+        finally:
+            spans = job_spans.pop(spans_key)
+            job = job_store.get(job_id)
+            if job and spans:
+                update_job_status(job_id, spans=((job.get('spans') or []) + spans)[-job_spans.max_spans:])
+
+
+def queue_final_render(job_id, preview_url):
+    """
+    Queues the final-quality pass of a two-tier job at low priority
+    
+    Returns:
+        True if the job is finished instead (queue full: the preview becomes the result)
+    """
+    job = job_store.get(job_id)
+    update_job_status(job_id, status='queued', progress=0, current_step='video', 
+                     message=f"Preview ready, {job.get('render_profile')} render queued",
+                     preview_url=preview_url, render_pass='final')
+    try:
+        get_job_queue().submit(
+            job_id,
+            {
+                'topic': job.get('topic'),
+                'enable_tts': job.get('enable_tts', True),
+                'llm_provider': job.get('llm_provider', 'auto'),
+                'render_profile': job.get('render_profile'),
+                'render_pass': 'final'
+            },
+            priority='low'
+        )
+        return False
+    except QueueFullError:
+        update_job_status(job_id, status='completed', progress=100, current_step='video', 
+                         message='Preview completed (final render skipped, queue full)',
+                         video_url=preview_url)
+        return True
+
+
+def interrupt_jobs():
+    """
+    Stops the jobs running in this process (worker shutdown)
+    
+    Their next cancellation check raises JobInterruptedError, and the
+    renders and encodes they are waiting on are killed so that happens now.
+    """
+    _interrupted.set()
+    scheduler.terminate()
+    terminate_render_worker_pool()
+
+
+def restore_jobs(entries):
+    """Marks re-queued jobs as queued; their workspace manifest lets them resume where they stopped"""
+    for entry in entries:
+        update_job_status(entry['job_id'], status='queued', progress=0, 
+                         current_step='script', message='Job restored after restart')
+
+
+def notify_queue_change(job_ids):
+    """Wakes the progress streams of queued jobs so they report their new position"""
+    for job_id in job_ids:
+        job_events.notify(job_id)
+
+
+def get_job_queue(run_workers=False):
+    """
+    Returns the process-wide job queue, starting it on first use
+    
+    In local mode the queue runs MAX_CONCURRENT_JOBS worker threads in this
+    process. In external mode the queue is shared through the job store and
+    only processes started with run_workers=True (worker.py) run jobs.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            if JOB_QUEUE_MODE == 'external':
+                _job_queue = SharedJobQueue(
+                    job_store,
+                    worker_fn=run_job,
+                    num_workers=MAX_CONCURRENT_JOBS if run_workers else 0,
+                    max_size=MAX_QUEUED_JOBS,
+                    poll_interval=JOB_QUEUE_POLL_INTERVAL,
+                    claim_timeout=JOB_CLAIM_TIMEOUT,
+                    on_restore=restore_jobs,
+                    on_stop=interrupt_jobs,
+                    on_change=notify_queue_change
+                )
+            elif JOB_QUEUE_MODE == 'local':
+                _job_queue = JobQueue(
+                    worker_fn=run_job,
+                    num_workers=MAX_CONCURRENT_JOBS,
+                    max_size=MAX_QUEUED_JOBS,
+                    state_file=JOB_QUEUE_FILE,
+                    on_change=notify_queue_change
+                )
+            else:
+                raise ValueError(f"Unknown job queue mode: {JOB_QUEUE_MODE}")
+            
+            # Jobs that were running when their process stopped are re-queued
+            restored = _job_queue.start()
+            restore_jobs(restored)
+            
+            # Workspaces of failed/cancelled jobs stay resumable until the job expires
+            if _job_queue.num_workers:
+                keep = {entry['job_id'] for entry in restored}
+                if JOB_QUEUE_MODE == 'external':
+                    keep |= _job_queue.job_ids()
+                prune_workspaces(job_store.ttl_seconds, keep=keep)
+        return _job_queue
 
 
-def start_video_generation(topic, enable_tts=True, llm_provider='auto'):
-    """Start video generation in background thread"""
+def start_video_generation(topic, enable_tts=True, llm_provider='auto', priority='normal', render_profile=None):
+    """
+    Queue a video generation job
+    
+    Returns:
+        Tuple of (job_id, queue_position)
     
+    Raises:
+        QueueFullError: If the queue has no room for another job
+        ValueError: If the priority or render profile is unknown
+    """
+    
+    render_profile = parse_render_profile(render_profile)
     job_id = str(uuid.uuid4())
+    try:
+        # Stats are recorded per actual provider, so queued estimates need it too
+        resolved_provider = resolve_llm_provider(llm_provider)
+    except ValueError:
+        resolved_provider = None  # the job fails with this error once it runs
     
     # Initialize job
-    jobs[job_id] = {
+    job_store.create({
         'job_id': job_id,
         'topic': topic,
+        'enable_tts': enable_tts,
+        'llm_provider': llm_provider,
+        'resolved_provider': resolved_provider,
         'status': 'queued',
+        'priority': priority,
+        'render_profile': render_profile,
+        'render_pass': 'preview',
         'progress': 0,
         'current_step': 'script',
         'message': 'Job queued',
         'created_at': datetime.now().isoformat(),
         'updated_at': datetime.now().isoformat()
-    }
+    })
     
-    # Start background thread
-    thread = threading.Thread(
-        target=generate_video_workflow,
-        args=(job_id, topic, enable_tts, llm_provider),
-        daemon=True
-    )
-    thread.start()
+    try:
+        position = get_job_queue().submit(
+            job_id,
+            {
+                'topic': topic,
+                'enable_tts': enable_tts,
+                'llm_provider': llm_provider,
+                'render_profile': render_profile,
+                'render_pass': 'preview'
+            },
+            priority=priority
+        )
+    except (QueueFullError, ValueError):
+        job_store.delete(job_id)
+        raise
     
-    return job_id
+    return job_id, position
+
+
+def cancel_job(job_id):
+    """
+    Cancel a queued or running job
+    
+    Queued jobs are removed immediately; running jobs stop at the next
+    stage boundary.
+    
+    Returns:
+        True if the job was found and cancellation was recorded
+    """
+    job = job_store.get(job_id)
+    if not job or job.get('status') in FINISHED_STATUSES:
+        return False
+    
+    if get_job_queue().cancel(job_id):
+        update_job_status(job_id, status='cancelled', message='Job cancelled before it started')
+    else:
+        update_job_status(job_id, message='Cancellation requested...', cancel_requested=True)
+    return True
+
+
+def resume_job(job_id, priority=None):
+    """
+    Re-queue a failed or cancelled job
+    
+    The job keeps its workspace, so the workflow skips every stage whose
+    checkpoint is still recorded in the manifest.
+    
+    Returns:
+        Queue position, or None if the job does not exist or cannot be resumed
+    
+    Raises:
+        QueueFullError: If the queue has no room for another job
+    """
+    job = job_store.get(job_id)
+    if not job or job.get('status') not in ('failed', 'cancelled'):
+        return None
+    
+    job_store.update(job_id, {'error': None, 'cancel_requested': False})
+    update_job_status(job_id, status='queued', progress=0, current_step='script', 
+                     message='Job queued for resume')
+    
+    try:
+        return get_job_queue().submit(
+            job_id,
+            {
+                'topic': job.get('topic'),
+                'enable_tts': job.get('enable_tts', True),
+                'llm_provider': job.get('llm_provider', 'auto'),
+                'render_profile': job.get('render_profile', 'preview'),
+                'render_pass': job.get('render_pass', 'preview')
+            },
+            priority=priority or job.get('priority', 'normal')
+        )
+    except QueueFullError:
+        update_job_status(job_id, status=job.get('status'), message=job.get('message'))
+        raise
+
+
+def check_cancelled(job_id):
+    """Raises JobCancelledError if cancellation was requested for the job"""
+    if _interrupted.is_set():
+        raise JobInterruptedError(f"Job {job_id} was interrupted by a worker shutdown")
+    job = job_store.get(job_id)
+    if job and job.get('cancel_requested'):
+        raise JobCancelledError(f"Job {job_id} was cancelled")
+
+
+def watch_job(job_id):
+    """
+    Context manager that makes job_events report every change of a job
+
+    In local mode every change already happens in this process; in
+    external mode the store_watcher polls changes made by the workers.
+    """
+    if JOB_QUEUE_MODE == 'external':
+        return store_watcher.watching(job_id)
+    return nullcontext()
 
 
 def get_job_status(job_id):
     """Get current status of a job"""
-    return jobs.get(job_id)
+    job = job_store.get(job_id)
+    if not job:
+        return None
+    
+    if job.get('status') == 'queued':
+        render_pass = job.get('render_pass', 'preview')
+        job['queue_position'] = get_job_queue().position(job_id)
+        job['estimated_seconds'] = estimate_job_seconds(
+            job.get('resolved_provider') or job.get('llm_provider', 'auto'),
+            job.get('render_profile', 'preview') if render_pass == 'final' else 'preview',
+            render_pass,
+            **pass_tracking_options(job.get('enable_tts', True), render_pass)
+        )
+    elif job.get('status') == 'running':
+        tracker = get_tracker(job_id)
+        if tracker:
+            # Running here: estimate as of now, not as of the last update
+            job.update(tracker.status())
+        elif job.get('eta_at'):
+            # Running in another process: count down from the stored ETA
+            job['eta_seconds'] = max(0, round(job['eta_at'] - time.time()))
+    return job
+
+
+def list_jobs(status=None, limit=100, offset=0):
+    """List jobs, newest first, optionally filtered by status"""
+    return {
+        'jobs': job_store.list_jobs(status=status, limit=limit, offset=offset),
+        'total': job_store.count_jobs(status=status),
+        'queue': get_job_queue().stats()
+    }
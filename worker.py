@@ -0,0 +1,79 @@
+"""
+Job worker: runs jobs from the queue shared through the job store
+
+    python worker.py
+
+Start as many workers as the machine (or cluster) can render; each runs up
+to MAX_CONCURRENT_JOBS jobs at a time. Several workers on one machine must
+set RESOURCE_HOST_WORKERS so each only takes its share of the CPUs and
+memory. On SIGTERM the running jobs are interrupted (their renders killed)
+and go back to the queue, to resume from their checkpoints on another worker.
+"""
+import os
+import signal
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+# A worker only makes sense against the shared queue
+os.environ['JOB_QUEUE_MODE'] = 'external'
+
+from video_generator import get_job_queue, MAX_CONCURRENT_JOBS
+from metrics import render_metrics
+
+# Port serving this worker's /metrics (0 = off); stage and scheduler metrics
+# only exist in the worker processes, so scrape every worker on this port
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '9100'))
+# Seconds interrupted jobs get to stop on shutdown before the process exits
+WORKER_STOP_TIMEOUT = float(os.getenv('WORKER_STOP_TIMEOUT', '20'))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the worker's Prometheus metrics (stage spans, tokens, scheduler load)"""
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    job_queue = get_job_queue(run_workers=True)
+    print("=" * 80)
+    print(f"Topic2Manim Worker {job_queue.worker_id}")
+    print("=" * 80)
+    print(f"Running up to {MAX_CONCURRENT_JOBS} job(s) at a time")
+
+    if WORKER_METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(('0.0.0.0', WORKER_METRICS_PORT), MetricsHandler)
+        except OSError as e:
+            # Another worker on this host already has the port
+            print(f"[WARNING] Metrics server not started on port {WORKER_METRICS_PORT}: {e}")
+        else:
+            threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+            print(f"Metrics at: http://localhost:{WORKER_METRICS_PORT}/metrics")
+
+    while not stopping.wait(1):
+        pass
+
+    restored = job_queue.stop(timeout=WORKER_STOP_TIMEOUT)
+    print(f"[OK] Worker stopped, {len(restored)} running job(s) returned to the queue")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+
+
+# Root directory under which every job gets its own workspace
+WORKSPACE_ROOT = os.getenv('WORKSPACE_ROOT', 'media/jobs')
+
+
+def create_job_workspace(job_id, root=None):
+    """
+    Creates an isolated directory tree for a job
+
+    Every intermediate file of a job (script, scene sources, manim renders,
+    audio fragments, ffmpeg concat lists) is written inside this tree, so
+    concurrent jobs never share a path.
+
+    Args:
+        job_id: Job identifier, used as the workspace directory name
+        root: Parent directory (defaults to WORKSPACE_ROOT)
+
+    Returns:
+        Dict with the absolute paths of the workspace directories
+    """
+    root_dir = os.path.abspath(os.path.join(root or WORKSPACE_ROOT, job_id))
+    workspace = {
+        'root': root_dir,
+        'scripts': os.path.join(root_dir, 'scripts'),
+        'scenes': os.path.join(root_dir, 'scenes'),
+        'renders': os.path.join(root_dir, 'renders'),
+        'audio': os.path.join(root_dir, 'audio'),
+        'output': os.path.join(root_dir, 'output')
+    }
+    for path in workspace.values():
+        os.makedirs(path, exist_ok=True)
+    return workspace
+
+
+def file_digest(path, length=16):
+    """Returns the first `length` hex digits of a file's SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:length]
+
+
+def publish_file(source_path, destination_path, content_addressed=False):
+    """
+    Atomically moves a finished file into its public location
+
+    The file is first moved next to the destination under a temporary name
+    (a plain rename when both are on the same filesystem) and then renamed
+    into place, so readers never see a partially written video.
+
+    Args:
+        source_path: Finished file
+        destination_path: Public path
+        content_addressed: Insert the file's content hash before the
+            extension (output_<id>.<hash>.mp4) so new bytes always get a new
+            URL, and remove earlier versions published under the same name
+
+    Returns:
+        The destination path
+    """
+    destination_dir = os.path.dirname(destination_path)
+    if destination_dir:
+        os.makedirs(destination_dir, exist_ok=True)
+
+    if content_addressed:
+        stem, extension = os.path.splitext(destination_path)
+        destination_path = f"{stem}.{file_digest(source_path)}{extension}"
+
+    tmp_path = f"{destination_path}.part"
+    shutil.move(source_path, tmp_path)
+    os.replace(tmp_path, destination_path)
+
+    if content_addressed:
+        previous = re.compile(re.escape(os.path.basename(stem)) + r'\.[0-9a-f]{16}' + re.escape(extension) + '$')
+        for name in os.listdir(destination_dir or '.'):
+            path = os.path.join(destination_dir, name)
+            if previous.match(name) and path != destination_path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    return destination_path
+
+
+def cleanup_job_workspace(workspace):
+    """Deletes a job workspace and everything in it"""
+    if not workspace:
+        return
+    root_dir = workspace['root'] if isinstance(workspace, dict) else workspace
+    shutil.rmtree(root_dir, ignore_errors=True)
+
+
+def prune_workspaces(max_age_seconds, keep=(), root=None):
+    """
+    Deletes workspaces left behind by failed or cancelled jobs
+
+    Args:
+        max_age_seconds: Workspaces untouched for longer than this are removed
+        keep: Job ids whose workspace must be kept (queued or running jobs)
+        root: Parent directory (defaults to WORKSPACE_ROOT)
+
+    Returns:
+        Number of workspaces removed
+    """
+    root_dir = root or WORKSPACE_ROOT
+    if not os.path.isdir(root_dir):
+        return 0
+
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for job_id in os.listdir(root_dir):
+        path = os.path.join(root_dir, job_id)
+        if job_id in keep or not os.path.isdir(path):
+            continue
+        if os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,20 @@
+"""
+WSGI entry point for production
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The API only queues jobs in the job store (JOB_QUEUE_MODE=external unless
+set otherwise); run them with one or more worker.py processes.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+# Each gunicorn process would otherwise run its own job workers and queue file
+os.environ.setdefault('JOB_QUEUE_MODE', 'external')
+
+from main import app
+from video_generator import get_job_queue
+
+# Requeue jobs of workers that stopped while this API was down
+get_job_queue()